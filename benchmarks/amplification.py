@@ -0,0 +1,153 @@
+# benchmarks/amplification.py
+# Write-amplification / I/O-efficiency report for a workload.
+#
+#   python -m benchmarks.amplification [--profiles tinywrite,randomrw,...] [--out FILE]
+#   python -m benchmarks.amplification --trace session.jsonl
+#   python -m benchmarks.amplification --baseline old.json --fail-on-regression
+#
+# Runs the workload with the metrics registry reset, then sets the file bytes the API accepted
+# (logical) against the blocks the disk layer wrote, split by who wrote them:
+#   data       file content blocks (fileio / file_api / compression scopes)
+#   inode      inode table slots and indirect blocks
+#   bitmap     whole-bitmap saves
+#   directory  the directory block and its pointer block
+#   journal    journal descriptors and headers, and checkpoint write-back of logged blocks
+#              (the logged block images themselves count for the layer that changed them)
+#   other      refcount table, dedup index, superblock, unattributed writes
+# Physical volume is counted in whole blocks, since a partial-block write costs a block of
+# device wear all the same. Reads get the same treatment (read amplification).
+
+import argparse
+import sys
+from typing import Dict, List
+from .harness import environment, write_report
+from .workload import (PROFILES, add_image_options, add_profile_options, check_profiles,
+                       replay_trace, run_profiles)
+
+CATEGORIES = ("data", "inode", "bitmap", "directory", "journal", "other")
+DEFAULT_PROFILES = ["tinywrite", "randomrw", "mailspool", "streaming"]
+
+def category(layer: str, op: str) -> str:
+    if layer in ("fileio", "file_api", "compression"):
+        return "data"
+    if layer in ("inode", "bitmap", "directory", "journal"):
+        return layer
+    return "other"
+
+def _split(rows: List[Dict], direction: str) -> Dict[str, int]:
+    """
+    Blocks moved in 'direction' ('read' / 'written') per category. Disk-layer rows hold the
+    totals; whatever no timed scope claimed is counted as 'other'.
+    """
+    blocks = {c: 0 for c in CATEGORIES}
+    disk_total = 0
+    for r in rows:
+        if r["layer"] == "disk":
+            disk_total += r[f"blocks_{direction}"]
+        else:
+            blocks[category(r["layer"], r["op"])] += r[f"blocks_{direction}"]
+    blocks["other"] += max(0, disk_total - sum(blocks.values()))
+    return blocks
+
+def _side(rows: List[Dict], direction: str, block_size: int) -> Dict:
+    logical = sum(r[f"logical_bytes_{direction}"] for r in rows)
+    blocks = _split(rows, direction)
+    physical = sum(blocks.values()) * block_size
+    return {
+        f"logical_bytes_{direction}": logical,
+        f"physical_blocks_{direction}": sum(blocks.values()),
+        f"physical_bytes_{direction}": physical,
+        "amplification": physical / logical if logical else None,
+        "breakdown": {
+            c: {
+                "blocks": n,
+                "share": n / sum(blocks.values()) if sum(blocks.values()) else 0.0,
+                "bytes_per_logical_byte": n * block_size / logical if logical else None,
+            }
+            for c, n in blocks.items()
+        },
+    }
+
+def amplification(rows: List[Dict], block_size: int) -> Dict:
+    """
+    Write and read amplification of a metrics snapshot (metrics.snapshot() rows).
+    """
+    return {"write": _side(rows, "written", block_size), "read": _side(rows, "read", block_size)}
+
+def _ratio(value) -> str:
+    return "n/a" if value is None else f"{value:.2f}"
+
+def _print_table(name: str, report: Dict, out) -> None:
+    w = report["write"]
+    print(f"{name}: {w['logical_bytes_written']} logical bytes -> {w['physical_blocks_written']} block writes "
+          f"(WA {_ratio(w['amplification'])}x, RA {_ratio(report['read']['amplification'])}x)", file=out)
+    for c in CATEGORIES:
+        b = w["breakdown"][c]
+        print(f"  {c:10}{b['blocks']:>10} blocks {b['share'] * 100:6.1f}%  {_ratio(b['bytes_per_logical_byte']):>10} B/B",
+              file=out)
+
+def compare(current: List[Dict], baseline: Dict, threshold: float) -> List[Dict]:
+    """
+    Match workloads by name; a workload regresses when its write amplification grew by more
+    than 'threshold' (0.1 = 10%).
+    """
+    base = {r["workload"]: r for r in baseline.get("results", [])}
+    rows = []
+    for r in current:
+        b = base.get(r["workload"])
+        if b is None:
+            continue
+        now, before = r["write"]["amplification"], b["write"]["amplification"]
+        rows.append({
+            "workload": r["workload"],
+            "write_amplification": now,
+            "baseline_write_amplification": before,
+            "regressed": bool(before) and now is not None and now > before * (1.0 + threshold),
+        })
+    return rows
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.amplification", description="Write-amplification report")
+    add_image_options(parser)
+    add_profile_options(parser, default=DEFAULT_PROFILES)
+    parser.set_defaults(ops=2000)
+    parser.add_argument("--trace", help="measure a recorded trace instead of the synthetic profiles")
+    parser.add_argument("--disk", help="with --trace: replay on a copy of this image")
+    parser.add_argument("--out", help="JSON report path (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="growth in write amplification counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        runs = [(args.trace, replay_trace(args))]
+    else:
+        check_profiles(parser, args.profiles)
+        runs = [(r["profile"], r) for r in run_profiles(args)]
+
+    results = []
+    for name, run in runs:
+        report = {"workload": name, **amplification(run["metrics"], args.block_size)}
+        _print_table(name, report, sys.stderr)
+        results.append(report)
+    out = {
+        "environment": environment(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "workdir")},
+        "results": results,
+    }
+
+    regressed = []
+    if args.baseline:
+        import json
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            out["comparison"] = compare(results, json.load(f), args.threshold)
+        regressed = [row for row in out["comparison"] if row["regressed"]]
+        for row in regressed:
+            print(f"[AMPLIFICATION] REGRESSION {row['workload']}: WA {row['write_amplification']:.2f}x "
+                  f"vs {row['baseline_write_amplification']:.2f}x", file=sys.stderr)
+
+    write_report(out, args.out)
+    return 1 if regressed and args.fail_on_regression else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+# benchmarks/harness.py
+# Timing, percentile and JSON helpers shared by the benchmark runners.
+
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Iterator, List, Optional
+
+@dataclass
+class Case:
+    disk_mb: int
+    block_size: int
+    fill: float
+
+    @property
+    def total_blocks(self) -> int:
+        return self.disk_mb * 1024 * 1024 // self.block_size
+
+    def label(self) -> str:
+        return f"{self.disk_mb}MB/{self.block_size}B/fill={self.fill:.2f}"
+
+def percentile(sorted_ns: List[int], pct: float) -> float:
+    """
+    Nearest-rank percentile of an ascending list of nanosecond samples, in microseconds.
+    """
+    if not sorted_ns:
+        return 0.0
+    rank = max(0, min(len(sorted_ns) - 1, int(round(pct / 100.0 * len(sorted_ns))) - 1))
+    return sorted_ns[rank] / 1000.0
+
+def latency_stats(samples_ns: List[int]) -> Dict:
+    """
+    Count, throughput and latency percentiles (microseconds) of per-call nanosecond samples.
+    """
+    samples = sorted(samples_ns)
+    total_s = sum(samples) / 1e9
+    return {
+        "n": len(samples),
+        "ops_per_s": len(samples) / total_s if total_s > 0 else 0.0,
+        "mean_us": (sum(samples) / len(samples) / 1000.0) if samples else 0.0,
+        "p50_us": percentile(samples, 50),
+        "p90_us": percentile(samples, 90),
+        "p99_us": percentile(samples, 99),
+        "p999_us": percentile(samples, 99.9),
+        "max_us": samples[-1] / 1000.0 if samples else 0.0,
+    }
+
+def summarize(op: str, case: Case, samples_ns: List[int]) -> Dict:
+    return {"op": op, "case": asdict(case), **latency_stats(samples_ns)}
+
+def measure(op: Callable[[int], None], iterations: int, max_seconds: float, min_iterations: int = 5) -> List[int]:
+    """
+    Time op(i) for i = 0, 1, ... until 'iterations' samples or the time budget is used up
+    (at least 'min_iterations' samples are always taken). Returns per-call nanoseconds.
+    """
+    samples: List[int] = []
+    deadline = time.perf_counter() + max_seconds
+    clock = time.perf_counter_ns
+    for i in range(iterations):
+        started = clock()
+        op(i)
+        samples.append(clock() - started)
+        if i + 1 >= min_iterations and time.perf_counter() > deadline:
+            break
+    return samples
+
+@contextlib.contextmanager
+def quiet() -> Iterator[None]:
+    """
+    Swallow the engine's [INFO]/[INIT] prints so they do not mix with benchmark output.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+@contextlib.contextmanager
+def scratch_dir(keep: Optional[str] = None) -> Iterator[str]:
+    if keep:
+        os.makedirs(keep, exist_ok=True)
+        yield keep
+        return
+    with tempfile.TemporaryDirectory(prefix="fs-bench-") as tmp:
+        yield tmp
+
+def mount_fresh(path: str, total_blocks: int, block_size: int, inode_count: int) -> None:
+    """
+    Format a new image at 'path' and mount it with the reserved regions marked in the bitmap.
+    """
+    from src.persistence.disk_initializer import initialize_disk
+    from src.persistence.mount import mount
+    from src.block_bitmap import mark_reserved_regions
+    with quiet():
+        initialize_disk(path, total_blocks=total_blocks, block_size_bytes=block_size, inode_count=inode_count)
+        mount(path)
+        mark_reserved_regions()
+
+def environment() -> Dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+def write_report(report: Dict, path: Optional[str]) -> None:
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+def _key(result: Dict) -> tuple:
+    c = result["case"]
+    return result["op"], c["disk_mb"], c["block_size"], c["fill"]
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[Dict]:
+    """
+    Match results by (op, case) and report the throughput ratio current/baseline.
+    An entry regresses when it is slower than the baseline by more than 'threshold' (0.2 = 20%).
+    """
+    base = {_key(r): r for r in baseline.get("results", [])}
+    rows = []
+    for r in current.get("results", []):
+        b = base.get(_key(r))
+        if b is None or not b["ops_per_s"]:
+            continue
+        ratio = r["ops_per_s"] / b["ops_per_s"]
+        rows.append({
+            "op": r["op"],
+            "case": r["case"],
+            "baseline_ops_per_s": b["ops_per_s"],
+            "ops_per_s": r["ops_per_s"],
+            "ratio": ratio,
+            "p99_us": r["p99_us"],
+            "baseline_p99_us": b["p99_us"],
+            "regressed": ratio < 1.0 - threshold,
+        })
+    return rows
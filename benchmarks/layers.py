@@ -0,0 +1,149 @@
+# benchmarks/layers.py
+# Per-API microbenchmarks: bitmap allocator, inode table, directory and whole-file I/O.
+# Each benchmark runs against a freshly formatted image described by a Case. Formatting itself
+# is measured separately (run_format), over image sizes too large to fill and benchmark.
+
+import itertools
+import os
+import random
+from typing import Callable, Dict, List
+from .harness import Case, measure, mount_fresh, quiet, summarize
+
+FILL_CHUNK = 65536
+MAX_FILES = 64
+INODE_COUNT = 1024
+
+def prepare_image(case: Case, workdir: str) -> Dict:
+    """
+    Format and mount an image for 'case', fill 'case.fill' of its data blocks, and create
+    a set of one-block files. Returns {"path", "files"}.
+    """
+    from src.persistence.mount import STATE
+    from src.block_bitmap import allocate_blocks
+    from src.file_api import create_file, write_file
+
+    path = os.path.join(workdir, f"bench-{case.disk_mb}-{case.block_size}.img")
+    mount_fresh(path, case.total_blocks, case.block_size, INODE_COUNT)
+    with quiet():
+        sb = STATE["superblock"]
+        # Leave headroom for the files and the benchmarks' own allocations
+        data_blocks = sb.total_blocks - sb.data_start_block
+        target = min(int(data_blocks * case.fill), data_blocks - 4096)
+        while target > 0:
+            step = min(FILL_CHUNK, target)
+            allocate_blocks(step)
+            target -= step
+
+        files: List[str] = []
+        payload = b"x" * case.block_size
+        for i in range(MAX_FILES):
+            name = f"bench{i:04d}"
+            try:
+                create_file(name)
+            except ValueError:
+                # The single-block directory is full
+                break
+            write_file(name, payload)
+            files.append(name)
+    return {"path": path, "files": files}
+
+def release_image(image: Dict) -> None:
+    from src.persistence.unmount import unmount
+    with quiet():
+        unmount()
+    os.remove(image["path"])
+
+def bench_allocate_block(case: Case, image: Dict, iterations: int, max_seconds: float) -> List[int]:
+    from src.block_bitmap import allocate_block, free_blocks
+    claimed: List[int] = []
+    samples = measure(lambda i: claimed.append(allocate_block()), iterations, max_seconds)
+    free_blocks(claimed)
+    return samples
+
+def bench_free_block(case: Case, image: Dict, iterations: int, max_seconds: float) -> List[int]:
+    from src.block_bitmap import allocate_blocks, free_block, free_blocks
+    blocks = allocate_blocks(iterations)
+    samples = measure(lambda i: free_block(blocks[i]), iterations, max_seconds)
+    free_blocks(blocks[len(samples):])
+    return samples
+
+def bench_get_inode(case: Case, image: Dict, iterations: int, max_seconds: float) -> List[int]:
+    from src.inode_directory.resolver import get_inode, resolve
+    rng = random.Random(1)
+    inodes = [resolve(name) for name in image["files"]]
+    order = [rng.choice(inodes) for _ in range(iterations)]
+    return measure(lambda i: get_inode(order[i]), iterations, max_seconds)
+
+def bench_resolve(case: Case, image: Dict, iterations: int, max_seconds: float) -> List[int]:
+    from src.inode_directory.resolver import resolve
+    rng = random.Random(2)
+    order = [rng.choice(image["files"]) for _ in range(iterations)]
+    return measure(lambda i: resolve(order[i]), iterations, max_seconds)
+
+def bench_write_file(case: Case, image: Dict, iterations: int, max_seconds: float, io_blocks: int = 8) -> List[int]:
+    from src.file_api import write_file
+    payload = os.urandom(case.block_size * io_blocks)
+    name = image["files"][0]
+    return measure(lambda i: write_file(name, payload), iterations, max_seconds)
+
+def bench_read_file(case: Case, image: Dict, iterations: int, max_seconds: float, io_blocks: int = 8) -> List[int]:
+    from src.file_api import read_file, write_file
+    name = image["files"][0]
+    write_file(name, os.urandom(case.block_size * io_blocks))
+    return measure(lambda i: read_file(name), iterations, max_seconds)
+
+# op name -> (benchmark, whether it is file I/O and takes the io_blocks setting)
+BENCHMARKS: Dict[str, tuple] = {
+    "allocate_block": (bench_allocate_block, False),
+    "free_block": (bench_free_block, False),
+    "get_inode": (bench_get_inode, False),
+    "resolve": (bench_resolve, False),
+    "write_file": (bench_write_file, True),
+    "read_file": (bench_read_file, True),
+}
+
+def run_case(case: Case, workdir: str, ops: List[str], iterations: int, io_iterations: int,
+             max_seconds: float, io_blocks: int, progress: Callable[[str], None]) -> List[Dict]:
+    image = prepare_image(case, workdir)
+    results = []
+    try:
+        for op in ops:
+            bench, is_io = BENCHMARKS[op]
+            progress(f"{case.label()} {op}")
+            with quiet():
+                if is_io:
+                    samples = bench(case, image, io_iterations, max_seconds, io_blocks=io_blocks)
+                else:
+                    samples = bench(case, image, iterations, max_seconds)
+            result = summarize(op, case, samples)
+            if is_io:
+                result["io_bytes"] = case.block_size * io_blocks
+            results.append(result)
+    finally:
+        release_image(image)
+    return results
+
+def run_format(sizes_mb: List[int], block_sizes: List[int], workdir: str, iterations: int,
+               max_seconds: float, progress: Callable[[str], None]) -> List[Dict]:
+    """
+    Time initialize_disk for every size x block size. Each row also records the image's
+    apparent size and the bytes the host file system actually allocated for it.
+    """
+    from src.persistence.disk_initializer import initialize_disk
+    results = []
+    for size, bs in itertools.product(sizes_mb, block_sizes):
+        case = Case(size, bs, 0.0)
+        progress(f"{case.label()} format")
+        path = os.path.join(workdir, f"format-{size}-{bs}.img")
+        with quiet():
+            samples = measure(lambda i: initialize_disk(path, total_blocks=case.total_blocks, block_size_bytes=bs,
+                                                        inode_count=INODE_COUNT),
+                              iterations, max_seconds)
+        st = os.stat(path)
+        result = summarize("format", case, samples)
+        result["image_bytes"] = st.st_size
+        # st_blocks is in 512-byte units; not reported on every platform
+        result["allocated_bytes"] = getattr(st, "st_blocks", 0) * 512 or None
+        results.append(result)
+        os.remove(path)
+    return results
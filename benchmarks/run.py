@@ -0,0 +1,94 @@
+# benchmarks/run.py
+# Microbenchmark runner: python -m benchmarks.run [--quick] [--out FILE] [--baseline FILE]
+#
+# Runs every selected API benchmark over the matrix disk sizes x block sizes x fill levels, and
+# the "format" benchmark over --format-sizes x block sizes, and emits one JSON report (ops/sec and latency percentiles per op and case). With --baseline the
+# report is compared against a saved run and regressions beyond --threshold are listed;
+# --fail-on-regression turns them into a non-zero exit status for CI.
+
+import argparse
+import itertools
+import sys
+from typing import List
+from .harness import Case, compare, environment, scratch_dir, write_report
+from .layers import BENCHMARKS, run_case, run_format
+
+DEFAULT_SIZES_MB = [64, 1024]
+DEFAULT_BLOCK_SIZES = [512, 4096]
+DEFAULT_FILLS = [0.0, 0.5, 0.9]
+DEFAULT_FORMAT_SIZES_MB = [64, 1024, 16384, 262144]
+OPS = list(BENCHMARKS) + ["format"]
+
+def _ints(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x]
+
+def _floats(text: str) -> List[float]:
+    return [float(x) for x in text.split(",") if x]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="File system microbenchmarks")
+    parser.add_argument("--sizes", type=_ints, default=DEFAULT_SIZES_MB, help="disk sizes in MB, comma separated")
+    parser.add_argument("--block-sizes", type=_ints, default=DEFAULT_BLOCK_SIZES, help="block sizes in bytes")
+    parser.add_argument("--fills", type=_floats, default=DEFAULT_FILLS, help="fraction of data blocks pre-allocated")
+    parser.add_argument("--ops", default=",".join(OPS), help="benchmarks to run")
+    parser.add_argument("--format-sizes", type=_ints, default=DEFAULT_FORMAT_SIZES_MB,
+                        help="image sizes in MB for the format benchmark")
+    parser.add_argument("--format-iterations", type=int, default=20, help="samples per format case")
+    parser.add_argument("--iterations", type=int, default=2000, help="samples per metadata op")
+    parser.add_argument("--io-iterations", type=int, default=200, help="samples per file I/O op")
+    parser.add_argument("--io-blocks", type=int, default=8, help="blocks per read_file/write_file call")
+    parser.add_argument("--max-seconds", type=float, default=2.0, help="time budget per op and case")
+    parser.add_argument("--quick", action="store_true", help="small matrix for a smoke run (16MB, 4096B, fill 0/0.5)")
+    parser.add_argument("--workdir", help="where to place the images (default: a temp dir)")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="throughput drop counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.sizes, args.block_sizes, args.fills = [16], [4096], [0.0, 0.5]
+        args.iterations, args.io_iterations, args.max_seconds = 500, 50, 0.5
+        args.format_sizes, args.format_iterations = [16, 4096], 5
+    ops = [op for op in args.ops.split(",") if op]
+    unknown = [op for op in ops if op not in OPS]
+    if unknown:
+        parser.error(f"unknown ops: {', '.join(unknown)} (choose from {', '.join(OPS)})")
+
+    def progress(msg: str) -> None:
+        print(f"[BENCH] {msg}", file=sys.stderr, flush=True)
+
+    results = []
+    case_ops = [op for op in ops if op in BENCHMARKS]
+    with scratch_dir(args.workdir) as workdir:
+        if case_ops:
+            for size, bs, fill in itertools.product(args.sizes, args.block_sizes, args.fills):
+                results += run_case(Case(size, bs, fill), workdir, case_ops, args.iterations, args.io_iterations,
+                                    args.max_seconds, args.io_blocks, progress)
+        if "format" in ops:
+            results += run_format(args.format_sizes, args.block_sizes, workdir, args.format_iterations,
+                                  args.max_seconds, progress)
+
+    report = {
+        "environment": environment(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "workdir")},
+        "results": results,
+    }
+
+    regressed = []
+    if args.baseline:
+        import json
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["comparison"] = compare(report, baseline, args.threshold)
+        regressed = [row for row in report["comparison"] if row["regressed"]]
+        for row in regressed:
+            c = row["case"]
+            progress(f"REGRESSION {row['op']} {c['disk_mb']}MB/{c['block_size']}B/fill={c['fill']}: "
+                     f"{row['ops_per_s']:.0f} vs {row['baseline_ops_per_s']:.0f} ops/s ({row['ratio']:.2f}x)")
+
+    write_report(report, args.out)
+    return 1 if regressed and args.fail_on_regression else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
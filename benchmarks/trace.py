@@ -0,0 +1,195 @@
+# benchmarks/trace.py
+# Record the public file_api / fileio calls of a session as a JSON-lines trace, and replay it.
+#
+# Recording swaps the functions exported by src.file_api and src.fileio for timing wrappers, so
+# anything that calls through those packages (the CLI, the workload profiles, user code) is
+# captured. Payload bytes are not stored, only their length; the replayer substitutes
+# pseudo-random data of the same size. Each record:
+#   {"ts": seconds since start, "op": "fileio.write_file", "args": [...], "kwargs": {...},
+#    "us": call latency, "result": fd (open_file only), "error": exception name (if raised)}
+
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional
+from .harness import latency_stats
+
+TRACED = {
+    "file_api": ("create_file", "delete_file", "clone_file", "write_file", "read_file",
+                 "truncate_file", "set_compression", "create_many", "iter_file"),
+    "fileio": ("open_file", "close_file", "read_file", "write_file", "seek_file",
+               "sync_file", "fallocate_file"),
+}
+
+POOL_BYTES = 1 << 20
+
+def _packages() -> Dict[str, Any]:
+    import src.file_api
+    import src.fileio
+    return {"file_api": src.file_api, "fileio": src.fileio}
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"$bytes": len(value)}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+class TraceRecorder:
+    """
+    Context manager that appends every traced call to 'path' while active.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._saved: List[tuple] = []
+        self._out = None
+        self._started = 0.0
+
+    def _wrap(self, label: str, fn):
+        recorder = self
+
+        def traced(*args, **kwargs):
+            ts = time.perf_counter() - recorder._started
+            record = {"ts": round(ts, 6), "op": label, "args": _encode(list(args)), "kwargs": _encode(kwargs)}
+            started = time.perf_counter_ns()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                record["error"] = type(e).__name__
+                raise
+            else:
+                if label == "fileio.open_file":
+                    record["result"] = result
+                return result
+            finally:
+                record["us"] = (time.perf_counter_ns() - started) / 1000.0
+                recorder._write(record)
+
+        def traced_iter(*args, **kwargs):
+            # Streaming reads are recorded once the caller has drained (or dropped) the iterator
+            ts = time.perf_counter() - recorder._started
+            record = {"ts": round(ts, 6), "op": label, "args": _encode(list(args)), "kwargs": _encode(kwargs)}
+            started = time.perf_counter_ns()
+            try:
+                yield from fn(*args, **kwargs)
+            except Exception as e:
+                record["error"] = type(e).__name__
+                raise
+            finally:
+                record["us"] = (time.perf_counter_ns() - started) / 1000.0
+                recorder._write(record)
+
+        wrapper = traced_iter if label == "file_api.iter_file" else traced
+        wrapper.__wrapped__ = fn
+        return wrapper
+
+    def _write(self, record: Dict) -> None:
+        with self._lock:
+            self._out.write(json.dumps(record) + "\n")
+            self.calls += 1
+
+    def __enter__(self) -> "TraceRecorder":
+        self._out = open(self.path, "w", encoding="utf-8")
+        self._started = time.perf_counter()
+        for prefix, package in _packages().items():
+            for name in TRACED[prefix]:
+                fn = getattr(package, name)
+                self._saved.append((package, name, fn))
+                setattr(package, name, self._wrap(f"{prefix}.{name}", fn))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for package, name, fn in reversed(self._saved):
+            setattr(package, name, fn)
+        self._saved.clear()
+        self._out.close()
+
+def load_trace(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+class _Payloads:
+    """
+    Deterministic stand-in data for recorded payload lengths.
+    """
+
+    def __init__(self, seed: int):
+        self._pool = random.Random(seed).randbytes(POOL_BYTES)
+        self._offset = 0
+
+    def take(self, n: int) -> bytes:
+        if n > len(self._pool):
+            return (self._pool * (n // len(self._pool) + 1))[:n]
+        if self._offset + n > len(self._pool):
+            self._offset = 0
+        data = self._pool[self._offset:self._offset + n]
+        self._offset += n
+        return data
+
+    def decode(self, value: Any) -> Any:
+        if isinstance(value, dict) and set(value) == {"$bytes"}:
+            return self.take(value["$bytes"])
+        if isinstance(value, list):
+            return [self.decode(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self.decode(v) for k, v in value.items()}
+        return value
+
+def replay(records, seed: int = 0) -> Dict:
+    """
+    Re-issue the recorded calls back to back (no think time) against the mounted image.
+    Descriptors from the trace are mapped to the ones open_file returns now. A call whose
+    outcome (success or error) differs from the recording counts as 'diverged'.
+    Returns {"ops", "seconds", "ops_per_s", "bytes", "errors", "diverged", "latency": {op: stats}}.
+    """
+    packages = _packages()
+    payloads = _Payloads(seed)
+    fds: Dict[int, int] = {}
+    samples: Dict[str, List[int]] = defaultdict(list)
+    ops = errors = diverged = nbytes = 0
+    clock = time.perf_counter_ns
+    started = time.perf_counter()
+    for record in records:
+        prefix, name = record["op"].split(".", 1)
+        fn = getattr(packages[prefix], name)
+        args = payloads.decode(record.get("args", []))
+        kwargs = payloads.decode(record.get("kwargs", {}))
+        if prefix == "fileio" and name != "open_file" and args and isinstance(args[0], int):
+            args[0] = fds.get(args[0], -1)
+        nbytes += sum(len(a) for a in args if isinstance(a, bytes))
+        failed: Optional[str] = None
+        t0 = clock()
+        try:
+            result = fn(*args, **kwargs)
+            if name == "iter_file":
+                result = b"".join(result)
+        except Exception as e:
+            failed = type(e).__name__
+            result = None
+        samples[record["op"]].append(clock() - t0)
+        ops += 1
+        if failed:
+            errors += 1
+        if failed != record.get("error"):
+            diverged += 1
+        if name == "open_file" and result is not None and "result" in record:
+            fds[record["result"]] = result
+        elif isinstance(result, bytes):
+            nbytes += len(result)
+    seconds = time.perf_counter() - started
+    return {
+        "ops": ops,
+        "seconds": seconds,
+        "ops_per_s": ops / seconds if seconds > 0 else 0.0,
+        "bytes": nbytes,
+        "errors": errors,
+        "diverged": diverged,
+        "latency": {op: latency_stats(s) for op, s in sorted(samples.items())},
+    }
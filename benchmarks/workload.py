@@ -0,0 +1,382 @@
+# benchmarks/workload.py
+# Synthetic workloads that exercise directory, inode table and bitmap together.
+#
+#   python -m benchmarks.workload run [--profiles mailspool,streaming,randomrw,churn] [--out FILE]
+#   python -m benchmarks.workload record --out trace.jsonl [--disk IMG] [-f SCRIPT]
+#   python -m benchmarks.workload replay trace.jsonl [--disk IMG] [--out FILE]
+#
+# Profiles are modelled on filebench's personalities and drive only the public file_api /
+# fileio functions (looked up on the packages at call time, so a TraceRecorder sees them):
+#   mailspool  small files: deliver (create + write + fsync), read, append + fsync, delete
+#   streaming  one large file written and then read sequentially in large chunks
+#   randomrw   block-sized reads and writes at random offsets of a preallocated file
+#   tinywrite  one-byte overwrites at random offsets, each followed by fsync
+#   churn      create/delete of files with random sizes (ages the free space)
+# Each run reports throughput, per-op latency percentiles and the fragmentation left behind.
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from .harness import environment, latency_stats, mount_fresh, quiet, scratch_dir, write_report
+from .trace import TraceRecorder, load_trace, replay
+
+INODE_COUNT = 1024
+POOL_BYTES = 1 << 20
+
+# A profile yields (op label, call, payload bytes) one step at a time; the call runs before
+# the generator resumes, so later steps see the state earlier ones left behind.
+Step = Tuple[str, Callable[[], object], int]
+
+def _api():
+    import src.file_api
+    return src.file_api
+
+def _fio():
+    import src.fileio
+    return src.fileio
+
+class Context:
+    """
+    Per-run state shared by a profile's steps: RNG, payload pool and the live file names.
+    """
+
+    def __init__(self, seed: int, max_files: int):
+        from src.persistence.mount import STATE
+        from src.inode_directory.inode_table import max_file_blocks
+        from src.design.inode_serialisation import DIRECT_POINTERS
+        self.rng = random.Random(seed)
+        self.bs = STATE["superblock"].block_size_bytes
+        # Large-file profiles stay within the direct and single-indirect reach, so a run keeps
+        # the same size whatever the deeper indirect trees would allow
+        self.max_blocks = min(max_file_blocks(), DIRECT_POINTERS + self.bs // 4)
+        self.max_files = min(max_files, _directory_capacity(self.bs))
+        self.files: List[str] = []
+        self._serial = 0
+        self._pool = self.rng.randbytes(POOL_BYTES)
+
+    def payload(self, n: int) -> bytes:
+        n = min(n, len(self._pool))
+        start = self.rng.randrange(0, len(self._pool) - n + 1)
+        return self._pool[start:start + n]
+
+    def new_name(self, prefix: str) -> str:
+        self._serial += 1
+        return f"{prefix}{self._serial:06d}"
+
+def _directory_capacity(block_size: int) -> int:
+    # The root directory is one block of JSON: '"name000001": 1234, ' is about 21 bytes an entry
+    return max(1, (block_size - 2) // 21 - 1)
+
+def _deliver(ctx: Context, size: int) -> Iterator[Step]:
+    api, fio = _api(), _fio()
+    name = ctx.new_name("mail")
+    yield "create", lambda: api.create_file(name), 0
+    ctx.files.append(name)
+    fd = fio.open_file(name, "a")
+    data = ctx.payload(size)
+    yield "append", lambda: fio.write_file(fd, data), len(data)
+    yield "fsync", lambda: fio.sync_file(fd), 0
+    fio.close_file(fd)
+
+def mailspool(ctx: Context) -> Iterator[Step]:
+    api, fio = _api(), _fio()
+    sizes = lambda: ctx.rng.choice((1, 2, 4, 8, 16)) * 1024
+    target = max(2, ctx.max_files * 3 // 4)
+    while len(ctx.files) < target:
+        yield from _deliver(ctx, sizes())
+    while True:
+        victim = ctx.files.pop(ctx.rng.randrange(len(ctx.files)))
+        yield "delete", lambda: api.delete_file(victim), 0
+        yield from _deliver(ctx, sizes())
+        name = ctx.rng.choice(ctx.files)
+        yield "read_whole", lambda: api.read_file(name), 0
+        name = ctx.rng.choice(ctx.files)
+        fd = fio.open_file(name, "a")
+        data = ctx.payload(sizes())
+        yield "append", lambda: fio.write_file(fd, data), len(data)
+        yield "fsync", lambda: fio.sync_file(fd), 0
+        fio.close_file(fd)
+
+def streaming(ctx: Context) -> Iterator[Step]:
+    api, fio = _api(), _fio()
+    chunk = 16 * ctx.bs
+    size = ctx.max_blocks * ctx.bs // chunk * chunk
+    name = ctx.new_name("strm")
+    api.create_file(name)
+    ctx.files.append(name)
+    while True:
+        fd = fio.open_file(name, "w")
+        for _ in range(size // chunk):
+            data = ctx.payload(chunk)
+            yield "seq_write", lambda: fio.write_file(fd, data), chunk
+        fio.close_file(fd)
+        fd = fio.open_file(name, "r")
+        for _ in range(size // chunk):
+            yield "seq_read", lambda: fio.read_file(fd, chunk), chunk
+        fio.close_file(fd)
+
+def randomrw(ctx: Context) -> Iterator[Step]:
+    api, fio = _api(), _fio()
+    io_size = min(ctx.bs, 4096)
+    blocks = ctx.max_blocks // 64 * 64
+    name = ctx.new_name("rand")
+    api.create_file(name)
+    ctx.files.append(name)
+    fd = fio.open_file(name, "rw")
+    for _ in range(0, blocks, 64):
+        fio.write_file(fd, ctx.payload(64 * ctx.bs))
+    fio.seek_file(fd, 0)
+    fio.sync_file(fd)
+    writes = 0
+    while True:
+        offset = ctx.rng.randrange(blocks) * ctx.bs
+        if ctx.rng.random() < 0.5:
+            def pread(offset=offset):
+                fio.seek_file(fd, offset)
+                return fio.read_file(fd, io_size)
+            yield "rand_read", pread, io_size
+        else:
+            data = ctx.payload(io_size)
+            def pwrite(offset=offset, data=data):
+                fio.seek_file(fd, offset)
+                return fio.write_file(fd, data)
+            yield "rand_write", pwrite, io_size
+            writes += 1
+            if writes % 64 == 0:
+                yield "fsync", lambda: fio.sync_file(fd), 0
+
+def tinywrite(ctx: Context) -> Iterator[Step]:
+    fio = _fio()
+    api = _api()
+    blocks = min(ctx.max_blocks, 64)
+    name = ctx.new_name("tiny")
+    api.create_file(name)
+    ctx.files.append(name)
+    fd = fio.open_file(name, "rw")
+    fio.write_file(fd, ctx.payload(blocks * ctx.bs))
+    fio.sync_file(fd)
+    while True:
+        offset = ctx.rng.randrange(blocks * ctx.bs)
+        data = ctx.payload(1)
+        def poke(offset=offset, data=data):
+            fio.seek_file(fd, offset)
+            fio.write_file(fd, data)
+            fio.sync_file(fd)
+        yield "write_1b_sync", poke, 1
+
+def churn(ctx: Context) -> Iterator[Step]:
+    api = _api()
+    target = max(2, ctx.max_files * 3 // 4)
+    largest = min(32, ctx.max_blocks)
+    while True:
+        if len(ctx.files) < target // 2 or (len(ctx.files) < target and ctx.rng.random() < 0.5):
+            name = ctx.new_name("chrn")
+            data = ctx.payload(ctx.rng.randint(1, largest) * ctx.bs - ctx.rng.randrange(ctx.bs))
+            def create(name=name, data=data):
+                api.create_file(name)
+                api.write_file(name, data)
+            yield "create_write", create, len(data)
+            ctx.files.append(name)
+        else:
+            victim = ctx.files.pop(ctx.rng.randrange(len(ctx.files)))
+            yield "delete", lambda: api.delete_file(victim), 0
+
+PROFILES: Dict[str, Callable[[Context], Iterator[Step]]] = {
+    "mailspool": mailspool,
+    "streaming": streaming,
+    "randomrw": randomrw,
+    "tinywrite": tinywrite,
+    "churn": churn,
+}
+
+def fragmentation() -> Dict:
+    """
+    File and free-space fragmentation of the mounted image (see src.file_api.defrag).
+    """
+    from src.file_api import fragmentation as measure
+    report = measure()
+    del report["per_file"]
+    return report
+
+def run_profile(name: str, ctx: Context, max_ops: int, max_seconds: float) -> Dict:
+    """
+    Drive one profile until 'max_ops' timed steps or 'max_seconds' have passed.
+    """
+    from src.common import metrics
+    samples: Dict[str, List[int]] = defaultdict(list)
+    everything: List[int] = []
+    ops = errors = nbytes = 0
+    clock = time.perf_counter_ns
+    steps = PROFILES[name](ctx)
+    started = time.perf_counter()
+    deadline = started + max_seconds
+    with quiet():
+        for label, call, size in steps:
+            if not ops:
+                # Setup the profile did before its first step (preallocation) is not measured
+                metrics.reset()
+            t0 = clock()
+            try:
+                call()
+            except Exception:
+                errors += 1
+            elapsed = clock() - t0
+            samples[label].append(elapsed)
+            everything.append(elapsed)
+            nbytes += size
+            ops += 1
+            if ops >= max_ops or time.perf_counter() > deadline:
+                break
+        steps.close()
+    seconds = time.perf_counter() - started
+    overall = latency_stats(everything)
+    return {
+        "profile": name,
+        "ops": ops,
+        "errors": errors,
+        "seconds": seconds,
+        "ops_per_s": ops / seconds if seconds > 0 else 0.0,
+        "mb_per_s": nbytes / seconds / (1 << 20) if seconds > 0 else 0.0,
+        "p99_us": overall["p99_us"],
+        "p999_us": overall["p999_us"],
+        "latency": {label: latency_stats(s) for label, s in sorted(samples.items())},
+        "fragmentation": fragmentation(),
+        "metrics": metrics.snapshot(),
+    }
+
+def _unmount() -> None:
+    from src.persistence.unmount import unmount
+    with quiet():
+        unmount()
+
+def _mount_copy(disk: str, workdir: str) -> str:
+    # Replays mutate the image, so they run on a copy
+    from src.persistence.mount import mount
+    path = os.path.join(workdir, "replay.img")
+    shutil.copyfile(disk, path)
+    with quiet():
+        mount(path)
+    return path
+
+def _total_blocks(size_mb: int, block_size: int) -> int:
+    return size_mb * 1024 * 1024 // block_size
+
+def run_profiles(args) -> List[Dict]:
+    """
+    Run each of args.profiles on its own freshly formatted image.
+    """
+    results = []
+    with scratch_dir(args.workdir) as workdir:
+        for name in args.profiles:
+            print(f"[WORKLOAD] {name}", file=sys.stderr, flush=True)
+            path = os.path.join(workdir, f"{name}.img")
+            mount_fresh(path, _total_blocks(args.size_mb, args.block_size), args.block_size, INODE_COUNT)
+            try:
+                results.append(run_profile(name, Context(args.seed, args.files), args.ops, args.seconds))
+            finally:
+                _unmount()
+                os.remove(path)
+    return results
+
+def cmd_run(args) -> Dict:
+    return {"environment": environment(), "settings": _settings(args), "results": run_profiles(args)}
+
+def cmd_record(args) -> Dict:
+    from src.cli.cli_main import run_cli, run_script
+    with TraceRecorder(args.out) as recorder:
+        if args.file:
+            with open(args.file, "r", encoding="utf-8") as f:
+                run_script(f, disk_path=args.disk)
+        elif not sys.stdin.isatty():
+            run_script(sys.stdin, disk_path=args.disk)
+        else:
+            run_cli(args.disk)
+    print(f"[WORKLOAD] recorded {recorder.calls} calls to {args.out}", file=sys.stderr)
+    return {}
+
+def replay_trace(args) -> Dict:
+    """
+    Replay args.trace on a copy of args.disk, or on a fresh image.
+    """
+    from src.common import metrics
+    with scratch_dir(args.workdir) as workdir:
+        if args.disk:
+            _mount_copy(args.disk, workdir)
+        else:
+            mount_fresh(os.path.join(workdir, "replay.img"), _total_blocks(args.size_mb, args.block_size),
+                        args.block_size, INODE_COUNT)
+        try:
+            metrics.reset()
+            with quiet():
+                result = replay(load_trace(args.trace), seed=args.seed)
+            result["trace"] = args.trace
+            result["fragmentation"] = fragmentation()
+            result["metrics"] = metrics.snapshot()
+        finally:
+            _unmount()
+    return result
+
+def cmd_replay(args) -> Dict:
+    return {"environment": environment(), "settings": _settings(args), "results": [replay_trace(args)]}
+
+def _names(text: str) -> List[str]:
+    return [p for p in text.split(",") if p]
+
+def _settings(args) -> Dict:
+    return {k: v for k, v in vars(args).items() if k not in ("func", "out", "workdir")}
+
+def add_image_options(parser) -> None:
+    parser.add_argument("--size-mb", type=int, default=64, help="size of the scratch image")
+    parser.add_argument("--block-size", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="where to place scratch images (default: a temp dir)")
+
+def add_profile_options(parser, default: Optional[List[str]] = None) -> None:
+    parser.add_argument("--profiles", type=_names, default=default or list(PROFILES))
+    parser.add_argument("--ops", type=int, default=20000, help="timed steps per profile")
+    parser.add_argument("--seconds", type=float, default=10.0, help="time budget per profile")
+    parser.add_argument("--files", type=int, default=150, help="file population cap (also bounded by the directory block)")
+
+def check_profiles(parser, profiles: List[str]) -> None:
+    unknown = [p for p in profiles if p not in PROFILES]
+    if unknown:
+        parser.error(f"unknown profiles: {', '.join(unknown)} (choose from {', '.join(PROFILES)})")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.workload", description="Synthetic workloads and trace replay")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run synthetic profiles on fresh images")
+    add_image_options(run)
+    add_profile_options(run)
+    run.add_argument("--out", help="JSON report path (default: stdout)")
+    run.set_defaults(func=cmd_run)
+
+    record = sub.add_parser("record", help="record the file API calls of a CLI session")
+    record.add_argument("--out", required=True, help="trace file to write")
+    record.add_argument("--disk", default="disk.img", help="disk image the session mounts")
+    record.add_argument("-f", "--file", help="run this CLI script instead of an interactive shell")
+    record.set_defaults(func=cmd_record)
+
+    rep = sub.add_parser("replay", help="replay a trace at full speed")
+    rep.add_argument("trace")
+    add_image_options(rep)
+    rep.add_argument("--disk", help="replay on a copy of this image instead of a fresh one")
+    rep.add_argument("--out", help="JSON report path (default: stdout)")
+    rep.set_defaults(func=cmd_replay)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        check_profiles(parser, args.profiles)
+    report = args.func(args)
+    if report:
+        write_report(report, args.out)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,6 @@
 # src/block_bitmap/__init__.py
 
-from .block_allocator import allocate_block, free_block, is_allocated
-from .bitmap import ensure_bitmap_loaded, mark_reserved_regions
\ No newline at end of file
+from .block_allocator import allocate_block, allocate_blocks, free_block, free_blocks, is_allocated
+from .bitmap import ensure_bitmap_loaded, mark_reserved_regions, free_block_count
+from .refcount import block_refcount, share_blocks
+from .dedup import dedup_report
@@ -1,13 +1,51 @@
 # src/block_bitmap/bitmap.py
 # Bitmap management: load/save and bit operations over the on-disk block bitmap.
 
-from typing import Optional, List
-from src.persistence.mount import STATE
-from src.persistence.disk_io import read_block, write_block
+import bisect
+import threading
+from typing import Dict, Optional, List, Tuple
+from src.common.deferral import deferring
+from src.common.metrics import timed
+from src.persistence.mount import STATE, register_unmount_hook
+from src.persistence.disk_io import read_block, write_metadata
+from src.persistence import journal, usage
 
 # In-memory bitmap cache (bytearray), loaded at mount time.
 _BITMAP: Optional[bytearray] = None
 
+# _BITMAP_LOCK guards the in-memory bits (load, test-and-set, clear).
+# _FLUSH_LOCK serializes write-back so an older snapshot never lands after a newer one.
+# Lock order: _FLUSH_LOCK before _BITMAP_LOCK.
+_BITMAP_LOCK = threading.RLock()
+_FLUSH_LOCK = threading.Lock()
+
+# Set when a save was skipped because a batch is deferring metadata write-back.
+_PENDING_SAVE = False
+
+# Next-fit hint: no block between the data region start and this one is free, so allocation
+# scans begin here. Kept in the clean-unmount summary (see usage.py) across mounts.
+_FREE_HINT = 0
+
+# Blocks freed while the image is journaled, held back from allocation until the journal
+# transaction carrying the bitmap save that freed them has committed: block -> its sequence
+# number (0 until that save happens). Until then a crash brings back the old owner, whose content
+# must still be there. Only when nothing else is free are held blocks handed out.
+_HELD: Dict[int, int] = {}
+_FREED_SINCE_SAVE: List[int] = []
+
+def _reset_cache() -> None:
+    global _BITMAP, _FREE_HINT
+    flush_bitmap()
+    with _BITMAP_LOCK:
+        if _BITMAP is not None:
+            usage.record_summary("block_hint", _FREE_HINT)
+        _BITMAP = None
+        _FREE_HINT = 0
+        _HELD.clear()
+        _FREED_SINCE_SAVE.clear()
+
+register_unmount_hook(_reset_cache)
+
 def _require_mounted():
     if not STATE.get("mounted") or STATE.get("superblock") is None:
         raise RuntimeError("Disk not mounted. Call mount() first.")
@@ -29,11 +67,12 @@ def _block_size() -> int:
     sb = STATE["superblock"]
     return sb.block_size_bytes
 
+@timed("bitmap", "load")
 def _load_bitmap() -> None:
     """
     Load the bitmap bytes from disk into the _BITMAP cache.
     """
-    global _BITMAP
+    global _BITMAP, _FREE_HINT
     _require_mounted()
     total_bytes = _bitmap_total_bytes()
     buf = bytearray(total_bytes)
@@ -52,45 +91,111 @@ def _load_bitmap() -> None:
         cursor += take
 
     _BITMAP = buf
+    _FREE_HINT = max(usage.summary("block_hint"), STATE["superblock"].data_start_block)
+    _HELD.clear()
+    _FREED_SINCE_SAVE.clear()
 
 def _save_bitmap() -> None:
     """
-    Persist the _BITMAP cache back to disk.
+    Persist the _BITMAP cache back to disk (postponed while a batch is deferring write-back).
     """
+    global _PENDING_SAVE
     _require_mounted()
-    if _BITMAP is None:
+    if deferring():
+        _PENDING_SAVE = True
         return
-    total_bytes = len(_BITMAP)
+    with _FLUSH_LOCK:
+        _PENDING_SAVE = False
+        with _BITMAP_LOCK:
+            if _BITMAP is None:
+                return
+            snapshot = bytes(_BITMAP)
+            freed = _take_freed()
+        _hold_until(freed, _write_bitmap(snapshot))
+
+def flush_bitmap() -> None:
+    """
+    Write out a bitmap save that was postponed by a batch.
+    """
+    global _PENDING_SAVE
+    if not _PENDING_SAVE or not STATE.get("mounted"):
+        return
+    with _FLUSH_LOCK:
+        _PENDING_SAVE = False
+        with _BITMAP_LOCK:
+            if _BITMAP is None:
+                return
+            snapshot = bytes(_BITMAP)
+            freed = _take_freed()
+        _hold_until(freed, _write_bitmap(snapshot))
+
+def _take_freed() -> List[int]:
+    # Blocks freed since the last snapshot; caller holds _BITMAP_LOCK
+    global _FREED_SINCE_SAVE
+    freed, _FREED_SINCE_SAVE = _FREED_SINCE_SAVE, []
+    return freed
+
+def _hold_until(freed: List[int], seq: int) -> None:
+    """
+    Release 'freed' for reuse once journal transaction 'seq' (the one saving them) commits.
+    """
+    if not freed:
+        return
+    with _BITMAP_LOCK:
+        for b in freed:
+            if b in _HELD:
+                if seq:
+                    _HELD[b] = seq
+                else:
+                    del _HELD[b]
+
+def _release_held() -> None:
+    # Caller holds _BITMAP_LOCK
+    done = journal.committed_seq()
+    for b, seq in list(_HELD.items()):
+        if seq and seq <= done:
+            del _HELD[b]
+
+@timed("bitmap", "save")
+def _write_bitmap(snapshot: bytes) -> int:
+    """
+    Write the bitmap blocks; returns the journal transaction they went into (0 if unjournaled).
+    """
+    total_bytes = len(snapshot)
     bs = _block_size()
     start = _bitmap_start_block()
     blocks = _bitmap_total_blocks()
 
+    seq = 0
     cursor = 0
     for i in range(blocks):
         take = min(bs, total_bytes - cursor)
         if take <= 0:
             # write zero block for remaining region
-            write_block(start + i, b"\x00" * bs, offset=0)
+            seq = max(seq, write_metadata(start + i, b"\x00" * bs, offset=0))
             continue
         # Prepare full block buffer: existing bytes (take) + zero padding
         buf = bytearray(bs)
-        buf[:take] = _BITMAP[cursor:cursor + take]
-        write_block(start + i, bytes(buf), offset=0)
+        buf[:take] = snapshot[cursor:cursor + take]
+        seq = max(seq, write_metadata(start + i, bytes(buf), offset=0))
         cursor += take
+    return seq
 
 def ensure_bitmap_loaded() -> None:
     """
     Public helper: call to ensure the bitmap is loaded into memory.
     Safe to call multiple times.
     """
-    global _BITMAP
     if _BITMAP is None:
-        _load_bitmap()
+        with _BITMAP_LOCK:
+            if _BITMAP is None:
+                _load_bitmap()
 
 def _set_bit(block_num: int, value: bool) -> None:
     """
     Set or clear a block allocation bit.
     """
+    global _FREE_HINT
     ensure_bitmap_loaded()
     if block_num < 0 or block_num >= STATE["superblock"].total_blocks:
         raise ValueError("block_num out of range")
@@ -99,10 +204,21 @@ def _set_bit(block_num: int, value: bool) -> None:
     bit_index = block_num % 8
     mask = 1 << bit_index
 
-    if value:
-        _BITMAP[byte_index] = _BITMAP[byte_index] | mask
-    else:
-        _BITMAP[byte_index] = _BITMAP[byte_index] & (~mask & 0xFF)
+    with _BITMAP_LOCK:
+        was_set = bool(_BITMAP[byte_index] & mask)
+        if value:
+            _BITMAP[byte_index] = _BITMAP[byte_index] | mask
+        else:
+            _BITMAP[byte_index] = _BITMAP[byte_index] & (~mask & 0xFF)
+        if was_set != value:
+            usage.adjust("blocks", -1 if value else 1)
+            if not value and block_num < _FREE_HINT:
+                _FREE_HINT = block_num
+            if not value and journal.enabled():
+                _HELD[block_num] = 0
+                _FREED_SINCE_SAVE.append(block_num)
+            elif value:
+                _HELD.pop(block_num, None)
 
 def _get_bit(block_num: int) -> bool:
     """
@@ -118,24 +234,38 @@ def _get_bit(block_num: int) -> bool:
 
 def mark_reserved_regions() -> None:
     """
-    Ensure superblock, inode table, and bitmap regions are marked allocated.
+    Ensure superblock, inode table, bitmap and journal regions are marked allocated.
     Should be called during initialization after mount and bitmap load.
     """
     ensure_bitmap_loaded()
     sb = STATE["superblock"]
 
-    # Reserve block 0 (superblock)
-    _set_bit(0, True)
+    reserved = [0]  # block 0 (superblock)
+    reserved += range(sb.inode_start_block, sb.inode_start_block + sb.inode_table_blocks)
+    reserved += range(sb.bitmap_start_block, sb.bitmap_start_block + sb.bitmap_blocks)
+    reserved += range(sb.journal_start_block, sb.journal_start_block + sb.journal_blocks)
+    with _BITMAP_LOCK:
+        missing = [b for b in reserved if not _get_bit(b)]
+        for b in missing:
+            _set_bit(b, True)
 
-    # Reserve inode table region
-    for i in range(sb.inode_table_blocks):
-        _set_bit(sb.inode_start_block + i, True)
+    # Already marked (the common case): nothing to persist
+    if missing:
+        _save_bitmap()
 
-    # Reserve bitmap region
-    for i in range(sb.bitmap_blocks):
-        _set_bit(sb.bitmap_start_block + i, True)
+def free_block_count() -> int:
+    """
+    Number of free blocks, from the incrementally kept counter (no bitmap scan once known).
+    """
+    _require_mounted()
+    with _BITMAP_LOCK:
+        return usage.free_count("blocks", _count_free_bits)
 
-    _save_bitmap()
+def _count_free_bits() -> int:
+    ensure_bitmap_loaded()
+    total = STATE["superblock"].total_blocks
+    # Bits past total_blocks are never set, so the population count is the allocated total
+    return total - int.from_bytes(_BITMAP, byteorder="little").bit_count()
 
 def is_allocated(block_num: int) -> bool:
     """
@@ -148,14 +278,166 @@ def allocate_first_free(start_from: int = 0) -> Optional[int]:
     Scan the bitmap for the first free block starting from 'start_from'.
     Returns the allocated block number or None if full.
     """
+    global _FREE_HINT
+    ensure_bitmap_loaded()
+    sb = STATE["superblock"]
+    start = max(0, start_from)
+    # Find-and-claim must be atomic, otherwise two threads can win the same block
+    with _BITMAP_LOCK:
+        if _HELD:
+            _release_held()
+        claimed = held = None
+        for b in range(max(start, _FREE_HINT), sb.total_blocks):
+            if not _get_bit(b):
+                if b in _HELD:
+                    held = b if held is None else held
+                    continue
+                claimed = b
+                break
+        if claimed is None:
+            claimed = held
+        if claimed is not None:
+            _set_bit(claimed, True)
+        if start <= _FREE_HINT:
+            # Skipped held blocks are still free: the hint must not pass them
+            _FREE_HINT = sb.total_blocks if claimed is None else claimed + 1
+            if held is not None and held != claimed:
+                _FREE_HINT = min(_FREE_HINT, held)
+    if claimed is not None:
+        _save_bitmap()
+    return claimed
+
+def _free_runs(start: int, end: int):
+    """
+    Yield (first_block, length) for each run of free blocks in [start, end).
+    Fully allocated bytes are skipped eight blocks at a time.
+    """
+    b = start
+    run_start = None
+    while b < end:
+        if run_start is None and b % 8 == 0 and b + 8 <= end and _BITMAP[b // 8] == 0xFF:
+            b += 8
+            continue
+        if not _BITMAP[b // 8] & (1 << (b % 8)):
+            if run_start is None:
+                run_start = b
+        elif run_start is not None:
+            yield run_start, b - run_start
+            run_start = None
+        b += 1
+    if run_start is not None:
+        yield run_start, end - run_start
+
+def _without_held(runs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Split free runs around held blocks. Caller holds _BITMAP_LOCK.
+    """
+    held = sorted(_HELD)
+    out = []
+    for first, length in runs:
+        cursor = first
+        i = bisect.bisect_left(held, first)
+        while i < len(held) and held[i] < first + length:
+            if held[i] > cursor:
+                out.append((cursor, held[i] - cursor))
+            cursor = held[i] + 1
+            i += 1
+        if cursor < first + length:
+            out.append((cursor, first + length - cursor))
+    return out
+
+def free_extents(start_from: int = 0) -> List[Tuple[int, int]]:
+    """
+    Every run of free blocks from 'start_from' on, as (first_block, length) in block order.
+    """
     ensure_bitmap_loaded()
+    start = max(0, start_from)
+    with _BITMAP_LOCK:
+        return list(_free_runs(max(start, _FREE_HINT), STATE["superblock"].total_blocks))
+
+def allocate_run(count: int, start_from: int = 0, goal: Optional[int] = None) -> Optional[List[int]]:
+    """
+    Claim 'count' free blocks in one step, contiguously where possible.
+    Prefers a run beginning at 'goal' (e.g. just past a file's last block), then the first
+    run long enough; otherwise stitches together the longest runs available.
+    Returns the claimed blocks in order, or None (claiming nothing) if too few are free.
+    """
+    global _FREE_HINT
+    ensure_bitmap_loaded()
+    if count <= 0:
+        return []
     sb = STATE["superblock"]
-    for b in range(max(0, start_from), sb.total_blocks):
-        if not _get_bit(b):
+    start = max(0, start_from)
+    with _BITMAP_LOCK:
+        from_hint = start <= _FREE_HINT
+        runs = list(_free_runs(max(start, _FREE_HINT), sb.total_blocks))
+        if sum(length for _, length in runs) < count:
+            return None
+        if _HELD:
+            _release_held()
+        usable = _without_held(runs) if _HELD else runs
+        if sum(length for _, length in usable) < count:
+            usable = runs
+        pieces = []
+        if goal is not None:
+            for first, length in usable:
+                if first <= goal and goal + count <= first + length:
+                    pieces = [(goal, count)]
+                    break
+        if not pieces:
+            for first, length in usable:
+                if length >= count:
+                    pieces = [(first, count)]
+                    break
+        if not pieces:
+            needed = count
+            for first, length in sorted(usable, key=lambda r: -r[1]):
+                take = min(length, needed)
+                pieces.append((first, take))
+                needed -= take
+                if needed == 0:
+                    break
+            pieces.sort()
+        claimed = [b for first, length in pieces for b in range(first, first + length)]
+        for b in claimed:
             _set_bit(b, True)
-            _save_bitmap()
-            return b
-    return None
+        if from_hint:
+            taken = set(claimed)
+            _FREE_HINT = next((b for first, length in runs for b in range(first, first + length)
+                               if b not in taken), sb.total_blocks)
+    _save_bitmap()
+    return claimed
+
+def free_block_nums(block_nums: List[int]) -> None:
+    """
+    Free several blocks and persist the change with a single bitmap save.
+    """
+    ensure_bitmap_loaded()
+    total = STATE["superblock"].total_blocks
+    if any(b < 0 or b >= total for b in block_nums):
+        raise ValueError("block_num out of range")
+    if not block_nums:
+        return
+    with _BITMAP_LOCK:
+        for b in block_nums:
+            _set_bit(b, False)
+    _save_bitmap()
+
+def mark_block_nums(block_nums: List[int]) -> None:
+    """
+    Mark several blocks allocated (e.g. owned blocks a consistency check found free) with a
+    single bitmap save.
+    """
+    ensure_bitmap_loaded()
+    total = STATE["superblock"].total_blocks
+    if any(b < 0 or b >= total for b in block_nums):
+        raise ValueError("block_num out of range")
+    if not block_nums:
+        return
+    with _BITMAP_LOCK:
+        for b in block_nums:
+            _set_bit(b, True)
+    _save_bitmap()
 
 def free_block_num(block_num: int) -> None:
     """
@@ -1,15 +1,33 @@
 # src/block_bitmap/block_allocator.py
 # Public allocation API aligned with Member 1's contracts.
 
-from typing import Optional
+from typing import Callable, List, Optional
 from src.persistence.mount import STATE
+from src.common.metrics import timed
 from .bitmap import ensure_bitmap_loaded, mark_reserved_regions
-from .bitmap import allocate_first_free, free_block_num, is_allocated as _is_alloc
+from .bitmap import allocate_first_free, allocate_run, free_block_num, free_block_nums, is_allocated as _is_alloc
+from .refcount import drop_ref
+from .dedup import forget_blocks
+
+# Callbacks told which blocks just returned to the free pool, so caches keyed by block number
+# (decompressed clusters) never serve a previous owner's content once a block is reused
+_FREE_HOOKS: List[Callable[[List[int]], None]] = []
+
+def register_free_hook(hook: Callable[[List[int]], None]) -> None:
+    if hook not in _FREE_HOOKS:
+        _FREE_HOOKS.append(hook)
+
+def _released(block_nums: List[int]) -> None:
+    forget_blocks(block_nums)
+    if block_nums:
+        for hook in _FREE_HOOKS:
+            hook(block_nums)
 
 def _require_mounted():
     if not STATE.get("mounted"):
         raise RuntimeError("Disk not mounted. Call mount() first.")
 
+@timed("bitmap", "allocate_block")
 def allocate_block() -> int:
     """
     Allocate a free block from the bitmap and return its block number.
@@ -24,19 +42,53 @@ def allocate_block() -> int:
         raise RuntimeError("No free blocks available")
     return b
 
-def free_block(block_num: int) -> None:
+@timed("bitmap", "allocate_blocks")
+def allocate_blocks(count: int, goal: Optional[int] = None) -> List[int]:
     """
-    Free the given block number.
+    Allocate 'count' blocks at once, contiguously where possible, with a single bitmap save.
+    'goal' is a preferred first block (typically just past the file's current last block).
+    Raises RuntimeError if fewer than 'count' blocks are free.
     """
     _require_mounted()
-    # Prevent freeing reserved regions
+    ensure_bitmap_loaded()
+    mark_reserved_regions()
+    blocks = allocate_run(count, start_from=STATE["superblock"].data_start_block, goal=goal)
+    if blocks is None:
+        raise RuntimeError("No free blocks available")
+    return blocks
+
+def _check_not_reserved(block_num: int) -> None:
+    # Prevent freeing reserved regions (superblock, inode table, bitmap, journal)
     sb = STATE["superblock"]
-    reserved = {0}
-    reserved.update(range(sb.inode_start_block, sb.inode_start_block + sb.inode_table_blocks))
-    reserved.update(range(sb.bitmap_start_block, sb.bitmap_start_block + sb.bitmap_blocks))
-    if block_num in reserved:
+    if (block_num == 0
+            or sb.inode_start_block <= block_num < sb.inode_start_block + sb.inode_table_blocks
+            or sb.bitmap_start_block <= block_num < sb.bitmap_start_block + sb.bitmap_blocks
+            or sb.journal_start_block <= block_num < sb.journal_start_block + sb.journal_blocks):
         raise ValueError("Attempt to free a reserved block")
-    free_block_num(block_num)
+
+@timed("bitmap", "free_block")
+def free_block(block_num: int) -> None:
+    """
+    Free the given block number. A block shared by clones only loses one reference;
+    it returns to the free pool when its last owner lets go.
+    """
+    _require_mounted()
+    _check_not_reserved(block_num)
+    if drop_ref(block_num):
+        _released([block_num])
+        free_block_num(block_num)
+
+@timed("bitmap", "free_blocks")
+def free_blocks(block_nums: List[int]) -> None:
+    """
+    Free several blocks with a single bitmap save (same reference semantics as free_block).
+    """
+    _require_mounted()
+    for b in block_nums:
+        _check_not_reserved(b)
+    released = [b for b in block_nums if drop_ref(b)]
+    _released(released)
+    free_block_nums(released)
 
 def is_allocated(block_num: int) -> bool:
     """
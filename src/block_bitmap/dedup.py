@@ -0,0 +1,243 @@
+# src/block_bitmap/dedup.py
+# Content-addressed index of data blocks for deduplicating writes.
+#
+# On disk the index is a dense table of 16-byte BLAKE2b digests, one per block (all zeros = not
+# indexed), stored in a contiguous run of data blocks allocated on first use. Its first block
+# number is stashed at bytes 8..12 of the pointer block, after the directory and refcount pointers.
+# Writers that opt in look a full block up by digest; on a hit the file shares the existing
+# physical block (see refcount.py) instead of writing a new one. A hit is always confirmed
+# against the block's actual content, so an entry left stale by an in-place overwrite is
+# simply dropped rather than trusted.
+
+import hashlib
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+from src.common.deferral import deferring
+from src.common.metrics import timed
+from src.persistence.mount import STATE, register_unmount_hook
+from src.persistence.disk_io import read_block, read_blocks, write_metadata
+from .bitmap import allocate_run, mark_reserved_regions
+from .refcount import block_refcount
+
+_POINTER_OFFSET = 8
+DIGEST_BYTES = 16
+_MAX_REFS = 0xFFFF
+_EMPTY = bytes(DIGEST_BYTES)
+
+# Below this many blocks hashing inline beats handing work to the pool.
+_PARALLEL_MIN_BLOCKS = 8
+
+_TABLE: Optional[bytearray] = None   # digest per block number
+_BY_DIGEST: Dict[bytes, int] = {}    # digest -> block holding that content
+_TABLE_START: int = 0                # first block of the on-disk table (0 = not allocated yet)
+_DIRTY: Set[int] = set()             # table block indexes with unsaved changes
+_NO_INDEX = False                    # pointer block checked: no table on disk, none loaded since
+_STATS = {"blocks_checked": 0, "blocks_deduped": 0}
+_DEDUP_LOCK = threading.RLock()
+
+_POOL = None  # ThreadPoolExecutor, created on first large batch
+_POOL_LOCK = threading.Lock()
+
+def _reset_cache() -> None:
+    global _TABLE, _TABLE_START, _NO_INDEX
+    with _DEDUP_LOCK:
+        if _TABLE is not None and STATE.get("mounted"):
+            _save()
+        _TABLE = None
+        _TABLE_START = 0
+        _NO_INDEX = False
+        _BY_DIGEST.clear()
+        _DIRTY.clear()
+        _STATS.update(blocks_checked=0, blocks_deduped=0)
+
+register_unmount_hook(_reset_cache)
+
+def _pointer_block() -> int:
+    return STATE["superblock"].bitmap_start_block - 1
+
+def _table_blocks() -> int:
+    sb = STATE["superblock"]
+    return (sb.total_blocks * DIGEST_BYTES + sb.block_size_bytes - 1) // sb.block_size_bytes
+
+def _entries_per_block() -> int:
+    return STATE["superblock"].block_size_bytes // DIGEST_BYTES
+
+def _table_pointer() -> int:
+    ptr = read_block(_pointer_block())[_POINTER_OFFSET:_POINTER_OFFSET + 4]
+    return int.from_bytes(ptr, byteorder="little")
+
+def _index_in_use() -> bool:
+    """
+    Whether an index exists in memory or on disk, without building one.
+    """
+    global _NO_INDEX
+    if _TABLE is not None:
+        return True
+    if not _NO_INDEX:
+        _NO_INDEX = not _table_pointer()
+    return not _NO_INDEX
+
+def _ensure_loaded() -> None:
+    global _TABLE, _TABLE_START
+    if _TABLE is not None:
+        return
+    with _DEDUP_LOCK:
+        if _TABLE is not None:
+            return
+        sb = STATE["superblock"]
+        size = sb.total_blocks * DIGEST_BYTES
+        start = _table_pointer()
+        table = bytearray(size)
+        if start:
+            table = bytearray(read_blocks(start, _table_blocks())[:size])
+            for b in range(sb.total_blocks):
+                digest = bytes(table[b * DIGEST_BYTES:(b + 1) * DIGEST_BYTES])
+                if digest != _EMPTY:
+                    _BY_DIGEST[digest] = b
+        _TABLE_START = start
+        _TABLE = table
+
+def _allocate_table() -> None:
+    """
+    Reserve the on-disk table (one contiguous run) and record its location in the pointer block.
+    """
+    global _TABLE_START
+    count = _table_blocks()
+    mark_reserved_regions()
+    blocks = allocate_run(count, start_from=STATE["superblock"].data_start_block)
+    if blocks is None or blocks != list(range(blocks[0], blocks[0] + count)):
+        raise RuntimeError("No contiguous space for the dedup index")
+    _TABLE_START = blocks[0]
+    pointer_block = _pointer_block()
+    buf = bytearray(read_block(pointer_block))
+    buf[_POINTER_OFFSET:_POINTER_OFFSET + 4] = _TABLE_START.to_bytes(4, byteorder="little")
+    write_metadata(pointer_block, bytes(buf), offset=0)
+    _DIRTY.update(range(count))
+
+@timed("dedup", "save")
+def _save() -> None:
+    """
+    Write back only the table blocks that changed since the last save (postponed inside a batch).
+    """
+    if not _DIRTY or deferring():
+        return
+    if not _TABLE_START:
+        _allocate_table()
+    span = _entries_per_block() * DIGEST_BYTES
+    bs = STATE["superblock"].block_size_bytes
+    for idx in sorted(_DIRTY):
+        chunk = bytes(_TABLE[idx * span:(idx + 1) * span])
+        write_metadata(_TABLE_START + idx, chunk.ljust(bs, b"\x00"), offset=0)
+    _DIRTY.clear()
+
+def flush_dedup_index() -> None:
+    """
+    Write out index blocks left dirty by a batch.
+    """
+    with _DEDUP_LOCK:
+        if _TABLE is not None:
+            _save()
+
+def _set(block_num: int, digest: bytes) -> None:
+    pos = block_num * DIGEST_BYTES
+    old = bytes(_TABLE[pos:pos + DIGEST_BYTES])
+    if old == digest:
+        return
+    if old != _EMPTY and _BY_DIGEST.get(old) == block_num:
+        del _BY_DIGEST[old]
+    _TABLE[pos:pos + DIGEST_BYTES] = digest
+    if digest != _EMPTY:
+        _BY_DIGEST[digest] = block_num
+    _DIRTY.add(block_num // _entries_per_block())
+
+def _digest(chunk: bytes) -> bytes:
+    return hashlib.blake2b(chunk, digest_size=DIGEST_BYTES).digest()
+
+def _pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            # Imported here: concurrent.futures is slow to import and most writes never hash in bulk
+            from concurrent.futures import ThreadPoolExecutor
+            _POOL = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1),
+                                       thread_name_prefix="fs-dedup-hash")
+        return _POOL
+
+def hash_blocks(chunks: List[bytes]) -> List[bytes]:
+    """
+    Digest each chunk. Large batches fan out to a thread pool (hashlib releases the GIL).
+    """
+    if len(chunks) < _PARALLEL_MIN_BLOCKS:
+        return [_digest(c) for c in chunks]
+    return list(_pool().map(_digest, chunks))
+
+@timed("dedup", "lookup")
+def find_block(digest: bytes, chunk: bytes, pending: Optional[Dict[bytes, int]] = None) -> Optional[int]:
+    """
+    Return an allocated block already holding exactly 'chunk', or None.
+    'pending' maps digests to blocks the caller wrote earlier in the same operation but has
+    not indexed yet. The caller takes its own reference with share_blocks before pointing
+    a file at the returned block.
+    """
+    _ensure_loaded()
+    with _DEDUP_LOCK:
+        _STATS["blocks_checked"] += 1
+        if pending and digest in pending:
+            _STATS["blocks_deduped"] += 1
+            return pending[digest]
+        block = _BY_DIGEST.get(digest)
+        if block is None:
+            return None
+        if read_block(block) != chunk:
+            # Overwritten in place since it was indexed
+            _set(block, _EMPTY)
+            _save()
+            return None
+        if block_refcount(block) >= _MAX_REFS:
+            return None
+        _STATS["blocks_deduped"] += 1
+        return block
+
+def remember_blocks(digests: Dict[int, bytes]) -> None:
+    """
+    Index blocks that were just written ({block_num: digest of its new content}), saving once.
+    """
+    if not digests:
+        return
+    _ensure_loaded()
+    with _DEDUP_LOCK:
+        for block_num, digest in digests.items():
+            _set(block_num, digest)
+        _save()
+
+def forget_blocks(block_nums: Iterable[int]) -> None:
+    """
+    Drop index entries of blocks returned to the free pool. Images that never indexed a block
+    have nothing to drop, and the index is not built for them.
+    """
+    if not _index_in_use():
+        return
+    _ensure_loaded()
+    with _DEDUP_LOCK:
+        for b in block_nums:
+            if _TABLE[b * DIGEST_BYTES:(b + 1) * DIGEST_BYTES] != _EMPTY:
+                _set(b, _EMPTY)
+        _save()
+
+def dedup_report() -> Dict:
+    """
+    Dedup effectiveness since mount: full blocks checked, blocks that reused an existing
+    block instead of being written, bytes saved and the logical/physical ratio.
+    """
+    bs = STATE["superblock"].block_size_bytes
+    checked = _STATS["blocks_checked"]
+    deduped = _STATS["blocks_deduped"]
+    written = checked - deduped
+    return {
+        "blocks_checked": checked,
+        "blocks_deduped": deduped,
+        "bytes_saved": deduped * bs,
+        "dedup_ratio": checked / max(written, 1) if checked else 1.0,
+        "indexed_blocks": len(_BY_DIGEST),
+    }
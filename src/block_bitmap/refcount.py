@@ -0,0 +1,155 @@
+# src/block_bitmap/refcount.py
+# Per-block reference counts for blocks shared between files (copy-on-write clones).
+#
+# On disk the counts live in a dense table of little-endian uint16, one per block, stored in a
+# contiguous run of data blocks allocated on first use. Its first block number is stashed at
+# bytes 4..8 of the pointer block (right before the bitmap), next to the directory pointer.
+# A count of 0 means "not shared": the block has a single owner if allocated, none if free.
+
+import threading
+from array import array
+from typing import Dict, Iterable, Optional, Set
+from src.common.deferral import deferring
+from src.common.metrics import timed
+from src.persistence.mount import STATE, register_unmount_hook
+from src.persistence.disk_io import read_block, write_metadata
+from .bitmap import allocate_run, mark_reserved_regions
+
+_POINTER_OFFSET = 4
+_ENTRY_BYTES = 2
+_MAX_REFS = 0xFFFF
+
+_REFS: Optional[array] = None
+_TABLE_START: int = 0            # first block of the on-disk table (0 = not allocated yet)
+_DIRTY: Set[int] = set()         # table block indexes with unsaved changes
+_REF_LOCK = threading.RLock()
+
+def _reset_cache() -> None:
+    global _REFS, _TABLE_START
+    with _REF_LOCK:
+        if _REFS is not None and STATE.get("mounted"):
+            _save()
+        _REFS = None
+        _TABLE_START = 0
+        _DIRTY.clear()
+
+register_unmount_hook(_reset_cache)
+
+def _pointer_block() -> int:
+    return STATE["superblock"].bitmap_start_block - 1
+
+def _table_blocks() -> int:
+    sb = STATE["superblock"]
+    return (sb.total_blocks * _ENTRY_BYTES + sb.block_size_bytes - 1) // sb.block_size_bytes
+
+def _entries_per_block() -> int:
+    return STATE["superblock"].block_size_bytes // _ENTRY_BYTES
+
+def _ensure_loaded() -> None:
+    global _REFS, _TABLE_START
+    if _REFS is not None:
+        return
+    with _REF_LOCK:
+        if _REFS is not None:
+            return
+        sb = STATE["superblock"]
+        ptr = read_block(_pointer_block())[_POINTER_OFFSET:_POINTER_OFFSET + 4]
+        start = int.from_bytes(ptr, byteorder="little")
+        refs = array("H", bytes(sb.total_blocks * _ENTRY_BYTES))
+        if start:
+            raw = b"".join(read_block(start + i) for i in range(_table_blocks()))
+            refs = array("H", raw[:sb.total_blocks * _ENTRY_BYTES])
+        _TABLE_START = start
+        _REFS = refs
+
+def _allocate_table() -> None:
+    """
+    Reserve the on-disk table (one contiguous run) and record its location in the pointer block.
+    """
+    global _TABLE_START
+    count = _table_blocks()
+    mark_reserved_regions()
+    blocks = allocate_run(count, start_from=STATE["superblock"].data_start_block)
+    if blocks is None or blocks != list(range(blocks[0], blocks[0] + count)):
+        raise RuntimeError("No contiguous space for the block reference table")
+    _TABLE_START = blocks[0]
+    pointer_block = _pointer_block()
+    buf = bytearray(read_block(pointer_block))
+    buf[_POINTER_OFFSET:_POINTER_OFFSET + 4] = _TABLE_START.to_bytes(4, byteorder="little")
+    write_metadata(pointer_block, bytes(buf), offset=0)
+    _DIRTY.update(range(count))
+
+@timed("refcount", "save")
+def _save() -> None:
+    """
+    Write back only the table blocks that changed since the last save (postponed inside a batch).
+    """
+    if not _DIRTY or deferring():
+        return
+    if not _TABLE_START:
+        _allocate_table()
+    per_block = _entries_per_block()
+    bs = STATE["superblock"].block_size_bytes
+    for idx in sorted(_DIRTY):
+        chunk = _REFS[idx * per_block:(idx + 1) * per_block].tobytes()
+        write_metadata(_TABLE_START + idx, chunk.ljust(bs, b"\x00"), offset=0)
+    _DIRTY.clear()
+
+def flush_refcounts() -> None:
+    """
+    Write out table blocks left dirty by a batch.
+    """
+    with _REF_LOCK:
+        if _REFS is not None:
+            _save()
+
+def _set(block_num: int, count: int) -> None:
+    _REFS[block_num] = 0 if count <= 1 else count
+    _DIRTY.add(block_num // _entries_per_block())
+
+def block_refcount(block_num: int) -> int:
+    """
+    Number of owners of an allocated block (1 unless it is shared by clones).
+    """
+    _ensure_loaded()
+    return max(1, _REFS[block_num])
+
+def share_blocks(blocks: Iterable[int]) -> None:
+    """
+    Add one owner to each block (a clone now references it too), persisting once for the batch.
+    """
+    _ensure_loaded()
+    with _REF_LOCK:
+        for b in blocks:
+            count = max(1, _REFS[b]) + 1
+            if count > _MAX_REFS:
+                raise OverflowError(f"Block {b} has too many references")
+            _set(b, count)
+        _save()
+
+def drop_ref(block_num: int) -> bool:
+    """
+    Remove one owner from a block. Returns True when no owners remain and the block
+    should be released in the bitmap; False while other files still share it.
+    """
+    _ensure_loaded()
+    with _REF_LOCK:
+        count = _REFS[block_num]
+        if count <= 1:
+            return True
+        _set(block_num, count - 1)
+        _save()
+        return False
+
+def set_refcounts(counts: Dict[int, int]) -> None:
+    """
+    Overwrite the owner count of each block ({block_num: owners}), persisting once.
+    Used by fsck to bring the table in line with the block maps.
+    """
+    _ensure_loaded()
+    with _REF_LOCK:
+        for b, count in counts.items():
+            if count > _MAX_REFS:
+                raise OverflowError(f"Block {b} has too many references")
+            _set(b, count)
+        _save()
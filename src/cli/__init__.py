@@ -1 +1,6 @@
+import time
+
+# Taken before anything else in the package loads, for `--time-startup`
+IMPORT_STARTED = time.perf_counter()
+
 from .cli_main import run_cli
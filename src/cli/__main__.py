@@ -0,0 +1,35 @@
+# src/cli/__main__.py
+# Entry point: `python -m src.cli` starts the interactive shell; `-f FILE` (or piped stdin)
+# runs the commands as a script.
+
+import argparse
+import sys
+from . import IMPORT_STARTED
+from .cli_main import DISK_PATH, run_cli, run_script
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Mini file system simulator shell")
+    parser.add_argument("-f", "--file", help="run commands from FILE ('-' for stdin) instead of the interactive shell")
+    parser.add_argument("--disk", default=DISK_PATH, help=f"disk image to mount (default: {DISK_PATH})")
+    parser.add_argument("--commit-at-end", action="store_true",
+                        help="script mode: write metadata back once, after the last command")
+    parser.add_argument("--time-startup", action="store_true",
+                        help="report import and mount latency (and the first command's in script mode)")
+    args = parser.parse_args(argv)
+
+    startup_from = IMPORT_STARTED if args.time_startup else None
+    script = args.file
+    if script is None and not sys.stdin.isatty():
+        script = "-"
+    if script is None:
+        run_cli(args.disk, startup_from=startup_from)
+        return 0
+    if script == "-":
+        run_script(sys.stdin, disk_path=args.disk, commit_at_end=args.commit_at_end, startup_from=startup_from)
+    else:
+        with open(script, "r", encoding="utf-8") as f:
+            run_script(f, disk_path=args.disk, commit_at_end=args.commit_at_end, startup_from=startup_from)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,116 @@
+import contextlib
+import io
 import os
-from src.persistence.disk_initializer import initialize_disk
-from src.persistence.mount import mount
-from src.persistence.unmount import unmount
+import sys
+import time
+from typing import Dict, Iterable, Optional, TextIO
 from .command_parser import parse_command
 from .command_executor import execute_command
 
+# The persistence stack and the engine are imported inside the functions that need them,
+# so `python -m src.cli` starts without loading modules a short script never touches.
+
 DISK_PATH = "disk.img"
 
-def run_cli():
+def _mount_disk(disk_path: str) -> bool:
+    from src.persistence.mount import mount
+
     # Ensure disk exists
-    if not os.path.exists(DISK_PATH):
+    if not os.path.exists(disk_path):
+        from src.persistence.disk_initializer import initialize_disk
         print("[INFO] No disk image found. Initializing a new one...")
-        initialize_disk(DISK_PATH)
+        initialize_disk(disk_path)
 
     # Mount the disk
     try:
-        mount(DISK_PATH)
+        mount(disk_path)
         print("[INFO] Filesystem mounted successfully.")
     except Exception as e:
         print(f"[ERROR] Failed to mount filesystem: {e}")
+        return False
+    return True
+
+def unmount():
+    from src.persistence.unmount import unmount as _unmount
+    _unmount()
+
+def _startup_report(startup_from: float, mount_started: float, mounted: float,
+                    first_command: Optional[float] = None) -> str:
+    """
+    One-line startup latency breakdown in milliseconds (imports, mount, optional first command).
+    """
+    parts = [
+        f"imports {(mount_started - startup_from) * 1000:.1f} ms",
+        f"mount {(mounted - mount_started) * 1000:.1f} ms",
+    ]
+    if first_command is not None:
+        parts.append(f"first command {first_command * 1000:.1f} ms")
+    return f"[STARTUP] {', '.join(parts)}, total {(mounted - startup_from) * 1000:.1f} ms"
+
+def run_script(lines: Iterable[str], disk_path: str = DISK_PATH, commit_at_end: bool = False,
+               out: Optional[TextIO] = None, startup_from: Optional[float] = None) -> Dict:
+    """
+    Run commands non-interactively: mount once, execute every line, unmount.
+    Command output is buffered and written to 'out' (stdout by default) in one go at the end,
+    followed by a timing summary. Blank lines and '#' comments are skipped; 'exit' stops early.
+    With commit_at_end=True all metadata is written back once, after the last command.
+    With startup_from (a perf_counter() taken at process start) a startup breakdown is reported too.
+    Returns {"commands", "seconds", "ops_per_s"}.
+    """
+    out = out or sys.stdout
+    buffer = io.StringIO()
+    commands = 0
+    first_command = None
+    with contextlib.redirect_stdout(buffer):
+        mount_started = time.perf_counter()
+        if not _mount_disk(disk_path):
+            out.write(buffer.getvalue())
+            return {"commands": 0, "seconds": 0.0, "ops_per_s": 0.0}
+        started = time.perf_counter()
+        if commit_at_end:
+            from src.file_api import batch
+        try:
+            with batch() if commit_at_end else contextlib.nullcontext():
+                for line in lines:
+                    raw = line.strip()
+                    if not raw or raw.startswith("#"):
+                        continue
+                    if raw in ("exit", "quit"):
+                        break
+                    cmd, args = parse_command(raw)
+                    if cmd is None:
+                        continue
+                    command_started = time.perf_counter()
+                    try:
+                        execute_command(cmd, args)
+                    except Exception as e:
+                        print(f"[ERROR] {e}")
+                    if first_command is None:
+                        first_command = time.perf_counter() - command_started
+                    commands += 1
+        finally:
+            seconds = time.perf_counter() - started
+            try:
+                unmount()
+            except Exception as e:
+                print(f"[WARNING] Failed to unmount cleanly: {e}")
+    stats = {
+        "commands": commands,
+        "seconds": seconds,
+        "ops_per_s": commands / seconds if seconds > 0 else 0.0,
+    }
+    out.write(buffer.getvalue())
+    out.write(f"[SCRIPT] {commands} commands in {seconds:.3f}s ({stats['ops_per_s']:.1f} ops/s)\n")
+    if startup_from is not None:
+        out.write(_startup_report(startup_from, mount_started, started, first_command) + "\n")
+    return stats
+
+def run_cli(disk_path: str = DISK_PATH, startup_from: Optional[float] = None):
+    mount_started = time.perf_counter()
+    if not _mount_disk(disk_path):
         return
+    if startup_from is not None:
+        print(_startup_report(startup_from, mount_started, time.perf_counter()))
 
     print("Welcome to the Mini File System Simulator CLI. Type 'help' for commands.")
 
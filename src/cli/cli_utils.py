@@ -12,9 +12,18 @@ def print_help():
     print("Available commands:")
     print("  ls                     - list files")
     print("  touch <name>           - create empty file")
-    print("  mkdir <name>           - create directory")
     print("  cat <name>             - display file contents")
     print("  echo <text> > <name>   - write text to file")
     print("  rm <name>              - delete file")
-    print("  truncate <name>        - clear file contents")
+    print("  put <host> <name>      - import host file")
+    print("  get <name> <host>      - export file to host")
+    print("  df                     - show free/used space")
+    print("  du [name ...]          - show space used per file")
+    print("  stat <name>            - show file metadata")
+    print("  fsck [-y]              - check consistency (-y: repair)")
+    print("  frag [name ...]        - show extents per file and free-space fragmentation")
+    print("  defrag [max_blocks]    - make fragmented files contiguous")
+    print("  journal                - show metadata journal commits and checkpoints")
+    print("  stats [reset|dump <f>] - show per-layer I/O counters and latency")
+    print("  trace start|stop <f>   - record spans as a Chrome trace")
     print("  exit                   - quit shell")
\ No newline at end of file
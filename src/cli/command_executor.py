@@ -1,35 +1,36 @@
 # src/cli/command_executor.py
 
-from src.persistence.file_api import (
-    create_file,
-    delete_file,
-    list_files,
-    write_file,
-    read_file,
-)
+import codecs
+
+# Commands that run without touching the filesystem engine
+_LOCAL_COMMANDS = ("help", "stats", "trace")
 
 def execute_command(cmd: str, args: list[str]):
     """
     Execute a parsed command with arguments.
-    Supports: touch, ls, rm, echo, cat, help
+    Supports: touch, ls, rm, echo, cat, put, get, df, du, stat, fsck, frag, defrag, journal, stats, trace, help
     """
 
-    # Normalize filenames to absolute paths
+    # The root directory keys files by bare name; accept "/name" as well
     def norm(name: str) -> str:
-        return name if name.startswith("/") else "/" + name
+        return name.lstrip("/")
+
+    if cmd not in _LOCAL_COMMANDS:
+        # Imported on first use so shell startup does not pay for the whole engine
+        from src import file_api as api
 
     if cmd == "touch":
         if not args:
             print("[ERROR] Missing filename for 'touch'")
             return
         try:
-            create_file(norm(args[0]))
+            api.create_file(norm(args[0]))
         except Exception as e:
             print(f"[ERROR] Failed to create file: {e}")
 
     elif cmd == "ls":
         try:
-            files = list_files()
+            files = api.list_files()
             if not files:
                 print("[INFO] Directory is empty")
             else:
@@ -43,7 +44,7 @@ def execute_command(cmd: str, args: list[str]):
             print("[ERROR] Missing filename for 'rm'")
             return
         try:
-            delete_file(norm(args[0]))
+            api.delete_file(norm(args[0]))
         except Exception as e:
             print(f"[ERROR] rm failed: {e}")
 
@@ -54,35 +55,230 @@ def execute_command(cmd: str, args: list[str]):
             return
         text, filename = args[0], norm(args[2])
         try:
-            # If file doesn’t exist, create it first
-            if filename.lstrip("/") not in list_files():
-                create_file(filename)
-            write_file(filename.lstrip("/"), text.encode())
+            try:
+                api.write_file(filename, text.encode())
+            except FileNotFoundError:
+                # Create on first write
+                api.create_file(filename)
+                api.write_file(filename, text.encode())
         except Exception as e:
             print(f"[ERROR] echo failed: {e}")
 
-
     elif cmd == "cat":
         if not args:
             print("[ERROR] Missing filename for 'cat'")
             return
-        filename = norm(args[0])
         try:
-            data = read_file(filename.lstrip("/"))
-            if data:
-                print(data.decode(errors="replace"))
-            else:
-                print("")  # empty file
+            # Stream chunk by chunk so large files never sit in memory whole
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for chunk in api.iter_file(norm(args[0])):
+                print(decoder.decode(chunk), end="")
+            print(decoder.decode(b"", final=True))
         except Exception as e:
             print(f"[ERROR] cat failed: {e}")
 
+    elif cmd == "put":
+        # Expect: put <host_path> <filename>
+        if len(args) < 2:
+            print("[ERROR] Usage: put <host_path> <filename>")
+            return
+        try:
+            stats = api.import_file(args[0], norm(args[1]))
+            print(f"[PUT] {stats['bytes']} bytes in {stats['seconds']:.3f}s ({stats['mb_per_s']:.2f} MB/s)")
+        except Exception as e:
+            print(f"[ERROR] put failed: {e}")
+
+    elif cmd == "get":
+        # Expect: get <filename> <host_path>
+        if len(args) < 2:
+            print("[ERROR] Usage: get <filename> <host_path>")
+            return
+        try:
+            stats = api.export_file(norm(args[0]), args[1])
+            print(f"[GET] {stats['bytes']} bytes in {stats['seconds']:.3f}s ({stats['mb_per_s']:.2f} MB/s)")
+        except Exception as e:
+            print(f"[ERROR] get failed: {e}")
+
+    elif cmd == "df":
+        try:
+            u = api.fs_usage()
+            bs = u["block_size"]
+            print(f"{'':8}{'total':>12}{'used':>12}{'free':>12}")
+            print(f"{'bytes':8}{u['total_blocks'] * bs:>12}{u['used_blocks'] * bs:>12}{u['free_blocks'] * bs:>12}")
+            print(f"{'blocks':8}{u['total_blocks']:>12}{u['used_blocks']:>12}{u['free_blocks']:>12}")
+            print(f"{'inodes':8}{u['total_inodes']:>12}{u['used_inodes']:>12}{u['free_inodes']:>12}")
+        except Exception as e:
+            print(f"[ERROR] df failed: {e}")
+
+    elif cmd == "du":
+        # du [filename ...]; no names = every file
+        try:
+            usage = api.disk_usage([norm(a) for a in args] if args else None)
+            for name, nbytes in usage.items():
+                print(f"{nbytes:>10}  {name}")
+            if len(usage) != 1:
+                print(f"{sum(usage.values()):>10}  total")
+        except Exception as e:
+            print(f"[ERROR] du failed: {e}")
+
+    elif cmd == "stat":
+        if not args:
+            print("[ERROR] Missing filename for 'stat'")
+            return
+        try:
+            meta = api.get_file_metadata(norm(args[0]))
+        except Exception as e:
+            print(f"[ERROR] stat failed: {e}")
+            return
+        if "error" in meta:
+            print(f"[ERROR] stat failed: {meta['error']}")
+            return
+        print(f"  File: {norm(args[0])}")
+        print(f"  Type: {meta['file_type']}  Inode: {meta['inode_number']}")
+        print(f"  Size: {meta['size_bytes']}  Blocks: {meta['allocated_blocks']}"
+              f"  Indirect: {'yes' if meta['has_indirect'] else 'no'}")
+        if meta.get("compression"):
+            print(f"  Compression: {meta['compression']}")
+
+    elif cmd == "fsck":
+        # fsck [-y]: -y repairs what it finds
+        repair = "-y" in args
+        try:
+            report = api.fsck(repair=repair)
+        except Exception as e:
+            print(f"[ERROR] fsck failed: {e}")
+            return
+        print(f"[FSCK] {report['blocks_checked']} blocks, {report['inodes_checked']} inodes checked")
+        if report["clean"]:
+            print("[FSCK] clean")
+            return
+        findings = (
+            ("leaked blocks", report["leaked_blocks"]),
+            ("unmarked blocks", report["unmarked_blocks"]),
+            ("double-allocated blocks", report["double_allocated"]),
+            ("refcount mismatches", report["refcount_mismatches"]),
+            ("inodes with bad pointers", report["bad_pointers"]),
+            ("orphan inodes", report["orphan_inodes"]),
+            ("dangling entries", report["dangling_entries"]),
+        )
+        for label, found in findings:
+            if found:
+                shown = ", ".join(str(x) for x in list(found)[:10])
+                more = f" (+{len(found) - 10} more)" if len(found) > 10 else ""
+                print(f"  {label + ':':26}{len(found):>8}  {shown}{more}")
+        if not repair:
+            print("[FSCK] run 'fsck -y' to repair")
+        elif report["unrepaired"]:
+            for problem in report["unrepaired"]:
+                print(f"[FSCK] not repaired: {problem}")
+        else:
+            print("[FSCK] repaired")
+
+    elif cmd == "frag":
+        # frag [filename ...]: extents per file and free-space fragmentation
+        try:
+            report = api.fragmentation([norm(a) for a in args] if args else None)
+        except Exception as e:
+            print(f"[ERROR] frag failed: {e}")
+            return
+        for name, extents in report["per_file"].items():
+            print(f"{extents:>8}  {name}")
+        print(f"[FRAG] {report['files']} files, {report['fragmented_files']} fragmented, "
+              f"{report['extents_per_file']:.2f} extents/file (max {report['max_extents']})")
+        for extents, files in report["histogram"].items():
+            print(f"  {extents:>6} extents: {files} files")
+        print(f"[FRAG] free: {report['free_blocks']} blocks in {report['free_extents']} runs, "
+              f"largest {report['largest_free_extent']} ({report['free_space_fragmentation'] * 100:.1f}% fragmented)")
+
+    elif cmd == "defrag":
+        # defrag [max_blocks]: relocate fragmented files, copying at most max_blocks blocks
+        try:
+            budget = int(args[0]) if args else None
+            result = api.defragment(budget_blocks=budget)
+        except Exception as e:
+            print(f"[ERROR] defrag failed: {e}")
+            return
+        left = f", {result['remaining']} files left" if result["remaining"] else ""
+        print(f"[DEFRAG] {result['files_moved']} files, {result['blocks_moved']} blocks moved{left}")
+        for name, reason in result["skipped"].items():
+            print(f"  skipped {name}: {reason}")
+
+    elif cmd == "journal":
+        # journal: metadata journal counters of the mounted image
+        from src.persistence import journal
+        j = journal.journal_stats()
+        if not j:
+            print("[JOURNAL] image has no journal")
+            return
+        factor = j["operations"] / j["transactions"] if j["transactions"] else 0.0
+        print(f"[JOURNAL] {j['journal_blocks']} blocks, {j['transactions']} commits of {j['operations']} operations "
+              f"({factor:.1f} per commit), {j['blocks_logged']} blocks logged")
+        print(f"[JOURNAL] {j['checkpoints']} checkpoints wrote {j['blocks_checkpointed']} blocks home, "
+              f"{j['pending_checkpoint']} commits pending")
+
+    elif cmd == "stats":
+        # stats | stats reset | stats dump <file> [json|prometheus]
+        from src.common import metrics
+        try:
+            if args and args[0] == "reset":
+                metrics.reset()
+                print("[INFO] Metrics reset")
+            elif args and args[0] == "dump":
+                if len(args) < 2:
+                    print("[ERROR] Usage: stats dump <file> [json|prometheus]")
+                    return
+                fmt = metrics.dump(args[1], args[2] if len(args) > 2 else None)
+                print(f"[INFO] Metrics written to {args[1]} ({fmt})")
+            else:
+                rows = metrics.snapshot()
+                if not rows:
+                    print("[INFO] No operations recorded")
+                    return
+                print(f"{'layer/op':28}{'calls':>9}{'mean us':>10}{'p99 us':>10}{'blk rd':>9}{'blk wr':>9}")
+                for r in rows:
+                    print(f"{r['layer'] + '/' + r['op']:28}{r['calls']:>9}{r['mean_us']:>10.1f}"
+                          f"{r['p99_us']:>10.0f}{r['blocks_read']:>9}{r['blocks_written']:>9}")
+        except Exception as e:
+            print(f"[ERROR] stats failed: {e}")
+
+    elif cmd == "trace":
+        # trace start | trace stop <file.json>
+        from src.common import tracing
+        if args and args[0] == "start":
+            tracing.install(tracing.ChromeTracer())
+            print("[INFO] Tracing started")
+        elif len(args) >= 2 and args[0] == "stop":
+            tracer = tracing.active()
+            tracing.install(None)
+            if not isinstance(tracer, tracing.ChromeTracer):
+                print("[ERROR] Tracing is not running")
+                return
+            try:
+                count = tracer.export(args[1])
+                print(f"[INFO] {count} trace events written to {args[1]}")
+            except Exception as e:
+                print(f"[ERROR] trace failed: {e}")
+        else:
+            print("[ERROR] Usage: trace start | trace stop <file.json>")
+
     elif cmd == "help":
         print("Available commands:")
         print("  touch <filename>         - Create an empty file")
         print("  echo <text> > <filename> - Write text to a file (creates if missing)")
         print("  cat <filename>           - Display file contents")
         print("  rm <filename>            - Delete a file")
+        print("  put <host_path> <name>   - Import a host file (streamed)")
+        print("  get <name> <host_path>   - Export a file to the host (streamed)")
         print("  ls                       - List files")
+        print("  df                       - Show free/used blocks and inodes")
+        print("  du [filename ...]        - Show storage allocated per file")
+        print("  stat <filename>          - Show file metadata")
+        print("  fsck [-y]                - Check consistency (-y: repair)")
+        print("  frag [filename ...]      - Show extents per file and free-space fragmentation")
+        print("  defrag [max_blocks]      - Make fragmented files contiguous (bounded by max_blocks)")
+        print("  journal                  - Show metadata journal commits and checkpoints")
+        print("  stats [reset|dump <file>] - Show per-layer I/O counters and latency")
+        print("  trace start|stop <file>  - Record spans and block I/O as a Chrome trace")
         print("  exit                     - Exit the simulator")
 
     else:
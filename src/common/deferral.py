@@ -0,0 +1,26 @@
+# src/common/deferral.py
+# Per-thread switch that lets metadata layers hold their write-back until a batch commits.
+# Layers check deferring() and mark themselves dirty instead of writing; whoever opened the
+# outermost scope flushes them afterwards (see src/file_api/batch.py). Only the thread running
+# the batch defers: other threads keep writing through, and their write-back simply carries
+# whatever the batch has changed so far along with it.
+
+import threading
+
+class _Scope(threading.local):
+    depth = 0
+
+_SCOPE = _Scope()
+
+def deferring() -> bool:
+    return _SCOPE.depth > 0
+
+def enter() -> None:
+    _SCOPE.depth += 1
+
+def leave() -> bool:
+    """
+    Close one deferral scope of the calling thread. Returns True when its outermost scope closed.
+    """
+    _SCOPE.depth -= 1
+    return _SCOPE.depth == 0
@@ -0,0 +1,72 @@
+# src/common/locks.py
+# Synchronization primitives shared by the engine layers.
+
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+class RWLock:
+    """
+    Reader/writer lock: any number of concurrent readers, or one writer.
+    Writer-preferring, so a steady stream of readers cannot starve a waiting writer.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self) -> None:
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+# One RWLock per inode number, created on first use.
+_INODE_LOCKS: Dict[int, RWLock] = {}
+_INODE_LOCKS_GUARD = threading.Lock()
+
+def inode_lock(inode_number: int) -> RWLock:
+    lock = _INODE_LOCKS.get(inode_number)
+    if lock is None:
+        with _INODE_LOCKS_GUARD:
+            lock = _INODE_LOCKS.setdefault(inode_number, RWLock())
+    return lock
@@ -0,0 +1,289 @@
+# src/common/metrics.py
+# Always-on per-layer operation metrics: call counts, latency histograms, and the disk blocks /
+# bytes each operation caused.
+#
+# Layers decorate their entry points with @timed(layer, op). While such a call runs it is the
+# innermost scope of its thread, and every block the disk layer reads or writes is charged to
+# it (record_io), so a block written by _write_bitmap inside file_api.write_file counts
+# towards bitmap/save, not file_api/write. Latency is inclusive of nested scopes.
+# The same decorated entry points feed an optional span tracer (see src/common/tracing.py).
+# Histograms use power-of-two microsecond buckets. Recording is a few integer updates in a
+# per-thread cell with no lock, cheap enough to leave enabled (FS_METRICS=0 turns it off).
+
+import functools
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Bucket i counts calls that took < 2**i microseconds; the last bucket is unbounded
+BUCKET_BOUNDS_US: Tuple[int, ...] = tuple(2 ** i for i in range(22))
+_LAST_BUCKET = len(BUCKET_BOUNDS_US)
+
+# Layout of a per-thread cell: fixed counters, then the histogram buckets
+(_CALLS, _TOTAL_NS, _MAX_NS, _BLOCKS_READ, _BYTES_READ, _BLOCKS_WRITTEN, _BYTES_WRITTEN,
+ _LOGICAL_READ, _LOGICAL_WRITTEN) = range(9)
+_BUCKETS = 9
+_CELL_SIZE = _BUCKETS + len(BUCKET_BOUNDS_US) + 1
+
+class OpStats:
+    """
+    Registry entry for one (layer, op). Each thread updates a private cell, so the hot path
+    takes no lock; readers sum the cells of every thread that ever recorded the op.
+    """
+
+    def __init__(self, layer: str, op: str, key: int):
+        self.layer = layer
+        self.op = op
+        self.key = key
+        self.cells: List[List[int]] = []
+
+    def new_cell(self, state: "_PerThread") -> List[int]:
+        cell = state.cells[self.key] = [0] * _CELL_SIZE
+        with _LOCK:
+            self.cells.append(cell)
+        return cell
+
+    def totals(self) -> List[int]:
+        merged = [0] * _CELL_SIZE
+        for cell in list(self.cells):
+            for i, value in enumerate(cell):
+                merged[i] = max(merged[i], value) if i == _MAX_NS else merged[i] + value
+        return merged
+
+    def reset(self) -> None:
+        for cell in self.cells:
+            cell[:] = [0] * _CELL_SIZE
+
+    def as_dict(self) -> Dict:
+        t = self.totals()
+        calls, max_us = t[_CALLS], t[_MAX_NS] / 1000.0
+        buckets = t[_BUCKETS:]
+        return {
+            "layer": self.layer,
+            "op": self.op,
+            "calls": calls,
+            "blocks_read": t[_BLOCKS_READ],
+            "bytes_read": t[_BYTES_READ],
+            "blocks_written": t[_BLOCKS_WRITTEN],
+            "bytes_written": t[_BYTES_WRITTEN],
+            "logical_bytes_read": t[_LOGICAL_READ],
+            "logical_bytes_written": t[_LOGICAL_WRITTEN],
+            "total_us": t[_TOTAL_NS] / 1000.0,
+            "mean_us": t[_TOTAL_NS] / calls / 1000.0 if calls else 0.0,
+            "p50_us": _quantile_us(buckets, calls, max_us, 0.50),
+            "p90_us": _quantile_us(buckets, calls, max_us, 0.90),
+            "p99_us": _quantile_us(buckets, calls, max_us, 0.99),
+            "max_us": max_us,
+            "histogram_us": {str(b): n for b, n in zip(BUCKET_BOUNDS_US + ("inf",), buckets) if n},
+        }
+
+def _quantile_us(buckets: List[int], calls: int, max_us: float, q: float) -> float:
+    """
+    Upper bound of the histogram bucket holding the q-quantile, capped at the largest sample.
+    """
+    if not calls:
+        return 0.0
+    seen = 0
+    for i, count in enumerate(buckets):
+        seen += count
+        if count and seen >= q * calls:
+            return min(float(BUCKET_BOUNDS_US[i]), max_us) if i < _LAST_BUCKET else max_us
+    return max_us
+
+class _PerThread:
+    __slots__ = ("scopes", "cells")
+
+    def __init__(self):
+        self.scopes: List[OpStats] = []
+        self.cells: Dict[int, List[int]] = {}
+
+class _ThreadState(threading.local):
+    def __init__(self):
+        self.mine = _PerThread()
+
+_REGISTRY: Dict[Tuple[str, str], OpStats] = {}
+_LOCK = threading.Lock()
+_STATE = _ThreadState()
+_ENABLED = os.environ.get("FS_METRICS", "1") != "0"
+# Span sink installed by src.common.tracing; None keeps tracing down to one global read per call
+_TRACER = None
+
+def enabled() -> bool:
+    return _ENABLED
+
+def set_enabled(flag: bool) -> None:
+    global _ENABLED
+    _ENABLED = bool(flag)
+
+def set_tracer(tracer) -> None:
+    global _TRACER
+    _TRACER = tracer
+
+def stats_for(layer: str, op: str) -> OpStats:
+    key = (layer, op)
+    stats = _REGISTRY.get(key)
+    if stats is None:
+        with _LOCK:
+            stats = _REGISTRY.get(key)
+            if stats is None:
+                stats = _REGISTRY[key] = OpStats(layer, op, len(_REGISTRY))
+    return stats
+
+def _observe(cell: List[int], elapsed_ns: int) -> None:
+    cell[_CALLS] += 1
+    cell[_TOTAL_NS] += elapsed_ns
+    if elapsed_ns > cell[_MAX_NS]:
+        cell[_MAX_NS] = elapsed_ns
+    index = (elapsed_ns // 1000).bit_length()
+    cell[_BUCKETS + (index if index < _LAST_BUCKET else _LAST_BUCKET)] += 1
+
+def timed(layer: str, op: str):
+    """
+    Decorator: count and time calls of the function as (layer, op) and charge the disk I/O
+    it performs (outside nested timed calls) to it.
+    """
+    def decorate(fn):
+        stats = stats_for(layer, op)
+        key = stats.key
+        clock = time.perf_counter_ns
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _TRACER
+            if not _ENABLED and tracer is None:
+                return fn(*args, **kwargs)
+            mine = _STATE.mine
+            scopes = mine.scopes
+            scopes.append(stats)
+            if tracer is not None:
+                tracer.begin(layer, op, args)
+            started = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = clock() - started
+                scopes.pop()
+                if tracer is not None:
+                    tracer.end(layer, op, started, elapsed)
+                if _ENABLED:
+                    # _observe inlined: this runs on every metadata operation
+                    cell = mine.cells.get(key) or stats.new_cell(mine)
+                    cell[_CALLS] += 1
+                    cell[_TOTAL_NS] += elapsed
+                    if elapsed > cell[_MAX_NS]:
+                        cell[_MAX_NS] = elapsed
+                    index = (elapsed // 1000).bit_length()
+                    cell[_BUCKETS + (index if index < _LAST_BUCKET else _LAST_BUCKET)] += 1
+
+        return wrapper
+    return decorate
+
+def record_io(stats: OpStats, started_ns: int, block: int, blocks_read: int = 0, bytes_read: int = 0,
+              blocks_written: int = 0, bytes_written: int = 0) -> None:
+    """
+    Account one disk call starting at 'block': its own latency and volume under 'stats', and
+    the volume again under the innermost timed scope of the calling thread, if any.
+    """
+    tracer = _TRACER
+    if not _ENABLED and tracer is None:
+        return
+    elapsed = time.perf_counter_ns() - started_ns
+    if tracer is not None:
+        tracer.io(stats.op, block, blocks_read or blocks_written, bool(blocks_written), started_ns, elapsed)
+        if not _ENABLED:
+            return
+    mine = _STATE.mine
+    cell = mine.cells.get(stats.key) or stats.new_cell(mine)
+    _observe(cell, elapsed)
+    cell[_BLOCKS_READ] += blocks_read
+    cell[_BYTES_READ] += bytes_read
+    cell[_BLOCKS_WRITTEN] += blocks_written
+    cell[_BYTES_WRITTEN] += bytes_written
+    if mine.scopes:
+        owner = mine.scopes[-1]
+        cell = mine.cells.get(owner.key) or owner.new_cell(mine)
+        cell[_BLOCKS_READ] += blocks_read
+        cell[_BYTES_READ] += bytes_read
+        cell[_BLOCKS_WRITTEN] += blocks_written
+        cell[_BYTES_WRITTEN] += bytes_written
+
+def record_logical(stats: OpStats, read: int = 0, written: int = 0) -> None:
+    """
+    Count file bytes an API call returned to or accepted from its caller, so physical block
+    traffic can be set against it (write amplification).
+    """
+    if not _ENABLED:
+        return
+    mine = _STATE.mine
+    cell = mine.cells.get(stats.key) or stats.new_cell(mine)
+    cell[_LOGICAL_READ] += read
+    cell[_LOGICAL_WRITTEN] += written
+
+def snapshot() -> List[Dict]:
+    """
+    Metrics of every operation called at least once, ordered by layer and op.
+    """
+    with _LOCK:
+        items = [s for _, s in sorted(_REGISTRY.items())]
+    return [d for d in (s.as_dict() for s in items) if d["calls"]]
+
+def reset() -> None:
+    with _LOCK:
+        for stats in _REGISTRY.values():
+            stats.reset()
+
+def to_json() -> str:
+    return json.dumps({"metrics": snapshot()}, indent=2)
+
+def to_prometheus() -> str:
+    """
+    Render the registry in the Prometheus text exposition format.
+    """
+    counters = (
+        ("fs_op_calls_total", _CALLS, "Operation calls."),
+        ("fs_op_blocks_read_total", _BLOCKS_READ, "Disk blocks read on behalf of the operation."),
+        ("fs_op_bytes_read_total", _BYTES_READ, "Disk bytes read on behalf of the operation."),
+        ("fs_op_blocks_written_total", _BLOCKS_WRITTEN, "Disk blocks written on behalf of the operation."),
+        ("fs_op_bytes_written_total", _BYTES_WRITTEN, "Disk bytes written on behalf of the operation."),
+        ("fs_op_logical_bytes_read_total", _LOGICAL_READ, "File bytes returned to callers."),
+        ("fs_op_logical_bytes_written_total", _LOGICAL_WRITTEN, "File bytes accepted from callers."),
+    )
+    with _LOCK:
+        items = [s for _, s in sorted(_REGISTRY.items())]
+    rows = [(f'layer="{s.layer}",op="{s.op}"', t) for s, t in ((s, s.totals()) for s in items) if t[_CALLS]]
+    lines: List[str] = []
+    for name, index, help_text in counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, t in rows:
+            lines.append(f"{name}{{{labels}}} {t[index]}")
+    lines.append("# HELP fs_op_latency_seconds Operation latency.")
+    lines.append("# TYPE fs_op_latency_seconds histogram")
+    for labels, t in rows:
+        cumulative = 0
+        for bound, count in zip(BUCKET_BOUNDS_US, t[_BUCKETS:]):
+            cumulative += count
+            lines.append(f'fs_op_latency_seconds_bucket{{{labels},le="{bound / 1e6:g}"}} {cumulative}')
+        lines.append(f'fs_op_latency_seconds_bucket{{{labels},le="+Inf"}} {t[_CALLS]}')
+        lines.append(f"fs_op_latency_seconds_sum{{{labels}}} {t[_TOTAL_NS] / 1e9:.9f}")
+        lines.append(f"fs_op_latency_seconds_count{{{labels}}} {t[_CALLS]}")
+    return "\n".join(lines) + "\n"
+
+def dump(path: str, fmt: Optional[str] = None) -> str:
+    """
+    Write the registry to 'path' as 'json' or 'prometheus' (default: by extension, .prom/.txt
+    mean Prometheus). The file is replaced atomically so a textfile collector never sees a
+    partial dump. Returns the format used.
+    """
+    if fmt is None:
+        fmt = "prometheus" if path.endswith((".prom", ".txt")) else "json"
+    if fmt not in ("json", "prometheus"):
+        raise ValueError("format must be 'json' or 'prometheus'")
+    text = to_json() + "\n" if fmt == "json" else to_prometheus()
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return fmt
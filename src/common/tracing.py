@@ -0,0 +1,140 @@
+# src/common/tracing.py
+# Optional span tracing over the engine's @timed entry points (see metrics.py), with a
+# Chrome trace-event exporter (load the JSON in chrome://tracing or https://ui.perfetto.dev).
+#
+# A tracer receives begin/end for every timed call and io for every disk access, on the
+# calling thread. Nothing is installed by default; the decorated calls then only pay one
+# global read. Spans carry the blocks their own code read and wrote (I/O of nested spans
+# stays with the nested span), so one write_file shows each bitmap save and inode rewrite
+# as a child span with its block numbers.
+
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from src.common import metrics
+
+class Tracer:
+    """
+    Base class for span sinks. Subclasses override any of the three hooks.
+    """
+
+    def begin(self, layer: str, op: str, args: tuple) -> None:
+        pass
+
+    def end(self, layer: str, op: str, started_ns: int, elapsed_ns: int) -> None:
+        pass
+
+    def io(self, op: str, block: int, count: int, write: bool, started_ns: int, elapsed_ns: int) -> None:
+        pass
+
+def _target(args: tuple) -> Any:
+    """
+    Short description of what a call works on: a file name, inode or block number.
+    """
+    for arg in args[:2]:
+        if isinstance(arg, (str, int)) and not isinstance(arg, bool):
+            return arg
+        number = getattr(arg, "inode_number", None)
+        if number is not None:
+            return number
+    return None
+
+class ChromeTracer(Tracer):
+    """
+    Collect spans as Chrome trace events ('X' complete events, microsecond timestamps).
+    At most 'max_events' are kept; later ones are counted in 'dropped'.
+    """
+
+    def __init__(self, max_events: int = 1_000_000):
+        self.max_events = max_events
+        self.events: List[Dict] = []
+        self.dropped = 0
+        self._origin = time.perf_counter_ns()
+        self._local = threading.local()
+        self._threads: Dict[int, str] = {}
+
+    def _stack(self) -> List[Dict]:
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            self._threads[threading.get_ident()] = threading.current_thread().name
+            return self._local.stack
+
+    def _emit(self, event: Dict) -> None:
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        self.events.append(event)
+
+    def begin(self, layer: str, op: str, args: tuple) -> None:
+        span_args: Dict[str, Any] = {}
+        target = _target(args)
+        if target is not None:
+            span_args["target"] = target
+        self._stack().append(span_args)
+
+    def end(self, layer: str, op: str, started_ns: int, elapsed_ns: int) -> None:
+        span_args = self._stack().pop()
+        self._emit({
+            "name": f"{layer}.{op}", "cat": layer, "ph": "X",
+            "ts": (started_ns - self._origin) / 1000.0, "dur": elapsed_ns / 1000.0,
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": span_args,
+        })
+
+    def io(self, op: str, block: int, count: int, write: bool, started_ns: int, elapsed_ns: int) -> None:
+        stack = self._stack()
+        if stack:
+            blocks = range(block, block + count)
+            stack[-1].setdefault("blocks_written" if write else "blocks_read", []).extend(blocks)
+        self._emit({
+            "name": f"disk.{op}", "cat": "disk", "ph": "X",
+            "ts": (started_ns - self._origin) / 1000.0, "dur": elapsed_ns / 1000.0,
+            "pid": os.getpid(), "tid": threading.get_ident(),
+            "args": {"block": block, "count": count},
+        })
+
+    def to_chrome(self) -> Dict:
+        pid = os.getpid()
+        names = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                 for tid, name in self._threads.items()]
+        return {
+            "traceEvents": names + sorted(self.events, key=lambda e: (e["ts"], -e["dur"])),
+            "displayTimeUnit": "ns",
+            "otherData": {"dropped_events": self.dropped},
+        }
+
+    def export(self, path: str) -> int:
+        """
+        Write the Chrome trace JSON to 'path'. Returns the number of span/IO events written.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome(), f)
+        return len(self.events)
+
+def install(tracer: Optional[Tracer]) -> None:
+    """
+    Route spans of every @timed call to 'tracer' (None turns tracing off).
+    """
+    metrics.set_tracer(tracer)
+
+def active() -> Optional[Tracer]:
+    return metrics._TRACER
+
+@contextlib.contextmanager
+def tracing(path: Optional[str] = None, tracer: Optional[Tracer] = None) -> Iterator[Tracer]:
+    """
+    Trace the enclosed block; with 'path' a ChromeTracer's events are exported there on exit.
+    """
+    tracer = tracer or ChromeTracer()
+    previous = active()
+    install(tracer)
+    try:
+        yield tracer
+    finally:
+        install(previous)
+        if path and isinstance(tracer, ChromeTracer):
+            tracer.export(path)
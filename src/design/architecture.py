@@ -28,6 +28,9 @@ class Inode:
     modified_at: datetime = field(default_factory=datetime.utcnow)
     direct_blocks: List[Optional[int]] = field(default_factory=lambda: [None]*10)
     indirect_block: Optional[int] = None
+    double_indirect_block: Optional[int] = None
+    triple_indirect_block: Optional[int] = None
+    compression: str = ""         # '' (stored as-is), 'zlib' or 'lzma'
 
 # Directory entry logical structure
 @dataclass
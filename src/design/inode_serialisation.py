@@ -1,4 +1,8 @@
+import calendar
 import struct
+from datetime import datetime
+from src.design.architecture import Inode as LogicalInode
+from src.common.metrics import timed
 
 # File type constants
 FILE_TYPE_REGULAR = 1
@@ -10,7 +14,7 @@ INODE_SIZE = 128
 class Inode:
     def __init__(self, file_type, size, direct_blocks,
                  single_indirect, double_indirect, triple_indirect,
-                 link_count, uid, gid, mode, ctime, mtime, atime):
+                 link_count, uid, gid, mode, ctime, mtime, atime, codec=0):
         self.file_type = file_type
         self.size = size
         self.direct_blocks = direct_blocks
@@ -24,11 +28,27 @@ class Inode:
         self.ctime = ctime
         self.mtime = mtime
         self.atime = atime
+        self.codec = codec
 
-def inode_to_bytes(inode: Inode) -> bytes:
-    # Pack exactly 14 fields
+# Trailing H is the compression codec; older records carry zero padding there, i.e. none.
+INODE_FORMAT = "<I I 12i i i i I I I I I I I H"
+DIRECT_POINTERS = 12
+
+# Logical (engine) file types <-> on-disk type codes
+_TYPE_CODES = {"file": FILE_TYPE_REGULAR, "dir": FILE_TYPE_DIR}
+_TYPE_NAMES = {code: name for name, code in _TYPE_CODES.items()}
+
+# Logical compression names <-> on-disk codec codes
+_CODEC_CODES = {"zlib": 1, "lzma": 2}
+_CODEC_NAMES = {code: name for name, code in _CODEC_CODES.items()}
+
+@timed("inode", "encode")
+def inode_to_bytes(inode) -> bytes:
+    if isinstance(inode, LogicalInode):
+        inode = _from_logical(inode)
+    # Pack exactly 15 fields
     data = struct.pack(
-        "<I I 12i i i i I I I I I I I",
+        INODE_FORMAT,
         inode.file_type,
         inode.size,
         *inode.direct_blocks,
@@ -42,5 +62,67 @@ def inode_to_bytes(inode: Inode) -> bytes:
         inode.ctime,
         inode.mtime,
         inode.atime,
+        getattr(inode, "codec", 0),
     )
     return data.ljust(INODE_SIZE, b"\x00")
+
+def _ptr(block) -> int:
+    return -1 if block is None else int(block)
+
+def _from_logical(inode: LogicalInode) -> Inode:
+    """
+    Map an engine-level inode onto the on-disk record. None pointers are stored as -1.
+    """
+    direct = list(inode.direct_blocks or [])
+    while direct and direct[-1] is None:
+        direct.pop()
+    if len(direct) > DIRECT_POINTERS:
+        raise ValueError(f"File exceeds {DIRECT_POINTERS} direct blocks")
+    direct = [_ptr(b) for b in direct] + [-1] * (DIRECT_POINTERS - len(direct))
+    ctime = calendar.timegm(inode.created_at.utctimetuple()) if inode.created_at else 0
+    mtime = calendar.timegm(inode.modified_at.utctimetuple()) if inode.modified_at else 0
+    file_type = _TYPE_CODES.get(inode.file_type, 0) if inode.file_type else 0
+    return Inode(
+        file_type=file_type,
+        size=inode.file_size,
+        direct_blocks=direct,
+        single_indirect=_ptr(inode.indirect_block),
+        double_indirect=_ptr(inode.double_indirect_block),
+        triple_indirect=_ptr(inode.triple_indirect_block),
+        link_count=1 if file_type else 0,
+        uid=0,
+        gid=0,
+        mode=0o755 if file_type == FILE_TYPE_DIR else 0o644,
+        ctime=ctime, mtime=mtime, atime=mtime,
+        codec=_CODEC_CODES.get(inode.compression, 0) if inode.compression else 0,
+    )
+
+@timed("inode", "decode")
+def bytes_to_inode(buf: bytes, inode_number: int = 0) -> LogicalInode:
+    """
+    Decode an on-disk inode record into the engine-level inode.
+    Block 0 is the superblock, so both 0 (never-written slot) and -1 decode as "no block".
+    An all-zero record decodes to a free inode (empty file_type).
+    """
+    fields = struct.unpack(INODE_FORMAT, buf[:struct.calcsize(INODE_FORMAT)])
+    file_type, size = fields[0], fields[1]
+    direct = [b if b > 0 else None for b in fields[2:2 + DIRECT_POINTERS]]
+    single_indirect, double_indirect, triple_indirect = fields[2 + DIRECT_POINTERS:5 + DIRECT_POINTERS]
+    ctime, mtime, codec = fields[-4], fields[-3], fields[-1]
+    if file_type == 0:
+        name = ""
+    else:
+        # Unknown codes stay non-empty so the slot is never handed out as free.
+        name = _TYPE_NAMES.get(file_type, "reserved")
+    return LogicalInode(
+        inode_number=inode_number,
+        file_type=name,
+        file_size=size,
+        created_at=datetime.utcfromtimestamp(ctime),
+        modified_at=datetime.utcfromtimestamp(mtime),
+        direct_blocks=direct,
+        indirect_block=single_indirect if single_indirect > 0 else None,
+        double_indirect_block=double_indirect if double_indirect > 0 else None,
+        triple_indirect_block=triple_indirect if triple_indirect > 0 else None,
+        compression=_CODEC_NAMES.get(codec, ""),
+    )
@@ -22,11 +22,31 @@ class SuperblockLayout:
     data_start_block: int
     root_inode_number: int = 0
     checksum: Optional[int] = 0
+    # Free-space counters; only trusted when 'clean' is set (written at unmount, cleared at mount)
+    free_blocks: int = 0
+    free_inodes: int = 0
+    clean: int = 0
+    # Clean-unmount summary (trusted under the same rule, 0 = unknown): where the block and inode
+    # allocators resume their next-fit scans, and the root directory's block
+    block_hint: int = 0
+    inode_hint: int = 0
+    dir_block: int = 0
+    # Write-ahead metadata journal between the bitmap and the data region (0 blocks = none)
+    journal_start_block: int = 0
+    journal_blocks: int = 0
+
+_FIELDS_FORMAT = "<I I Q I I I I I I I I I"
+_COUNTERS_FORMAT = "<I I I"
+_COUNTERS_OFFSET = struct.calcsize(_FIELDS_FORMAT) + 4
+_SUMMARY_FORMAT = "<I I I"
+_SUMMARY_OFFSET = _COUNTERS_OFFSET + struct.calcsize(_COUNTERS_FORMAT)
+_JOURNAL_FORMAT = "<I I"
+_JOURNAL_OFFSET = _SUMMARY_OFFSET + struct.calcsize(_SUMMARY_FORMAT)
 
 def to_bytes(sb: SuperblockLayout) -> bytes:
     # pack first fields, rest reserved/pad to 512
     packed = struct.pack(
-        "<I I Q I I I I I I I I I",
+        _FIELDS_FORMAT,
         sb.magic,
         sb.version,
         sb.total_size_bytes,
@@ -42,10 +62,21 @@ def to_bytes(sb: SuperblockLayout) -> bytes:
     )
     # append checksum as 4 bytes
     packed += struct.pack("<I", sb.checksum or 0)
+    packed += struct.pack(_COUNTERS_FORMAT, sb.free_blocks, sb.free_inodes, sb.clean)
+    packed += struct.pack(_SUMMARY_FORMAT, sb.block_hint, sb.inode_hint, sb.dir_block)
+    packed += struct.pack(_JOURNAL_FORMAT, sb.journal_start_block, sb.journal_blocks)
     return packed.ljust(SUPERBLOCK_SIZE, b"\x00")
 
 def from_bytes(buf: bytes) -> SuperblockLayout:
     if len(buf) != SUPERBLOCK_SIZE:
         raise ValueError("Invalid superblock size")
-    parts = struct.unpack("<I I Q I I I I I I I I I", buf[:(4+4+8+4+4+4+4+4+4+4+4+4)])
-    return SuperblockLayout(*parts, checksum=0)
\ No newline at end of file
+    parts = struct.unpack(_FIELDS_FORMAT, buf[:struct.calcsize(_FIELDS_FORMAT)])
+    free_blocks, free_inodes, clean = struct.unpack(
+        _COUNTERS_FORMAT, buf[_COUNTERS_OFFSET:_COUNTERS_OFFSET + struct.calcsize(_COUNTERS_FORMAT)])
+    block_hint, inode_hint, dir_block = struct.unpack(
+        _SUMMARY_FORMAT, buf[_SUMMARY_OFFSET:_SUMMARY_OFFSET + struct.calcsize(_SUMMARY_FORMAT)])
+    journal_start_block, journal_blocks = struct.unpack(
+        _JOURNAL_FORMAT, buf[_JOURNAL_OFFSET:_JOURNAL_OFFSET + struct.calcsize(_JOURNAL_FORMAT)])
+    return SuperblockLayout(*parts, checksum=0, free_blocks=free_blocks, free_inodes=free_inodes, clean=clean,
+                            block_hint=block_hint, inode_hint=inode_hint, dir_block=dir_block,
+                            journal_start_block=journal_start_block, journal_blocks=journal_blocks)
\ No newline at end of file
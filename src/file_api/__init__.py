@@ -2,10 +2,20 @@
 
 from .create import create_file
 from .delete import delete_file
+from .clone import clone_file
+from .transfer import import_file, export_file
+from .batch import batch, create_many
+from .fsck import fsck
+from .defrag import fragmentation, defragment
 from .files import (
     list_files,
     get_file_metadata,
+    stat_many,
+    fs_usage,
+    disk_usage,
     write_file,
     read_file,
+    iter_file,
+    set_compression,
     truncate_file,
 )
\ No newline at end of file
@@ -0,0 +1,65 @@
+# src/file_api/batch.py
+# Batched ingest: many creates/writes share one round of metadata write-back.
+# Inside batch() the bitmap, refcount table, inode table and directory keep their changes in
+# memory; the outermost scope flushes each structure once on the way out. Data blocks are still
+# written immediately. There is no rollback: an exception inside the batch still flushes what
+# completed, exactly as if the same calls had been made one by one.
+# On a journaled image the flush is one journal operation, so it commits atomically as long as
+# its metadata fits in the journal: after a crash either all of it is there or none. A batch
+# that changes more blocks than the journal holds is written home directly and loses that
+# guarantee (counted as "oversized" in journal_stats()). The batch holds no journal handle
+# while its body runs, so a long ingest never keeps a transaction open past COMMIT_INTERVAL
+# and stalls other threads' operations; the calls inside it commit their own (metadata-free)
+# transactions, and writes by other threads may carry part of the batch's changes with them.
+
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Tuple
+from src.common import deferral
+from src.common.metrics import timed
+from src.persistence.journal import transaction
+from src.persistence.mount import STATE
+from src.block_bitmap.bitmap import flush_bitmap
+from src.block_bitmap.refcount import flush_refcounts
+from src.block_bitmap.dedup import flush_dedup_index
+from src.inode_directory.inode_table import flush_deferred_inodes
+from src.inode_directory.resolver import flush_directory
+from .create import create_file
+from .files import write_file
+
+@timed("file_api", "batch_commit")
+def _flush_all() -> None:
+    # Refcounts and the dedup index first: allocating their tables on first use dirties the bitmap again
+    flush_refcounts()
+    flush_dedup_index()
+    flush_bitmap()
+    flush_deferred_inodes()
+    flush_directory()
+
+@contextmanager
+def batch() -> Iterator[None]:
+    """
+    Defer metadata writes until the block exits. Nested batches flush only at the outermost exit.
+    """
+    if not STATE.get("mounted"):
+        raise RuntimeError("Disk not mounted. Call mount() first.")
+    deferral.enter()
+    try:
+        yield
+    finally:
+        if deferral.leave():
+            with transaction():
+                _flush_all()
+
+def create_many(items: Iterable[Tuple[str, bytes]]) -> List[int]:
+    """
+    Create and fill each (filename, data) pair inside a single batch.
+    Returns the inode numbers in input order.
+    """
+    inodes: List[int] = []
+    with batch():
+        for filename, data in items:
+            inum = create_file(filename)
+            if data:
+                write_file(filename, data)
+            inodes.append(inum)
+    return inodes
@@ -0,0 +1,40 @@
+# src/file_api/clone.py
+# Copy-on-write file clones: the copy shares the source's data blocks until either side writes.
+
+from src.common.locks import inode_lock
+from src.common.metrics import timed
+from src.persistence.journal import journaled
+from src.persistence.mount import STATE
+from src.inode_directory.resolver import resolve, get_inode, update_inode
+from src.block_bitmap.refcount import share_blocks
+from .create import create_file
+
+@timed("file_api", "clone")
+@journaled
+def clone_file(src: str, dst: str) -> int:
+    """
+    Create 'dst' as a reflink copy of 'src' and return its inode number.
+    Only metadata is written: the block map is copied and every data block gains a reference.
+    Writes to either file later copy the affected block first (see fileio._write_range).
+    """
+    if not STATE.get("mounted"):
+        raise RuntimeError("Disk not mounted. Call mount() first.")
+
+    src_inum = resolve(src)
+    if src_inum is None:
+        raise FileNotFoundError(f"'{src}' not found")
+    if getattr(get_inode(src_inum), "file_type", "file") != "file":
+        raise IsADirectoryError(f"'{src}' is a directory")
+
+    dst_inum = create_file(dst)
+    with inode_lock(src_inum).read(), inode_lock(dst_inum).write():
+        source = get_inode(src_inum)
+        blocks = [b for b in (source.direct_blocks or []) if b is not None]
+        share_blocks(blocks)
+
+        clone = get_inode(dst_inum)
+        clone.direct_blocks = list(source.direct_blocks or [])
+        clone.file_size = source.file_size
+        clone.compression = getattr(source, "compression", "")
+        update_inode(clone)
+    return dst_inum
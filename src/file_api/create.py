@@ -8,10 +8,15 @@ from src.inode_directory.resolver import (
     add_entry,
     resolve,
     get_inode,
+    free_inode,
 )
 from src.block_bitmap.block_allocator import allocate_block
 from src.persistence.mount import STATE
+from src.common.metrics import timed
+from src.persistence.journal import journaled
 
+@timed("file_api", "create")
+@journaled
 def create_file(filename: str, is_directory: bool = False) -> int:
     """
     Create a file or directory entry in the simulated FS.
@@ -35,5 +40,10 @@ def create_file(filename: str, is_directory: bool = False) -> int:
     # For directories, optionally allocate a data block to hold directory data later (future use)
     # Keeping directory payload minimal; Member 3 stores directory map separately.
     update_inode(inode)
-    add_entry(filename, inode.inode_number)
+    try:
+        add_entry(filename, inode.inode_number)
+    except FileExistsError:
+        # Lost a race with a concurrent create of the same name; give the slot back
+        free_inode(inode.inode_number)
+        raise
     return inode.inode_number
\ No newline at end of file
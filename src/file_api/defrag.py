@@ -0,0 +1,177 @@
+# src/file_api/defrag.py
+# Fragmentation report and online defragmentation.
+#
+# A file's extents are its runs of physically consecutive blocks (holes do not break a run, and
+# a block the file maps more than once counts at its first position only).
+# defragment() rewrites the most fragmented files into a single free run each, one file per
+# inode write lock: the new run is allocated, the data copied, and the block map switched with
+# one inode update before the old blocks are freed. A crash in between leaves either the old
+# map or the new one, each pointing at a complete copy; the other set of blocks only leaks
+# (fsck reclaims it). A budget bounds the blocks copied per call so the work can be spread
+# over many short calls that leave room for foreground I/O. Files holding blocks shared with
+# another inode (a clone or a dedup match) are left alone, since moving them would undo the
+# sharing; blocks a file repeats itself are moved once and stay shared within the file.
+
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from src.common.locks import inode_lock
+from src.common.metrics import timed
+from src.persistence.journal import journaled
+from src.persistence.mount import STATE
+from src.persistence.disk_io import read_blocks, write_block
+from src.inode_directory.resolver import resolve, resolve_many, get_inode, get_inodes, update_inode, list_files
+from src.block_bitmap.block_allocator import allocate_blocks, free_blocks
+from src.block_bitmap.bitmap import free_extents
+from src.block_bitmap.refcount import block_refcount, share_blocks
+from src.fileio import compression
+
+def _require_mounted():
+    if not STATE.get("mounted"):
+        raise RuntimeError("Disk not mounted. Call mount() first.")
+
+def _extents(blocks: List[int]) -> List[Tuple[int, int]]:
+    """
+    Runs of consecutive block numbers, as (first_block, length).
+    """
+    runs: List[Tuple[int, int]] = []
+    for b in blocks:
+        if runs and b == runs[-1][0] + runs[-1][1]:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((b, 1))
+    return runs
+
+def _mapped(inode) -> List[int]:
+    return list(dict.fromkeys(b for b in (inode.direct_blocks or []) if b is not None))
+
+def _shared_outside(inode, blocks: List[int]) -> bool:
+    """
+    True when some block is also referenced by another inode, not just repeated within this one.
+    """
+    uses = Counter(b for b in (inode.direct_blocks or []) if b is not None)
+    return any(block_refcount(b) > uses[b] for b in blocks)
+
+def _file_inodes(filenames: Optional[List[str]]) -> Dict[str, object]:
+    names = list_files() if filenames is None else filenames
+    inums = {name: inum for name, inum in resolve_many(names).items() if inum is not None}
+    inodes = get_inodes(inums.values())
+    return {name: inodes[inum] for name, inum in inums.items()
+            if getattr(inodes[inum], "file_type", "file") == "file"}
+
+def fragmentation(filenames: Optional[List[str]] = None) -> Dict:
+    """
+    Extents per file (all files, or 'filenames') and free-space fragmentation of the image.
+    "histogram" maps an extent count to the number of files with it; free-space
+    fragmentation is 1 - largest free run / free blocks (0 = all free space in one run).
+    """
+    _require_mounted()
+    per_file = {name: len(_extents(_mapped(inode))) for name, inode in _file_inodes(filenames).items()}
+    counts = [n for n in per_file.values() if n]
+    histogram: Dict[int, int] = {}
+    for n in counts:
+        histogram[n] = histogram.get(n, 0) + 1
+
+    runs = [length for _, length in free_extents(STATE["superblock"].data_start_block)]
+    free = sum(runs)
+    largest = max(runs, default=0)
+    return {
+        "files": len(counts),
+        "fragmented_files": sum(1 for n in counts if n > 1),
+        "extents_per_file": sum(counts) / len(counts) if counts else 0.0,
+        "max_extents": max(counts, default=0),
+        "histogram": dict(sorted(histogram.items())),
+        "per_file": per_file,
+        "free_blocks": free,
+        "free_extents": len(runs),
+        "largest_free_extent": largest,
+        "free_space_fragmentation": 1.0 - largest / free if free else 0.0,
+    }
+
+@timed("defrag", "file")
+@journaled
+def _relocate(filename: str, limit: Optional[int] = None) -> Tuple[int, str]:
+    """
+    Move one file of at most 'limit' blocks into a single free run.
+    Returns (blocks moved, reason if it was skipped).
+    """
+    inum = resolve(filename)
+    if inum is None:
+        return 0, "deleted"
+    with inode_lock(inum).write():
+        inode = get_inode(inum)
+        old = _mapped(inode)
+        if len(_extents(old)) <= 1:
+            return 0, "contiguous"
+        if limit is not None and len(old) > limit:
+            return 0, "larger than the budget"
+        if _shared_outside(inode, old):
+            return 0, "shared with another file"
+        if max((length for _, length in free_extents(STATE["superblock"].data_start_block)), default=0) < len(old):
+            return 0, "no free run large enough"
+        new = allocate_blocks(len(old))
+        if len(_extents(new)) != 1:
+            free_blocks(new)
+            return 0, "no free run large enough"
+
+        bs = STATE["superblock"].block_size_bytes
+        target = iter(new)
+        for first, length in _extents(old):
+            data = read_blocks(first, length)
+            for i in range(length):
+                write_block(next(target), data[i * bs:(i + 1) * bs], offset=0)
+
+        compressed = getattr(inode, "compression", "")
+        if compressed:
+            compression.forget_cached(inode)
+        references = [b for b in inode.direct_blocks if b is not None]
+        moved = dict(zip(old, new))
+        inode.direct_blocks = [None if b is None else moved[b] for b in inode.direct_blocks]
+        if compressed:
+            # Nothing cached under the new clusters' blocks may outlive the switch either
+            compression.forget_cached(inode)
+        # A block the file repeats takes one reference to its new copy per extra use
+        share_blocks(moved[b] for b in (Counter(references) - Counter(old)).elements())
+        update_inode(inode)
+        free_blocks(references)
+    return len(old), ""
+
+@timed("defrag", "run")
+def defragment(filenames: Optional[List[str]] = None, budget_blocks: Optional[int] = None,
+               min_extents: int = 2) -> Dict:
+    """
+    Relocate files with at least 'min_extents' extents, most fragmented first, until
+    'budget_blocks' blocks have been copied (None = no limit). Files that do not fit in what
+    is left of the budget wait for a later call, so repeated calls work through the backlog in
+    bounded steps; a file larger than the whole budget is skipped rather than copied past it.
+    Returns {"files_moved", "blocks_moved", "skipped": {name: reason}, "remaining"}.
+    """
+    _require_mounted()
+    candidates = sorted(
+        ((len(_extents(_mapped(inode))), len(_mapped(inode)), name)
+         for name, inode in _file_inodes(filenames).items()),
+        key=lambda c: (-c[0], c[1], c[2]))
+    queue = [(size, name) for extents, size, name in candidates if extents >= max(2, min_extents)]
+
+    moved_files = moved_blocks = 0
+    skipped: Dict[str, str] = {}
+    done = 0
+    for size, name in queue:
+        if budget_blocks is not None and size > budget_blocks:
+            done += 1
+            skipped[name] = "larger than the budget"
+            continue
+        if budget_blocks is not None and moved_blocks + size > budget_blocks:
+            continue
+        done += 1
+        moved, reason = _relocate(name, None if budget_blocks is None else budget_blocks - moved_blocks)
+        if reason:
+            skipped[name] = reason
+            continue
+        moved_files += 1
+        moved_blocks += moved
+    return {
+        "files_moved": moved_files,
+        "blocks_moved": moved_blocks,
+        "skipped": skipped,
+        "remaining": len(queue) - done,
+    }
@@ -1,4 +1,7 @@
 # src/file_api/delete.py
+from src.common.locks import inode_lock
+from src.common.metrics import timed
+from src.persistence.journal import journaled
 from src.persistence.mount import STATE
 from src.inode_directory.resolver import resolve, get_inode, remove_entry
 from src.inode_directory.inode_table import free_inode
@@ -6,6 +9,8 @@ from src.block_bitmap.block_allocator import free_block
 from src.persistence.disk_io import write_block
 from .files import _truncate_inode_blocks
 
+@timed("file_api", "delete")
+@journaled
 def delete_file(filename: str) -> None:
     """
     Delete a file (or empty directory) from the simulated FS.
@@ -17,10 +22,11 @@ def delete_file(filename: str) -> None:
     if inum is None:
         raise FileNotFoundError(f"'{filename}' not found")
 
-    inode = get_inode(inum)
-    if getattr(inode, "file_type", "file") == "file":
-        _truncate_inode_blocks(inode)
-        inode.file_size = 0
+    with inode_lock(inum).write():
+        inode = get_inode(inum)
+        if getattr(inode, "file_type", "file") == "file":
+            _truncate_inode_blocks(inode)
+            inode.file_size = 0
 
-    remove_entry(filename)
-    free_inode(inum)
\ No newline at end of file
+        remove_entry(filename)
+        free_inode(inum)
\ No newline at end of file
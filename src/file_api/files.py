@@ -1,17 +1,38 @@
 # src/file_api/files.py
 # File metadata, listing, and content I/O on the simulated filesystem.
 
-from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.common.locks import inode_lock
+from src.common import metrics
+from src.common.metrics import timed
+from src.persistence.journal import journaled
 from src.persistence.mount import STATE
-from src.persistence.disk_io import read_block, write_block
+from src.persistence.disk_io import read_block, read_blocks, write_block
 from src.inode_directory.resolver import (
     resolve,
+    resolve_many,
     get_inode,
+    get_inodes,
     update_inode,
     list_files as _list_files,
     remove_entry,
+    pin_inode,
+    unpin_inode,
+    max_file_blocks,
+    free_inode_count,
+    indirect_table_count,
+    release_block_map,
 )
-from src.block_bitmap.block_allocator import allocate_block, free_block
+from src.block_bitmap.block_allocator import allocate_blocks, free_blocks
+from src.block_bitmap.bitmap import free_block_count
+from src.block_bitmap.refcount import block_refcount, share_blocks
+from src.block_bitmap.dedup import hash_blocks, find_block, remember_blocks
+from src.fileio import compression
+
+# Logical bytes read/written through this API, for write-amplification accounting
+_READ_STATS = metrics.stats_for("file_api", "read")
+_WRITE_STATS = metrics.stats_for("file_api", "write")
 
 def _require_mounted():
     if not STATE.get("mounted"):
@@ -20,13 +41,6 @@ def _require_mounted():
 def _block_size() -> int:
     return STATE["superblock"].block_size_bytes
 
-def _max_direct(inode) -> int:
-    # Use existing length of direct_blocks as capacity; if empty, set a default (e.g., 12).
-    if hasattr(inode, "direct_blocks") and inode.direct_blocks is not None and len(inode.direct_blocks) > 0:
-        return len(inode.direct_blocks)
-    # If no pre-sized list, assume a classic small number of direct pointers
-    return 12
-
 def list_files() -> List[str]:
     """
     List filenames from the simulated directory store.
@@ -43,13 +57,69 @@ def get_file_metadata(filename: str) -> Dict:
     if inum is None:
         return {"error": "file not found"}
 
-    inode = get_inode(inum)
+    with inode_lock(inum).read():
+        inode = get_inode(inum)
+    return _metadata(inode)
+
+def stat_many(filenames: List[str]) -> Dict[str, Dict]:
+    """
+    Metadata for many files at once, keyed by name (missing names map to {"error": ...}).
+    All names resolve against one directory snapshot and each inode-table block is read once;
+    results are a point-in-time snapshot, not taken under the per-inode locks.
+    """
+    _require_mounted()
+    inums = resolve_many(filenames)
+    inodes = get_inodes(i for i in inums.values() if i is not None)
+    return {
+        name: _metadata(inodes[inum]) if inum is not None else {"error": "file not found"}
+        for name, inum in inums.items()
+    }
+
+def fs_usage() -> Dict:
+    """
+    Whole-filesystem usage (df): block and inode totals from the allocators' free counters.
+    """
+    _require_mounted()
+    sb = STATE["superblock"]
+    free_blocks_now = free_block_count()
+    free_inodes_now = free_inode_count()
+    return {
+        "block_size": sb.block_size_bytes,
+        "total_blocks": sb.total_blocks,
+        "used_blocks": sb.total_blocks - free_blocks_now,
+        "free_blocks": free_blocks_now,
+        "total_inodes": sb.inode_count,
+        "used_inodes": sb.inode_count - free_inodes_now,
+        "free_inodes": free_inodes_now,
+    }
+
+def disk_usage(filenames: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Bytes of storage allocated to each file (du), all files when 'filenames' is None.
+    Counts the blocks in each block map plus its indirect tables; blocks shared with clones
+    count for every file that references them.
+    """
+    _require_mounted()
+    names = list_files() if filenames is None else filenames
+    bs = _block_size()
+    usage: Dict[str, int] = {}
+    for name, meta in stat_many(names).items():
+        if "error" in meta:
+            raise FileNotFoundError(f"'{name}' not found")
+        usage[name] = meta["allocated_blocks"] * bs
+    return usage
+
+def _metadata(inode) -> Dict:
+    blocks = [b for b in (getattr(inode, "direct_blocks", []) or []) if b is not None]
+    tables = indirect_table_count(inode)
     return {
         "inode_number": inode.inode_number,
         "file_type": getattr(inode, "file_type", "file"),
         "size_bytes": getattr(inode, "file_size", 0),
         "direct_blocks": list(getattr(inode, "direct_blocks", []) or []),
-        "has_indirect": getattr(inode, "indirect_block", None) is not None,
+        "has_indirect": tables > 0,
+        "allocated_blocks": len(blocks) + tables,
+        "compression": getattr(inode, "compression", "") or None,
     }
 
 def _ensure_direct_capacity(inode, needed_blocks: int) -> None:
@@ -62,60 +132,112 @@ def _ensure_direct_capacity(inode, needed_blocks: int) -> None:
     while len(inode.direct_blocks) < needed_blocks:
         inode.direct_blocks.append(None)
 
-def _allocate_blocks_for_size(inode, size_bytes: int) -> List[int]:
+def _fit_blocks_to_size(inode, size_bytes: int) -> List[bool]:
     """
-    Allocate enough direct blocks to hold 'size_bytes', return block list.
-    Does not handle indirect blocks for now (simplified).
+    Resize the block map to exactly hold 'size_bytes', reusing the blocks already there.
+    Only the delta is allocated or freed, each with a single bitmap save. Blocks shared with
+    a clone are swapped for private ones so the overwrite cannot leak into the other file.
+    Returns, per block, whether it is freshly allocated (its old content is meaningless).
     """
     bs = _block_size()
     blocks_needed = (size_bytes + bs - 1) // bs if size_bytes > 0 else 0
-    if blocks_needed == 0:
-        return []
+    if blocks_needed > max_file_blocks():
+        raise ValueError("File exceeds maximum size")
 
-    # Respect a simple direct-only policy
-    capacity = max(_max_direct(inode), blocks_needed)
-    _ensure_direct_capacity(inode, capacity)
+    _ensure_direct_capacity(inode, blocks_needed)
+    release = [b for b in inode.direct_blocks[blocks_needed:] if b is not None]
+    blocks = inode.direct_blocks[:blocks_needed]
+    for i, b in enumerate(blocks):
+        if b is not None and block_refcount(b) > 1:
+            release.append(b)
+            blocks[i] = None
+    free_blocks(release)
 
-    allocated: List[int] = []
-    for i in range(blocks_needed):
-        if inode.direct_blocks[i] is None:
-            b = allocate_block()
-            inode.direct_blocks[i] = b
-        allocated.append(inode.direct_blocks[i])
-    return allocated
+    fresh = [b is None for b in blocks]
+    missing = [i for i, is_new in enumerate(fresh) if is_new]
+    if missing:
+        prev = next((b for b in reversed(blocks[:missing[0]]) if b is not None), None)
+        for i, b in zip(missing, allocate_blocks(len(missing), goal=None if prev is None else prev + 1)):
+            blocks[i] = b
+    inode.direct_blocks = blocks
+    return fresh
 
-def write_file(filename: str, data: bytes) -> None:
+@timed("file_api", "write")
+@journaled
+def write_file(filename: str, data: bytes, skip_unchanged: bool = False, dedup: bool = False) -> None:
     """
     Write data bytes to a file in the simulated FS.
-    Overwrites previous content (truncate + write).
+    Overwrites previous content in place: existing blocks are reused and only the size
+    delta is allocated or freed. With skip_unchanged=True, blocks whose current content
+    already matches are compared and not rewritten. With dedup=True, every full block whose
+    content already exists on disk shares that block instead of being written (see
+    block_bitmap.dedup); blocks that are written get indexed for later writers.
     """
     _require_mounted()
     inum = resolve(filename)
     if inum is None:
         raise FileNotFoundError(f"'{filename}' not found")
 
-    inode = get_inode(inum)
-    if getattr(inode, "file_type", "file") != "file":
-        raise IsADirectoryError(f"'{filename}' is a directory")
+    with inode_lock(inum).write():
+        inode = get_inode(inum)
+        if getattr(inode, "file_type", "file") != "file":
+            raise IsADirectoryError(f"'{filename}' is a directory")
 
-    # Free old blocks first (truncate)
-    _truncate_inode_blocks(inode)
+        _write_content(inode, data, skip_unchanged, dedup)
+        inode.file_size = len(data)
+        update_inode(inode)
+    metrics.record_logical(_WRITE_STATS, written=len(data))
+
+def _write_content(inode, data: bytes, skip_unchanged: bool = False, dedup: bool = False) -> None:
+    """
+    Make the inode's blocks hold exactly 'data' (file_size and persisting are left to the caller).
+    """
+    if getattr(inode, "compression", ""):
+        # Compressed files are rewritten cluster by cluster; dedup does not apply to them
+        compression.rewrite(inode, data)
+        return
 
-    # Allocate new blocks to fit data
     bs = _block_size()
-    blocks = _allocate_blocks_for_size(inode, len(data))
+    fresh = _fit_blocks_to_size(inode, len(data))
+
+    digests: Dict[int, bytes] = {}
+    if dedup:
+        full = [i for i in range(len(inode.direct_blocks)) if (i + 1) * bs <= len(data)]
+        digests = dict(zip(full, hash_blocks([data[i * bs:(i + 1) * bs] for i in full])))
+    written: Dict[bytes, int] = {}
+    shared: List[int] = []
+    dropped: List[int] = []
+    # Blocks still mapped at indices not yet rewritten: sharing one of them would have the
+    # write land on it in place further on
+    ahead = Counter(inode.direct_blocks)
 
     # Write data across blocks
-    cursor = 0
-    for i, bnum in enumerate(blocks):
-        chunk = data[cursor:cursor + bs]
+    for i, bnum in enumerate(inode.direct_blocks):
+        ahead[bnum] -= 1
+        chunk = data[i * bs:(i + 1) * bs]
+        if i in digests:
+            target = find_block(digests[i], chunk, pending=written)
+            if target == bnum:
+                continue
+            if target is not None and ahead[target] <= 0:
+                shared.append(target)
+                dropped.append(bnum)
+                inode.direct_blocks[i] = target
+                continue
+        if skip_unchanged and not fresh[i] and read_block(bnum)[:len(chunk)] == chunk:
+            continue
         # Write the chunk at offset 0 of the block
         write_block(bnum, chunk, offset=0)
-        cursor += len(chunk)
+        if i in digests:
+            written[digests[i]] = bnum
 
-    inode.file_size = len(data)
-    update_inode(inode)
+    # Take the new references before dropping the old ones: a dropped block may be a target too
+    if shared:
+        share_blocks(shared)
+        free_blocks(dropped)
+    remember_blocks({b: d for d, b in written.items()})
 
+@timed("file_api", "read")
 def read_file(filename: str) -> bytes:
     """
     Read and return the file content from the simulated FS.
@@ -125,14 +247,22 @@ def read_file(filename: str) -> bytes:
     if inum is None:
         raise FileNotFoundError(f"'{filename}' not found")
 
-    inode = get_inode(inum)
-    if getattr(inode, "file_type", "file") != "file":
-        raise IsADirectoryError(f"'{filename}' is a directory")
+    with inode_lock(inum).read():
+        inode = get_inode(inum)
+        if getattr(inode, "file_type", "file") != "file":
+            raise IsADirectoryError(f"'{filename}' is a directory")
 
+        data = _read_content(inode)
+    metrics.record_logical(_READ_STATS, read=len(data))
+    return data
+
+def _read_content(inode) -> bytes:
     bs = _block_size()
     size = getattr(inode, "file_size", 0)
     if size == 0:
         return b""
+    if getattr(inode, "compression", ""):
+        return compression.read_range(inode, 0, size)
 
     chunks: List[bytes] = []
     remaining = size
@@ -143,9 +273,86 @@ def read_file(filename: str) -> bytes:
         take = min(bs, remaining)
         chunks.append(raw[:take])
         remaining -= take
-
     return b"".join(chunks)
 
+DEFAULT_ITER_CHUNK = 64 * 1024
+
+def iter_file(filename: str, chunk_size: int = DEFAULT_ITER_CHUNK) -> Iterator[bytes]:
+    """
+    Lazily yield the file content in chunks of at most 'chunk_size' bytes.
+    Each chunk is one run of physically contiguous blocks fetched with a single read,
+    so memory stays bounded by chunk_size regardless of file size. Holes read as zeros.
+    """
+    _require_mounted()
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    inum = resolve(filename)
+    if inum is None:
+        raise FileNotFoundError(f"'{filename}' not found")
+
+    inode = pin_inode(inum)
+    try:
+        if getattr(inode, "file_type", "file") != "file":
+            raise IsADirectoryError(f"'{filename}' is a directory")
+        bs = _block_size()
+        max_blocks = max(1, chunk_size // bs)
+        pos = 0
+        while True:
+            # The chunk is built under the read lock; it is yielded after the lock is released,
+            # so a consumer that writes the file (or stops iterating) never holds writers off
+            with inode_lock(inum).read():
+                size = getattr(inode, "file_size", 0)
+                if pos >= size:
+                    return
+                if getattr(inode, "compression", ""):
+                    # Stop at cluster boundaries so each step decompresses at most one new cluster
+                    cluster = compression.cluster_bytes()
+                    take = min(chunk_size, size - pos, cluster - pos % cluster)
+                    chunk = compression.read_range(inode, pos, take)
+                else:
+                    blocks = inode.direct_blocks or []
+                    first = pos // bs
+                    start = blocks[first] if first < len(blocks) else None
+                    # Extend the run while the next logical block is the next physical block
+                    count = 1
+                    while (count < max_blocks and first + count < len(blocks) and start is not None
+                           and blocks[first + count] == start + count):
+                        count += 1
+                    raw = read_blocks(start, count) if start is not None else bytes(bs)
+                    inner = pos % bs
+                    chunk = raw[inner:min(len(raw), size - pos + inner, inner + chunk_size)]
+            pos += len(chunk)
+            yield chunk
+    finally:
+        unpin_inode(inum)
+
+@timed("file_api", "set_compression")
+@journaled
+def set_compression(filename: str, codec: Optional[str]) -> None:
+    """
+    Switch a file's compression codec ('zlib', 'lzma', or None to store it uncompressed).
+    Existing content is re-encoded with the new codec.
+    """
+    _require_mounted()
+    codec = codec or ""
+    compression.check_codec(codec)
+    inum = resolve(filename)
+    if inum is None:
+        raise FileNotFoundError(f"'{filename}' not found")
+    with inode_lock(inum).write():
+        inode = get_inode(inum)
+        if getattr(inode, "file_type", "file") != "file":
+            raise IsADirectoryError(f"'{filename}' is a directory")
+        if getattr(inode, "compression", "") == codec:
+            return
+        content = _read_content(inode)
+        _truncate_inode_blocks(inode)
+        inode.compression = codec
+        _write_content(inode, content)
+        update_inode(inode)
+
+@timed("file_api", "truncate")
+@journaled
 def truncate_file(filename: str) -> None:
     """
     Truncate file to zero length and free its data blocks.
@@ -154,24 +361,24 @@ def truncate_file(filename: str) -> None:
     inum = resolve(filename)
     if inum is None:
         raise FileNotFoundError(f"'{filename}' not found")
-    inode = get_inode(inum)
-    if getattr(inode, "file_type", "file") != "file":
-        raise IsADirectoryError(f"'{filename}' is a directory")
+    with inode_lock(inum).write():
+        inode = get_inode(inum)
+        if getattr(inode, "file_type", "file") != "file":
+            raise IsADirectoryError(f"'{filename}' is a directory")
 
-    _truncate_inode_blocks(inode)
-    inode.file_size = 0
-    update_inode(inode)
+        _truncate_inode_blocks(inode)
+        inode.file_size = 0
+        update_inode(inode)
 
 def _truncate_inode_blocks(inode) -> None:
     """
-    Free all direct blocks of the inode.
+    Free all data blocks of the inode, including its indirect tables.
     """
     if not hasattr(inode, "direct_blocks") or inode.direct_blocks is None:
         return
-    for b in inode.direct_blocks:
-        if b is not None:
-            free_block(b)
+    free_blocks([b for b in inode.direct_blocks if b is not None])
     inode.direct_blocks = []
+    release_block_map(inode)
 
 def delete_file(filename: str) -> None:
     """
@@ -184,13 +391,14 @@ def delete_file(filename: str) -> None:
     if inum is None:
         raise FileNotFoundError(f"'{filename}' not found")
 
-    inode = get_inode(inum)
-    if getattr(inode, "file_type", "file") == "file":
-        _truncate_inode_blocks(inode)
-        inode.file_size = 0
-        update_inode(inode)
-    # Remove from directory
-    remove_entry(filename)
-    # Free inode record
-    from src.inode_directory.inode_table import free_inode
-    free_inode(inum)
\ No newline at end of file
+    with inode_lock(inum).write():
+        inode = get_inode(inum)
+        if getattr(inode, "file_type", "file") == "file":
+            _truncate_inode_blocks(inode)
+            inode.file_size = 0
+            update_inode(inode)
+        # Remove from directory
+        remove_entry(filename)
+        # Free inode record
+        from src.inode_directory.inode_table import free_inode
+        free_inode(inum)
\ No newline at end of file
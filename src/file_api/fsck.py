@@ -0,0 +1,291 @@
+# src/file_api/fsck.py
+# Offline-style consistency check of the mounted image.
+#
+# The inode table, bitmap, directory and refcount table are each read in bulk, once. Every
+# structure that owns blocks (reserved region, directory block, refcount/dedup tables, inode
+# block maps and indirect tables) is folded into a per-block owner count; the expected bitmap
+# is derived from that count with bytes.translate and compared against the on-disk bitmap as
+# two big integers, so the diff is a couple of C-level passes rather than a per-bit loop.
+# Problems found:
+#   leaked blocks       allocated in the bitmap, owned by nothing
+#   unmarked blocks     owned by something, free in the bitmap (would be handed out twice)
+#   double allocations  more owners than the refcount table allows
+#   refcount mismatches a shared count above the real number of owners (the block would leak)
+#   bad pointers        block map entries outside the image or inside the reserved region
+#   orphan inodes       in use, but no directory entry points at them
+#   dangling entries    directory entries naming a free or out-of-range inode
+# With repair=True each is fixed in place: leaked blocks are freed, unmarked ones marked,
+# blocks shared only by file maps get their refcount corrected (they become ordinary CoW
+# shares), bad pointers are dropped, orphans are reconnected as '#<inode>' and dangling entries
+# removed. A file block that collides with metadata cannot be arbitrated and is only reported.
+
+import json
+import re
+import struct
+from array import array
+from collections import Counter
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+from src.common.deferral import deferring
+from src.common.metrics import timed
+from src.persistence.journal import journaled
+from src.persistence.mount import STATE
+from src.persistence.disk_io import read_block, read_blocks
+from src.design.inode_serialisation import (INODE_SIZE, INODE_FORMAT, DIRECT_POINTERS,
+                                            FILE_TYPE_REGULAR, FILE_TYPE_DIR, bytes_to_inode)
+from src.inode_directory import inode_table
+from src.inode_directory.resolver import add_entry, remove_entry, update_inode
+from src.block_bitmap import bitmap, refcount, dedup
+from .batch import _flush_all
+
+# One record per inode-table slot, padded to the slot size
+_SLOT = struct.Struct(INODE_FORMAT + f"{INODE_SIZE - struct.calcsize(INODE_FORMAT)}x")
+_IN_USE = (FILE_TYPE_REGULAR, FILE_TYPE_DIR)
+
+# Owner count byte -> '0'/'1' digit: the expected bitmap as a binary string
+_TO_DIGIT = bytes([0x30] + [0x31] * 255)
+_SHARED = re.compile(rb"[\x02-\xff]")
+_NONZERO = re.compile(rb"[^\x00]")
+
+# Owner labels of non-file structures
+_RESERVED = "reserved"
+_DIRECTORY = "directory"
+_REFCOUNT_TABLE = "refcount table"
+_DEDUP_INDEX = "dedup index"
+
+def _require_mounted():
+    if not STATE.get("mounted"):
+        raise RuntimeError("Disk not mounted. Call mount() first.")
+
+def _pointer_slot(sb) -> Optional[int]:
+    """
+    Inode slot overlapped by the metadata pointers at the start of the pointer block
+    (directory, refcount and dedup table locations); it is never a real inode.
+    """
+    offset = (sb.bitmap_start_block - 1 - sb.inode_start_block) * sb.block_size_bytes
+    slot = offset // INODE_SIZE
+    return slot if 0 <= offset and slot < sb.inode_count else None
+
+def _bits(value: int) -> List[int]:
+    """
+    Positions of the set bits of 'value', lowest first.
+    """
+    digits = format(value, "b")[::-1]
+    return [m.start() for m in re.finditer("1", digits)]
+
+class _Scan:
+    """
+    Everything read from disk in one pass, and the owner count derived from it.
+    """
+
+    def __init__(self):
+        sb = self.sb = STATE["superblock"]
+        total = sb.total_blocks
+        self.metadata: Dict[str, Tuple[int, int]] = {_RESERVED: (0, sb.data_start_block)}
+
+        pointers = read_block(sb.bitmap_start_block - 1)
+        dir_block = int.from_bytes(pointers[0:4], "little")
+        if dir_block:
+            self.metadata[_DIRECTORY] = (dir_block, 1)
+        for label, module, offset in ((_REFCOUNT_TABLE, refcount, 4), (_DEDUP_INDEX, dedup, 8)):
+            start = int.from_bytes(pointers[offset:offset + 4], "little")
+            if start:
+                self.metadata[label] = (start, module._table_blocks())
+
+        # Inode table: one read, decoded slot by slot with iter_unpack
+        table = read_blocks(sb.inode_start_block, sb.inode_table_blocks)[:sb.inode_count * INODE_SIZE]
+        skip = {sb.root_inode_number, _pointer_slot(sb)}
+        self.records: Dict[int, tuple] = {}
+        self.maps: Dict[int, List[int]] = {}
+        self.bad_pointers: Dict[int, List[int]] = {}
+        claims = array("i")
+        for inum, fields in enumerate(_SLOT.iter_unpack(table)):
+            if fields[0] not in _IN_USE or inum in skip:
+                continue
+            self.records[inum] = fields
+            blocks = array("i", fields[2:2 + DIRECT_POINTERS])
+            for depth, root in enumerate(fields[2 + DIRECT_POINTERS:5 + DIRECT_POINTERS], 1):
+                if root > 0:
+                    self._walk(inum, root, depth, blocks)
+            mapped = [b for b in blocks if b > 0]
+            bad = [b for b in mapped if not self._valid(b)]
+            if bad:
+                self.bad_pointers.setdefault(inum, []).extend(bad)
+                mapped = [b for b in mapped if self._valid(b)]
+            self.maps[inum] = mapped
+            claims.extend(mapped)
+        # Owner count per block, scattered into a bytearray without a Python-level loop
+        counts = Counter(claims)
+        for start, count in self.metadata.values():
+            counts.update(range(start, min(start + count, total)))
+        try:
+            owners = bytearray(map(counts.get, range(total), repeat(0)))
+        except ValueError:
+            # Some block has more than 255 owners; the count only has to stay above 1
+            owners = bytearray(min(c, 255) for c in map(counts.get, range(total), repeat(0)))
+        self.owners = owners
+
+        raw_bitmap = read_blocks(sb.bitmap_start_block, sb.bitmap_blocks)[:(total + 7) // 8]
+        self.on_disk = int.from_bytes(raw_bitmap, "little") & ((1 << total) - 1)
+        self.expected = int(owners.translate(_TO_DIGIT)[::-1], 2)
+
+        # The table as persisted (a batch has just been flushed), not a possibly newer cache
+        start = self.metadata.get(_REFCOUNT_TABLE, (0, 0))[0]
+        self.refs = array("H", bytes(total * 2))
+        if start:
+            self.refs = array("H", read_blocks(start, refcount._table_blocks())[:total * 2])
+
+        self.entries: Dict[str, int] = {}
+        if dir_block and self._valid_any(dir_block):
+            data = read_block(dir_block).rstrip(b"\x00")
+            try:
+                self.entries = {str(k): int(v) for k, v in json.loads(data.decode("utf-8")).items()} if data else {}
+            except ValueError:
+                self.entries = {}
+
+    def _walk(self, inum: int, table: int, depth: int, blocks: array) -> None:
+        """
+        Append a pointer table and everything its tree maps to 'blocks'; table pointers that
+        lead outside the data area are recorded as bad instead of followed.
+        """
+        if not self._valid(table):
+            self.bad_pointers.setdefault(inum, []).append(table)
+            return
+        blocks.append(table)
+        entries = array("i", read_block(table))
+        if depth == 1:
+            blocks.extend(entries)
+            return
+        for child in entries:
+            if child > 0:
+                self._walk(inum, child, depth - 1, blocks)
+
+    def _valid(self, block: int) -> bool:
+        return self.sb.data_start_block <= block < self.sb.total_blocks
+
+    def _valid_any(self, block: int) -> bool:
+        return 0 < block < self.sb.total_blocks
+
+    def owners_of(self, blocks: List[int]) -> Dict[int, List[str]]:
+        """
+        Name the owners of a few blocks (second, targeted pass over the maps).
+        """
+        wanted = set(blocks)
+        found: Dict[int, List[str]] = {b: [] for b in blocks}
+        for label, (start, count) in self.metadata.items():
+            for b in wanted.intersection(range(start, start + count)):
+                found[b].append(label)
+        for inum, mapped in self.maps.items():
+            for b in wanted.intersection(mapped):
+                found[b].extend([f"inode {inum}"] * mapped.count(b))
+        return found
+
+@timed("fsck", "check")
+@journaled
+def fsck(repair: bool = False) -> Dict:
+    """
+    Check allocation and namespace consistency of the mounted image; with repair=True fix
+    what can be fixed. Pending batch and open-file metadata is written back first.
+    Returns the findings (block and inode numbers), "clean" and, after a repair, "unrepaired".
+    """
+    _require_mounted()
+    if deferring():
+        raise RuntimeError("fsck cannot run inside a batch")
+    for inum in list(inode_table._PINNED):
+        inode_table.sync_inode(inum)
+    _flush_all()
+
+    scan = _Scan()
+    owners, refs = scan.owners, scan.refs
+    leaked = _bits(scan.on_disk & ~scan.expected)
+    unmarked = _bits(scan.expected & ~scan.on_disk)
+
+    shared = [m.start() for m in _SHARED.finditer(owners)]
+    double = [b for b in shared if owners[b] > max(1, refs[b])]
+    counted = sorted({m.start() // 2 for m in _NONZERO.finditer(refs.tobytes())})
+    overcounted = {b: (refs[b], owners[b]) for b in counted if refs[b] > 1 and refs[b] > owners[b]}
+    double_owners = scan.owners_of(double)
+
+    live = set(scan.records)
+    referenced = set(scan.entries.values())
+    orphans = sorted(live - referenced)
+    dangling = {name: inum for name, inum in scan.entries.items() if inum not in live}
+
+    report = {
+        "blocks_checked": scan.sb.total_blocks,
+        "inodes_checked": scan.sb.inode_count,
+        "leaked_blocks": leaked,
+        "unmarked_blocks": unmarked,
+        "double_allocated": double_owners,
+        "refcount_mismatches": overcounted,
+        "bad_pointers": scan.bad_pointers,
+        "orphan_inodes": orphans,
+        "dangling_entries": dangling,
+    }
+    report["clean"] = not any((leaked, unmarked, double, overcounted, scan.bad_pointers, orphans, dangling))
+    if repair and not report["clean"]:
+        report["unrepaired"] = _repair(scan, report)
+    return report
+
+def _prune_tree(table: int, depth: int, bad: List[int]) -> None:
+    """
+    Clear bad child pointers from the tables of a tree (its data pointers are left to the caller).
+    """
+    if depth == 1:
+        return
+    children = inode_table._read_indirect(table)
+    kept = [None if child in bad else child for child in children]
+    if kept != children:
+        inode_table._write_indirect(table, kept)
+    for child in kept:
+        if child is not None:
+            _prune_tree(child, depth - 1, bad)
+
+def _repair(scan: _Scan, report: Dict) -> List[str]:
+    """
+    Apply the fixes described at the top of the module. Returns what had to be left alone.
+    """
+    unrepaired: List[str] = []
+
+    for name in report["dangling_entries"]:
+        remove_entry(name)
+
+    for inum, bad in report["bad_pointers"].items():
+        # Rebuild the map from the slot itself: get_inode would follow a bad indirect pointer.
+        # Bad table pointers are cut out of the trees first, so loading and storing the map
+        # only ever touches tables inside the data area.
+        inode = bytes_to_inode(_SLOT.pack(*scan.records[inum]), inum)
+        for attr, depth in inode_table._INDIRECT_ROOTS:
+            root = getattr(inode, attr)
+            if root in bad:
+                setattr(inode, attr, None)
+            elif root is not None:
+                _prune_tree(root, depth, bad)
+        inode_table._load_block_map(inode)
+        inode.direct_blocks = [b if b is None or b not in bad else None for b in inode.direct_blocks]
+        update_inode(inode)
+
+    # File blocks shared by several maps become regular clone shares
+    counts: Dict[int, int] = {}
+    for b, labels in report["double_allocated"].items():
+        if all(label.startswith("inode ") for label in labels):
+            counts[b] = len(labels)
+        else:
+            unrepaired.append(f"block {b} is claimed by {', '.join(labels)}")
+    for b, (_, actual) in report["refcount_mismatches"].items():
+        counts[b] = actual
+    if counts:
+        refcount.set_refcounts(counts)
+
+    if report["leaked_blocks"]:
+        dedup.forget_blocks(report["leaked_blocks"])
+        bitmap.free_block_nums(report["leaked_blocks"])
+    if report["unmarked_blocks"]:
+        bitmap.mark_block_nums(report["unmarked_blocks"])
+
+    for inum in report["orphan_inodes"]:
+        try:
+            add_entry(f"#{inum}", inum)
+        except (ValueError, FileExistsError) as e:
+            unrepaired.append(f"inode {inum} could not be reconnected: {e}")
+    return unrepaired
@@ -0,0 +1,173 @@
+# src/file_api/transfer.py
+# Streaming copy between host files and the simulated FS.
+# A helper thread does the host-side I/O and hands chunks over a bounded queue, so host reads
+# (or writes) overlap with block I/O on the image while memory stays at ~(depth + 1) chunks.
+
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict
+from src.persistence.mount import STATE
+from src.design.architecture import Inode
+from src.inode_directory.resolver import resolve, get_inode, max_file_blocks, indirect_table_count
+from src.block_bitmap.bitmap import free_block_count
+from src.fileio import open_file, close_file, read_file as fd_read, write_file as fd_write, fallocate_file
+from .create import create_file
+from .delete import delete_file
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_QUEUE_DEPTH = 4
+
+_EOF = object()
+
+def _require_mounted():
+    if not STATE.get("mounted"):
+        raise RuntimeError("Disk not mounted. Call mount() first.")
+
+def _report(nbytes: int, started: float) -> Dict:
+    seconds = time.perf_counter() - started
+    return {
+        "bytes": nbytes,
+        "seconds": seconds,
+        "mb_per_s": (nbytes / (1024 * 1024)) / seconds if seconds > 0 else 0.0,
+    }
+
+def _pump(produce: Callable[[], bytes], chunks: "queue.Queue", errors: list, stop: threading.Event) -> None:
+    """
+    Thread body: push produced chunks onto the queue until an empty chunk (EOF) or a stop request.
+    """
+    try:
+        while not stop.is_set():
+            chunk = produce()
+            if not chunk:
+                break
+            chunks.put(chunk)
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        chunks.put(_EOF)
+
+def _check_fits(host_path: str, host_size: int, fs_path: str) -> None:
+    """
+    Refuse an import the image cannot hold before the target is created or truncated.
+    """
+    bs = STATE["superblock"].block_size_bytes
+    limit = max_file_blocks() * bs
+    if host_size > limit:
+        raise ValueError(f"'{host_path}' is {host_size} bytes; files on this image hold at most {limit} bytes")
+    blocks = -(-host_size // bs)
+    needed = blocks + indirect_table_count(Inode(inode_number=0, file_type="file", direct_blocks=[0] * blocks))
+    inum = resolve(fs_path)
+    held = 0
+    if inum is not None:
+        # Blocks the old content frees when the target is overwritten
+        old = get_inode(inum)
+        held = sum(1 for b in old.direct_blocks if b is not None) + indirect_table_count(old)
+    if needed > free_block_count() + held:
+        raise RuntimeError(f"Not enough free blocks for '{host_path}': {needed} needed, "
+                           f"{free_block_count() + held} available")
+
+def import_file(host_path: str, fs_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                queue_depth: int = DEFAULT_QUEUE_DEPTH) -> Dict:
+    """
+    Copy a host file into the simulated FS (created if missing, overwritten otherwise).
+    Blocks are reserved up front from the host file size so the copy lands contiguously.
+    The largest importable file is max_file_blocks() blocks (about 1 GiB with 512 B blocks,
+    4 TiB with 4 KiB blocks); a host file over that, or over the free space, is rejected
+    before the target is touched. A target created here is removed again if the copy fails.
+    Returns {"bytes", "seconds", "mb_per_s"}.
+    """
+    _require_mounted()
+    started = time.perf_counter()
+    host_size = os.path.getsize(host_path)
+    _check_fits(host_path, host_size, fs_path)
+    created = resolve(fs_path) is None
+    if created:
+        create_file(fs_path)
+    try:
+        written = _copy_in(host_path, host_size, fs_path, chunk_size, queue_depth)
+    except BaseException:
+        if created:
+            delete_file(fs_path)
+        raise
+    return _report(written, started)
+
+def _copy_in(host_path: str, host_size: int, fs_path: str, chunk_size: int, queue_depth: int) -> int:
+    fd = open_file(fs_path, "w")
+    try:
+        fallocate_file(fd, host_size, keep_size=True)
+        chunks: "queue.Queue" = queue.Queue(maxsize=queue_depth)
+        errors: list = []
+        stop = threading.Event()
+        with open(host_path, "rb") as src:
+            reader = threading.Thread(target=_pump, args=(lambda: src.read(chunk_size), chunks, errors, stop),
+                                      name="fs-import-reader", daemon=True)
+            reader.start()
+            written = 0
+            try:
+                while True:
+                    chunk = chunks.get()
+                    if chunk is _EOF:
+                        break
+                    written += fd_write(fd, chunk)
+            finally:
+                stop.set()
+                # Drain so a reader blocked on a full queue can see the stop flag and exit
+                while reader.is_alive():
+                    try:
+                        chunks.get(timeout=0.05)
+                    except queue.Empty:
+                        pass
+                reader.join()
+        if errors:
+            raise errors[0]
+    finally:
+        close_file(fd)
+    return written
+
+def export_file(fs_path: str, host_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                queue_depth: int = DEFAULT_QUEUE_DEPTH) -> Dict:
+    """
+    Copy a file from the simulated FS to the host, overwriting 'host_path'.
+    Returns {"bytes", "seconds", "mb_per_s"}.
+    """
+    _require_mounted()
+    started = time.perf_counter()
+    fd = open_file(fs_path, "r")
+    try:
+        chunks: "queue.Queue" = queue.Queue(maxsize=queue_depth)
+        errors: list = []
+        total = 0
+        with open(host_path, "wb") as dst:
+            def drain():
+                nonlocal total
+                # Keep consuming after a failure so the producer never blocks on a full queue
+                while True:
+                    chunk = chunks.get()
+                    if chunk is _EOF:
+                        return
+                    if errors:
+                        continue
+                    try:
+                        dst.write(chunk)
+                        total += len(chunk)
+                    except BaseException as e:
+                        errors.append(e)
+
+            writer = threading.Thread(target=drain, name="fs-export-writer", daemon=True)
+            writer.start()
+            try:
+                while not errors:
+                    chunk = fd_read(fd, chunk_size)
+                    if not chunk:
+                        break
+                    chunks.put(chunk)
+            finally:
+                chunks.put(_EOF)
+                writer.join()
+        if errors:
+            raise errors[0]
+    finally:
+        close_file(fd)
+    return _report(total, started)
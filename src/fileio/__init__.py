@@ -8,4 +8,6 @@ from .file_io import (
     read_file,
     write_file,
     seek_file,
+    sync_file,
+    fallocate_file,
 )
\ No newline at end of file
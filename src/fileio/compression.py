@@ -0,0 +1,236 @@
+# src/fileio/compression.py
+# Transparent per-file compression in fixed-size clusters.
+#
+# A compressed file (inode.compression = 'zlib' or 'lzma') is cut into clusters of
+# CLUSTER_BLOCKS logical blocks. Each cluster is compressed on its own and stored in the block
+# map slots of its first logical blocks, so reading any byte range only decompresses the
+# clusters it overlaps. Slot layout per cluster:
+#   - all slots empty            -> hole, reads as zeros
+#   - all CLUSTER_BLOCKS filled  -> stored raw (the data did not compress enough to save a block)
+#   - fewer slots filled         -> 4-byte little-endian payload length, then the codec payload
+# Writes are read-modify-write of whole clusters. Decompressed clusters are kept in a small
+# LRU keyed by their physical blocks, so sequential reads decompress each cluster once; freeing
+# a block drops the entries that hold it before the block can be handed to another file.
+
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from src.persistence.mount import STATE, register_unmount_hook
+from src.persistence.disk_io import read_block, read_blocks, write_block
+from src.inode_directory.resolver import max_file_blocks
+from src.block_bitmap.block_allocator import allocate_blocks, free_blocks, register_free_hook
+from src.block_bitmap.refcount import block_refcount
+from src.common.metrics import timed
+
+CLUSTER_BLOCKS = 4
+CACHE_CLUSTERS = 32
+_HEADER = 4
+
+def _lzma_compress(data: bytes) -> bytes:
+    import lzma  # only paid for by files that use it
+    return lzma.compress(data)
+
+def _lzma_decompress(data: bytes) -> bytes:
+    import lzma
+    return lzma.decompress(data)
+
+_CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "zlib": (lambda b: zlib.compress(b, 6), zlib.decompress),
+    "lzma": (_lzma_compress, _lzma_decompress),
+}
+
+_CACHE: "OrderedDict[Tuple[int, ...], bytes]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+def _reset_cache() -> None:
+    with _CACHE_LOCK:
+        _CACHE.clear()
+
+register_unmount_hook(_reset_cache)
+
+def check_codec(codec: str) -> None:
+    if codec and codec not in _CODECS:
+        raise ValueError(f"Unknown compression codec '{codec}' (use one of {sorted(_CODECS)})")
+
+def _block_size() -> int:
+    return STATE["superblock"].block_size_bytes
+
+def cluster_bytes() -> int:
+    return CLUSTER_BLOCKS * _block_size()
+
+def _slots(inode, cidx: int) -> List[Optional[int]]:
+    blocks = inode.direct_blocks or []
+    first = cidx * CLUSTER_BLOCKS
+    slots = list(blocks[first:first + CLUSTER_BLOCKS])
+    return slots + [None] * (CLUSTER_BLOCKS - len(slots))
+
+def _cache_get(key: Tuple[int, ...]) -> Optional[bytes]:
+    with _CACHE_LOCK:
+        data = _CACHE.get(key)
+        if data is not None:
+            _CACHE.move_to_end(key)
+        return data
+
+def _cache_put(key: Tuple[int, ...], data: bytes) -> None:
+    with _CACHE_LOCK:
+        _CACHE[key] = data
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > CACHE_CLUSTERS:
+            _CACHE.popitem(last=False)
+
+def _cache_drop(key: Tuple[int, ...]) -> None:
+    with _CACHE_LOCK:
+        _CACHE.pop(key, None)
+
+def _forget_freed(blocks: List[int]) -> None:
+    freed = set(blocks)
+    with _CACHE_LOCK:
+        for key in [k for k in _CACHE if not freed.isdisjoint(k)]:
+            del _CACHE[key]
+
+register_free_hook(_forget_freed)
+
+def forget_cached(inode) -> None:
+    """
+    Drop the inode's decompressed clusters from the cache (its blocks are about to move).
+    """
+    for cidx in range((len(inode.direct_blocks or []) + CLUSTER_BLOCKS - 1) // CLUSTER_BLOCKS):
+        _cache_drop(tuple(b for b in _slots(inode, cidx) if b is not None))
+
+def _read_stored(blocks: List[int]) -> bytes:
+    if blocks == list(range(blocks[0], blocks[0] + len(blocks))):
+        return read_blocks(blocks[0], len(blocks))
+    return b"".join(read_block(b) for b in blocks)
+
+@timed("compression", "load_cluster")
+def load_cluster(inode, cidx: int) -> bytes:
+    """
+    Return the full decompressed content (cluster_bytes() long) of cluster 'cidx'.
+    """
+    size = cluster_bytes()
+    stored = [b for b in _slots(inode, cidx) if b is not None]
+    if not stored:
+        return bytes(size)
+    key = tuple(stored)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+    raw = _read_stored(stored)
+    if len(stored) == CLUSTER_BLOCKS:
+        data = raw
+    else:
+        length = int.from_bytes(raw[:_HEADER], byteorder="little")
+        data = _CODECS[inode.compression][1](raw[_HEADER:_HEADER + length])
+        data = data.ljust(size, b"\x00")
+    _cache_put(key, data)
+    return data
+
+@timed("compression", "store_cluster")
+def store_cluster(inode, cidx: int, data: bytes) -> None:
+    """
+    Compress and store 'data' (at most cluster_bytes() long) as cluster 'cidx'.
+    Private blocks already in the cluster are reused in place; blocks shared with a clone
+    are replaced, and slots no longer needed are freed. The caller persists the inode.
+    """
+    bs = _block_size()
+    size = cluster_bytes()
+    if (cidx + 1) * CLUSTER_BLOCKS > max_file_blocks():
+        raise ValueError("File exceeds maximum size")
+    data = data.ljust(size, b"\x00")
+    old = _slots(inode, cidx)
+    old_key = tuple(b for b in old if b is not None)
+
+    if not data.strip(b"\x00"):
+        payload = b""
+    else:
+        compressed = _CODECS[inode.compression][0](data)
+        if _HEADER + len(compressed) <= (CLUSTER_BLOCKS - 1) * bs:
+            payload = len(compressed).to_bytes(_HEADER, byteorder="little") + compressed
+        else:
+            payload = data
+    needed = (len(payload) + bs - 1) // bs
+
+    keep = [b if b is not None and block_refcount(b) <= 1 else None for b in old[:needed]]
+    release = [b for b in old[needed:] if b is not None]
+    release += [b for b, k in zip(old[:needed], keep) if b is not None and k is None]
+    missing = [i for i, b in enumerate(keep) if b is None]
+    if missing:
+        prev = next((b for b in reversed(keep[:missing[0]]) if b is not None), None)
+        for i, b in zip(missing, allocate_blocks(len(missing), goal=None if prev is None else prev + 1)):
+            keep[i] = b
+    free_blocks(release)
+
+    payload = payload.ljust(needed * bs, b"\x00")
+    for i, b in enumerate(keep):
+        write_block(b, payload[i * bs:(i + 1) * bs], offset=0)
+
+    first = cidx * CLUSTER_BLOCKS
+    if inode.direct_blocks is None:
+        inode.direct_blocks = []
+    while len(inode.direct_blocks) < first + CLUSTER_BLOCKS:
+        inode.direct_blocks.append(None)
+    inode.direct_blocks[first:first + CLUSTER_BLOCKS] = keep + [None] * (CLUSTER_BLOCKS - needed)
+    while inode.direct_blocks and inode.direct_blocks[-1] is None:
+        inode.direct_blocks.pop()
+
+    _cache_drop(old_key)
+    if keep:
+        _cache_put(tuple(keep), data)
+
+def read_range(inode, start_offset: int, length: int) -> bytes:
+    """
+    Read 'length' bytes at 'start_offset', decompressing only the clusters the range touches.
+    """
+    if length <= 0:
+        return b""
+    size = cluster_bytes()
+    out = []
+    pos, end = start_offset, start_offset + length
+    while pos < end:
+        cidx = pos // size
+        inner = pos - cidx * size
+        take = min(size - inner, end - pos)
+        out.append(load_cluster(inode, cidx)[inner:inner + take])
+        pos += take
+    return b"".join(out)
+
+def write_range(inode, start_offset: int, data: bytes) -> int:
+    """
+    Write 'data' at 'start_offset' by rewriting each cluster the range touches.
+    Returns bytes written; the caller updates file_size and persists the inode.
+    """
+    if not data:
+        return 0
+    size = cluster_bytes()
+    pos, written = start_offset, 0
+    while written < len(data):
+        cidx = pos // size
+        inner = pos - cidx * size
+        take = min(size - inner, len(data) - written)
+        if inner == 0 and take == size:
+            cluster = data[written:written + take]
+        else:
+            current = load_cluster(inode, cidx)
+            cluster = current[:inner] + data[written:written + take] + current[inner + take:]
+        store_cluster(inode, cidx, cluster)
+        pos += take
+        written += take
+    return written
+
+def rewrite(inode, data: bytes) -> None:
+    """
+    Replace the whole content of a compressed file with 'data', dropping clusters past the end.
+    """
+    size = cluster_bytes()
+    clusters = (len(data) + size - 1) // size
+    for cidx in range(clusters):
+        store_cluster(inode, cidx, data[cidx * size:(cidx + 1) * size])
+    tail = [b for b in (inode.direct_blocks or [])[clusters * CLUSTER_BLOCKS:] if b is not None]
+    if tail:
+        for cidx in range(clusters, (len(inode.direct_blocks) + CLUSTER_BLOCKS - 1) // CLUSTER_BLOCKS):
+            _cache_drop(tuple(b for b in _slots(inode, cidx) if b is not None))
+        free_blocks(tail)
+    inode.direct_blocks = list(inode.direct_blocks or [])[:clusters * CLUSTER_BLOCKS]
+    while inode.direct_blocks and inode.direct_blocks[-1] is None:
+        inode.direct_blocks.pop()
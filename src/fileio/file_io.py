@@ -1,23 +1,51 @@
 # src/fileio/file_io.py
 # File descriptor table and open/close/read/write/seek over the simulated filesystem.
 
-from typing import Dict, Optional
-from dataclasses import dataclass
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Union
+from dataclasses import dataclass, field
+from src.common.locks import inode_lock
+from src.common import metrics
+from src.common.metrics import timed
+from src.persistence.journal import journaled
 from src.persistence.mount import STATE
 from src.persistence.disk_io import read_block, write_block
-from src.inode_directory.resolver import resolve as resolve_name, get_inode, update_inode
-from src.block_bitmap.block_allocator import allocate_block, free_block
+from src.design.architecture import Inode
+from src.inode_directory.resolver import resolve as resolve_name, update_inode
+from src.inode_directory.resolver import pin_inode, unpin_inode, mark_inode_dirty, sync_inode
+from src.inode_directory.resolver import max_file_blocks, release_block_map
+from src.block_bitmap.block_allocator import allocate_block, allocate_blocks, free_block, free_blocks
+from src.block_bitmap.refcount import block_refcount, share_blocks
+from src.block_bitmap.dedup import hash_blocks, find_block, remember_blocks
 from src.fileio.offset_mapper import logical_to_block_index, logical_to_block_inner_offset
+from src.fileio import compression
 
 @dataclass
 class FDEntry:
     inode_number: int
     mode: str        # 'r', 'w', 'a', 'rw'
     cursor: int      # current file pointer in bytes
+    dedup: bool = False  # share full blocks whose content already exists on disk
+    # Live in-core inode (with its block map), shared by every fd open on the same inode
+    inode: Optional[Inode] = field(default=None, repr=False, compare=False)
+    # Serializes cursor updates when one fd is shared between threads
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
 
 # Global file descriptor table
 _FD_TABLE: Dict[int, FDEntry] = {}
 _NEXT_FD: int = 3  # mimic OS (0,1,2 reserved)
+_FD_LOCK = threading.Lock()  # guards _FD_TABLE and _NEXT_FD
+
+# Logical bytes read/written through this API, for write-amplification accounting
+_READ_STATS = metrics.stats_for("fileio", "read")
+_WRITE_STATS = metrics.stats_for("fileio", "write")
+
+def _get_entry(fd: int) -> FDEntry:
+    entry = _FD_TABLE.get(fd)
+    if entry is None:
+        raise ValueError("Invalid file descriptor")
+    return entry
 
 def _require_mounted():
     if not STATE.get("mounted"):
@@ -32,46 +60,71 @@ def _mode_perms(mode: str):
     can_write = 'w' in m or 'a' in m or 'rw' in m
     return can_read, can_write, 'a' in m
 
-def open_file(filename: str, mode: str = 'r') -> int:
+@timed("fileio", "open")
+@journaled
+def open_file(filename: str, mode: str = 'r', dedup: bool = False) -> int:
     """
     Open a file and return a file descriptor.
     Modes: 'r' (read), 'w' (write truncate), 'a' (append), 'rw' (read/write no truncate).
+    dedup=True makes block-aligned full-block writes through this fd deduplicate
+    against blocks already on disk (see block_bitmap.dedup).
     """
     _require_mounted()
     inum = resolve_name(filename)
     if inum is None:
         raise FileNotFoundError(f"'{filename}' not found")
 
-    inode = get_inode(inum)
-    if getattr(inode, "file_type", "file") != "file":
-        raise IsADirectoryError(f"'{filename}' is a directory")
-
     can_read, can_write, is_append = _mode_perms(mode)
     if not (can_read or can_write):
         raise ValueError("Invalid mode. Use 'r', 'w', 'a', or 'rw'.")
 
-    # 'w' truncates
-    if 'w' in mode and 'a' not in mode:
-        _truncate_inode_blocks(inode)
-        inode.file_size = 0
-        update_inode(inode)
+    with inode_lock(inum).write():
+        inode = pin_inode(inum)
+        try:
+            if getattr(inode, "file_type", "file") != "file":
+                raise IsADirectoryError(f"'{filename}' is a directory")
 
-    # initial cursor
-    cursor = inode.file_size if is_append else 0
+            # 'w' truncates ('rw' keeps existing content)
+            if 'w' in mode and 'a' not in mode and 'r' not in mode:
+                _truncate_inode_blocks(inode)
+                inode.file_size = 0
+                update_inode(inode)
+        except Exception:
+            unpin_inode(inum)
+            raise
+
+        # initial cursor
+        cursor = inode.file_size if is_append else 0
 
     global _NEXT_FD
-    fd = _NEXT_FD
-    _NEXT_FD += 1
-    _FD_TABLE[fd] = FDEntry(inode_number=inum, mode=mode, cursor=cursor)
+    with _FD_LOCK:
+        fd = _NEXT_FD
+        _NEXT_FD += 1
+        _FD_TABLE[fd] = FDEntry(inode_number=inum, mode=mode, cursor=cursor, dedup=dedup, inode=inode)
     return fd
 
+@timed("fileio", "close")
+@journaled
 def close_file(fd: int) -> None:
     """
-    Close a file descriptor.
+    Close a file descriptor; the last close of an inode writes its metadata back.
     """
-    if fd not in _FD_TABLE:
+    with _FD_LOCK:
+        entry = _FD_TABLE.pop(fd, None)
+    if entry is None:
         raise ValueError("Invalid file descriptor")
-    del _FD_TABLE[fd]
+    with inode_lock(entry.inode_number).write():
+        unpin_inode(entry.inode_number)
+
+@timed("fileio", "sync")
+@journaled
+def sync_file(fd: int) -> None:
+    """
+    Write the file's cached inode metadata (size, block map) back to the inode table.
+    """
+    entry = _get_entry(fd)
+    with inode_lock(entry.inode_number).write():
+        sync_inode(entry.inode_number)
 
 def seek_file(fd: int, offset: int, whence: int = 0) -> int:
     """
@@ -79,75 +132,131 @@ def seek_file(fd: int, offset: int, whence: int = 0) -> int:
     whence: 0 = start, 1 = current, 2 = end
     Returns the new cursor position.
     """
-    entry = _FD_TABLE.get(fd)
-    if entry is None:
-        raise ValueError("Invalid file descriptor")
-
-    inode = get_inode(entry.inode_number)
-    size = getattr(inode, "file_size", 0)
-
-    if whence == 0:
-        new_pos = offset
-    elif whence == 1:
-        new_pos = entry.cursor + offset
-    elif whence == 2:
-        new_pos = size + offset
-    else:
+    entry = _get_entry(fd)
+    if whence not in (0, 1, 2):
         raise ValueError("whence must be 0, 1, or 2")
 
-    if new_pos < 0:
-        raise ValueError("seek before start of file")
-    entry.cursor = new_pos
-    return entry.cursor
+    with entry.lock:
+        if whence == 0:
+            new_pos = offset
+        elif whence == 1:
+            new_pos = entry.cursor + offset
+        else:
+            with inode_lock(entry.inode_number).read():
+                new_pos = getattr(entry.inode, "file_size", 0) + offset
 
+        if new_pos < 0:
+            raise ValueError("seek before start of file")
+        entry.cursor = new_pos
+        return entry.cursor
+
+@timed("fileio", "read")
 def read_file(fd: int, size: int) -> bytes:
     """
     Read up to 'size' bytes from the current cursor.
     """
-    entry = _FD_TABLE.get(fd)
-    if entry is None:
-        raise ValueError("Invalid file descriptor")
+    entry = _get_entry(fd)
     can_read, _, _ = _mode_perms(entry.mode)
     if not can_read:
         raise PermissionError("File not open for reading")
 
-    inode = get_inode(entry.inode_number)
     bs = _block_size()
-    file_size = getattr(inode, "file_size", 0)
-    if entry.cursor >= file_size or size <= 0:
-        return b""
+    with entry.lock, inode_lock(entry.inode_number).read():
+        inode = entry.inode
+        file_size = getattr(inode, "file_size", 0)
+        if entry.cursor >= file_size or size <= 0:
+            return b""
 
-    to_read = min(size, file_size - entry.cursor)
-    data = _read_range(inode, entry.cursor, to_read, bs)
-    entry.cursor += len(data)
-    return data
+        to_read = min(size, file_size - entry.cursor)
+        data = _read_range(inode, entry.cursor, to_read, bs)
+        entry.cursor += len(data)
+        metrics.record_logical(_READ_STATS, read=len(data))
+        return data
 
+@timed("fileio", "write")
+@journaled
 def write_file(fd: int, data: bytes) -> int:
     """
     Write 'data' bytes at the current cursor; expand file and allocate blocks as needed.
     Returns the number of bytes written.
     """
-    entry = _FD_TABLE.get(fd)
-    if entry is None:
-        raise ValueError("Invalid file descriptor")
+    entry = _get_entry(fd)
     _, can_write, is_append = _mode_perms(entry.mode)
     if not can_write:
         raise PermissionError("File not open for writing")
 
-    inode = get_inode(entry.inode_number)
     bs = _block_size()
+    with entry.lock, inode_lock(entry.inode_number).write():
+        inode = entry.inode
 
-    # If appending, cursor should already be at end
-    # Ensure blocks exist to cover write range
-    bytes_written = _write_range(inode, entry.cursor, data, bs)
-    entry.cursor += bytes_written
+        # Appends always land at the current end, even if another fd grew the file meanwhile
+        if is_append:
+            entry.cursor = getattr(inode, "file_size", 0)
+        # Ensure blocks exist to cover write range
+        bytes_written = _write_range(inode, entry.cursor, data, bs, dedup=entry.dedup)
+        entry.cursor += bytes_written
+
+        # Update inode size if we wrote past previous end
+        new_end = entry.cursor
+        if new_end > getattr(inode, "file_size", 0):
+            inode.file_size = new_end
+        # Metadata is written back lazily (sync_file / last close_file)
+        mark_inode_dirty(entry.inode_number)
+        metrics.record_logical(_WRITE_STATS, written=bytes_written)
+        return bytes_written
+
+@timed("fileio", "fallocate")
+@journaled
+def fallocate_file(fd_or_name: Union[int, str], length: int, keep_size: bool = False) -> int:
+    """
+    Reserve blocks for the first 'length' bytes of a file up front, contiguously where possible.
+    Reserved blocks are recorded in the block map but not zeroed; later writes simply fill them.
+    keep_size=False grows file_size to 'length' (contents past the old end are unspecified until
+    written); keep_size=True reserves the blocks beyond EOF without changing the size.
+    Accepts an fd open for writing or a filename. Returns the number of newly reserved blocks.
+    """
+    _require_mounted()
+    if length < 0:
+        raise ValueError("length must be non-negative")
+    if isinstance(fd_or_name, int):
+        entry = _get_entry(fd_or_name)
+        _, can_write, _ = _mode_perms(entry.mode)
+        if not can_write:
+            raise PermissionError("File not open for writing")
+        inum = entry.inode_number
+    else:
+        inum = resolve_name(fd_or_name)
+        if inum is None:
+            raise FileNotFoundError(f"'{fd_or_name}' not found")
+
+    bs = _block_size()
+    needed = (length + bs - 1) // bs
+    if needed > max_file_blocks():
+        raise ValueError("File exceeds maximum size")
 
-    # Update inode size if we wrote past previous end
-    new_end = entry.cursor
-    if new_end > getattr(inode, "file_size", 0):
-        inode.file_size = new_end
-    update_inode(inode)
-    return bytes_written
+    with inode_lock(inum).write():
+        inode = pin_inode(inum)
+        try:
+            if getattr(inode, "file_type", "file") != "file":
+                raise IsADirectoryError(f"inode {inum} is a directory")
+            reserved = 0
+            # Compressed clusters are sized at write time, so there is nothing to reserve
+            if needed > 0 and not getattr(inode, "compression", ""):
+                _ensure_direct_capacity(inode, needed - 1)
+                missing = [i for i in range(needed) if inode.direct_blocks[i] is None]
+                if missing:
+                    # Aim for the block right after the one preceding the first gap
+                    prev = next((b for b in reversed(inode.direct_blocks[:missing[0]]) if b is not None), None)
+                    blocks = allocate_blocks(len(missing), goal=None if prev is None else prev + 1)
+                    for i, b in zip(missing, blocks):
+                        inode.direct_blocks[i] = b
+                    reserved = len(blocks)
+            if not keep_size and length > getattr(inode, "file_size", 0):
+                inode.file_size = length
+            mark_inode_dirty(inum)
+        finally:
+            unpin_inode(inum)
+    return reserved
 
 # Internal helpers
 
@@ -164,6 +273,8 @@ def _allocate_block_for_index(inode, block_index: int) -> int:
     """
     Ensure a block exists at direct_blocks[block_index]; allocate if None.
     """
+    if block_index >= max_file_blocks():
+        raise ValueError("File exceeds maximum size")
     _ensure_direct_capacity(inode, block_index)
     if inode.direct_blocks[block_index] is None:
         inode.direct_blocks[block_index] = allocate_block()
@@ -175,6 +286,8 @@ def _read_range(inode, start_offset: int, length: int, bs: int) -> bytes:
     """
     if length <= 0:
         return b""
+    if getattr(inode, "compression", ""):
+        return compression.read_range(inode, start_offset, length)
     chunks = []
     remaining = length
     cursor = start_offset
@@ -194,38 +307,99 @@ def _read_range(inode, start_offset: int, length: int, bs: int) -> bytes:
         remaining -= take
     return b"".join(chunks)
 
-def _write_range(inode, start_offset: int, data: bytes, bs: int) -> int:
+def _write_range(inode, start_offset: int, data: bytes, bs: int, dedup: bool = False) -> int:
     """
     Write 'data' starting at 'start_offset', allocating blocks as needed.
+    With dedup, block-aligned full blocks that already exist on disk are shared, not written.
     Returns bytes written.
     """
     if not data:
         return 0
+    if getattr(inode, "compression", ""):
+        # Compressed files rewrite whole clusters; dedup does not apply to them
+        return compression.write_range(inode, start_offset, data)
+    digests: Dict[int, bytes] = {}
+    if dedup:
+        # Data offsets of the chunks that cover a whole block
+        first = -start_offset % bs
+        aligned = list(range(first, len(data) - bs + 1, bs))
+        digests = dict(zip(aligned, hash_blocks([data[p:p + bs] for p in aligned])))
+    indexed: Dict[bytes, int] = {}
+    shared: List[int] = []
+    dropped: List[int] = []
+    # Blocks still mapped at indices of the range not yet written: sharing one of them would
+    # have the write land on it in place further on
+    last = logical_to_block_index(start_offset + len(data) - 1, bs)
+    ahead = Counter((inode.direct_blocks or [])[logical_to_block_index(start_offset, bs):last + 1])
+
     remaining = len(data)
     cursor = start_offset
     written = 0
     while remaining > 0:
         bidx = logical_to_block_index(cursor, bs)
         inner = logical_to_block_inner_offset(cursor, bs)
-        bnum = _allocate_block_for_index(inode, bidx)
-        # Read current block to preserve existing bytes before/after write region
-        block_buf = bytearray(read_block(bnum))
         take = min(bs - inner, remaining)
-        src_slice = data[written:written + take]
-        block_buf[inner:inner + take] = src_slice
-        write_block(bnum, bytes(block_buf), offset=0)
+        if bidx < len(inode.direct_blocks or []):
+            ahead[inode.direct_blocks[bidx]] -= 1
+        if written in digests:
+            target = _dedup_block(inode, bidx, digests[written], data[written:written + bs], indexed)
+            if target is not None and ahead[target] <= 0:
+                current = inode.direct_blocks[bidx]
+                if current != target:
+                    shared.append(target)
+                    if current is not None:
+                        dropped.append(current)
+                    inode.direct_blocks[bidx] = target
+                cursor += take
+                written += take
+                remaining -= take
+                continue
+        bnum = _allocate_block_for_index(inode, bidx)
+        if block_refcount(bnum) > 1:
+            # Shared with a clone: copy-on-write into a private block before modifying it
+            bnum = _unshare_block(inode, bidx, bnum, whole=(take == bs))
+        # Positional write of just the touched range; the rest of the block is preserved on disk
+        write_block(bnum, data[written:written + take], offset=inner)
+        if written in digests:
+            indexed[digests[written]] = bnum
         cursor += take
         written += take
         remaining -= take
+
+    # New references first, so a block that is both dropped and reused never hits zero
+    if shared:
+        share_blocks(shared)
+        free_blocks(dropped)
+    remember_blocks({b: d for d, b in indexed.items()})
     return written
 
+def _dedup_block(inode, block_index: int, digest: bytes, chunk: bytes, pending: Dict[bytes, int]) -> Optional[int]:
+    """
+    Find an existing block with this content for 'block_index' (None = write it normally).
+    """
+    if block_index >= max_file_blocks():
+        raise ValueError("File exceeds maximum size")
+    _ensure_direct_capacity(inode, block_index)
+    return find_block(digest, chunk, pending=pending)
+
+def _unshare_block(inode, block_index: int, shared: int, whole: bool) -> int:
+    """
+    Give the inode a private copy of a shared block and drop its reference on the original.
+    When the caller is about to overwrite the whole block the old contents are not copied.
+    """
+    private = allocate_block()
+    if not whole:
+        write_block(private, read_block(shared), offset=0)
+    inode.direct_blocks[block_index] = private
+    free_block(shared)
+    return private
+
 def _truncate_inode_blocks(inode) -> None:
     """
-    Free all direct blocks of the inode and clear list.
+    Free all data blocks (and the indirect tables) of the inode and clear list.
     """
     if not hasattr(inode, "direct_blocks") or inode.direct_blocks is None:
         return
-    for b in inode.direct_blocks:
-        if b is not None:
-            free_block(b)
-    inode.direct_blocks = []
\ No newline at end of file
+    free_blocks([b for b in inode.direct_blocks if b is not None])
+    inode.direct_blocks = []
+    release_block_map(inode)
\ No newline at end of file
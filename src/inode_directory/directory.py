@@ -2,9 +2,13 @@
 # Root directory: filename -> inode number mapping, persisted in a single data block.
 
 import json
+import threading
 from typing import Dict, Optional
+from src.common.deferral import deferring
+from src.common.metrics import timed
 from src.persistence.mount import STATE
-from src.persistence.disk_io import read_block, write_block
+from src.persistence.disk_io import read_block, write_metadata
+from src.persistence import usage
 from src.block_bitmap.block_allocator import allocate_block
 from src.design.architecture import DirectoryEntry
 
@@ -16,6 +20,13 @@ class DirectoryStore:
 
     def __init__(self):
         self._entries: Dict[str, int] = {}
+        # Held across load + mutate + flush so concurrent updates don't lose each other's entries.
+        self.lock = threading.RLock()
+        # True while in-memory entries hold changes a batch has not written yet;
+        # memory is authoritative then, so load() must not re-read the block.
+        self._dirty = False
+        # Directory block number, once known for this mount (it never moves)
+        self._block: Optional[int] = None
 
     def _require_mounted(self):
         if not STATE.get("mounted") or STATE.get("superblock") is None:
@@ -37,6 +48,12 @@ class DirectoryStore:
         into block 'bitmap_start_block - 1' as a tiny metadata hack (kept simple).
         For better design, store it in the root inode's direct_blocks; here we assume higher layer will do it.
         """
+        if self._block is not None:
+            return self._block
+        # A clean unmount left the pointer in the superblock summary
+        self._block = usage.summary("dir_block") or None
+        if self._block is not None:
+            return self._block
         # Minimal approach: read block right before bitmap region to hold a 4-byte pointer (not ideal but simple).
         sb = STATE["superblock"]
         pointer_block = sb.bitmap_start_block - 1
@@ -47,14 +64,19 @@ class DirectoryStore:
             dir_block = allocate_block()
             newbuf = bytearray(buf)
             newbuf[0:4] = int(dir_block).to_bytes(4, byteorder="little")
-            write_block(pointer_block, bytes(newbuf), offset=0)
+            write_metadata(pointer_block, bytes(newbuf), offset=0)
+        self._block = dir_block
+        usage.record_summary("dir_block", dir_block)
         return dir_block
 
+    @timed("directory", "load")
     def load(self) -> None:
         """
         Load directory entries from its block as JSON.
         """
         self._require_mounted()
+        if self._dirty:
+            return
         bnum = self._dir_block_num()
         raw = read_block(bnum)
         try:
@@ -69,22 +91,47 @@ class DirectoryStore:
             # If corrupt, start empty
             self._entries = {}
 
+    @timed("directory", "save")
     def _flush(self) -> None:
         """
-        Persist directory map as JSON to the directory block.
+        Persist directory map as JSON to the directory block (postponed while a batch is deferring).
         """
-        bnum = self._dir_block_num()
         sb = STATE["superblock"]
         payload = json.dumps(self._entries).encode("utf-8")
         if len(payload) > sb.block_size_bytes:
             raise ValueError("Directory entries exceed a single block")
-        write_block(bnum, payload, offset=0)
+        if deferring():
+            self._dirty = True
+            return
+        bnum = self._dir_block_num()
+        # Zero-pad so a shorter map never leaves stale JSON behind in the block
+        write_metadata(bnum, payload.ljust(sb.block_size_bytes, b"\x00"), offset=0)
+        self._dirty = False
+
+    def flush_pending(self) -> None:
+        """
+        Write out changes postponed by a batch.
+        """
+        with self.lock:
+            if self._dirty and STATE.get("mounted"):
+                self._dirty = False
+                self._flush()
+
+    def discard(self) -> None:
+        with self.lock:
+            self._entries = {}
+            self._dirty = False
+            self._block = None
 
     def add_entry(self, filename: str, inode_number: int) -> None:
         if filename in self._entries:
             raise FileExistsError("File already exists")
         self._entries[filename] = inode_number
-        self._flush()
+        try:
+            self._flush()
+        except ValueError:
+            del self._entries[filename]
+            raise
 
     def remove_entry(self, filename: str) -> None:
         if filename not in self._entries:
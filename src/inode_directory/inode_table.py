@@ -1,13 +1,49 @@
 # src/inode_directory/inode_table.py
 # Persistence-backed inode table: allocate/get/update/free inodes on disk.
 
-from typing import Optional
-from src.persistence.mount import STATE
-from src.persistence.disk_io import read_block, write_block
-from src.design.inode_serialisation import INODE_SIZE, inode_to_bytes, bytes_to_inode
+import struct
+import threading
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
+from src.common.deferral import deferring
+from src.common.metrics import timed
+from src.persistence.mount import STATE, register_unmount_hook
+from src.persistence.disk_io import read_block, read_blocks, write_metadata
+from src.persistence import usage
+from src.design.inode_serialisation import INODE_SIZE, DIRECT_POINTERS, inode_to_bytes, bytes_to_inode
 from src.design.architecture import Inode
+from src.block_bitmap.block_allocator import allocate_block, free_block
 import math
 
+# Serializes the scan-and-claim in allocate_inode; reads and slot writes need no lock.
+_ALLOC_LOCK = threading.Lock()
+
+@dataclass
+class _PinnedInode:
+    inode: Inode
+    pins: int = 0
+    dirty: bool = False
+    freed: bool = False
+
+# In-core inodes pinned by open file descriptions. While pinned, get_inode returns the
+# shared live object and metadata changes are written back lazily (sync_inode / last unpin).
+_PINNED: Dict[int, _PinnedInode] = {}
+_PIN_LOCK = threading.Lock()
+
+# Inode writes postponed by a batch: inode number -> latest Inode (None = freed slot).
+_DEFERRED: Dict[int, Optional[Inode]] = {}
+_DEFER_LOCK = threading.Lock()
+
+# Where the next allocate_inode scan starts; slots below it are known to be in use.
+# None until first needed after mount, then taken from the clean-unmount summary.
+_FREE_HINT: Optional[int] = None
+
+def _free_hint() -> int:
+    global _FREE_HINT
+    if _FREE_HINT is None:
+        _FREE_HINT = usage.summary("inode_hint")
+    return _FREE_HINT
+
 def _require_mounted():
     if not STATE.get("mounted") or STATE.get("superblock") is None:
         raise RuntimeError("Disk not mounted. Call mount() first.")
@@ -28,14 +64,175 @@ def _inode_slot_location(inode_number: int):
     offset_in_block = byte_offset % block_size
     return start + block_index, offset_in_block
 
+def _pointers_per_block() -> int:
+    return STATE["superblock"].block_size_bytes // 4
+
+# Block-map pointers past the direct ones, in logical order: each names the root of a tree of
+# pointer tables that is 'depth' tables deep and maps pointers_per_block ** depth blocks.
+_INDIRECT_ROOTS = (("indirect_block", 1), ("double_indirect_block", 2), ("triple_indirect_block", 3))
+
+def max_file_blocks() -> int:
+    """
+    Largest block map an inode can hold: the direct pointers plus the single, double and
+    triple indirect trees.
+    """
+    _require_mounted()
+    per_block = _pointers_per_block()
+    return DIRECT_POINTERS + sum(per_block ** depth for _, depth in _INDIRECT_ROOTS)
+
+def _read_indirect(block_num: int) -> List[Optional[int]]:
+    raw = read_block(block_num)
+    table = [b if b > 0 else None for b in struct.unpack(f"<{len(raw) // 4}i", raw)]
+    while table and table[-1] is None:
+        table.pop()
+    return table
+
+def _write_indirect(block_num: int, pointers: List[Optional[int]]) -> None:
+    per_block = _pointers_per_block()
+    packed = [-1 if b is None else b for b in pointers] + [-1] * (per_block - len(pointers))
+    write_metadata(block_num, struct.pack(f"<{per_block}i", *packed), offset=0)
+
+def _load_tree(root: int, depth: int) -> List[Optional[int]]:
+    """
+    Logical pointers mapped by the table tree at 'root', trailing holes dropped.
+    """
+    table = _read_indirect(root)
+    if depth == 1:
+        return table
+    span = _pointers_per_block() ** (depth - 1)
+    pointers: List[Optional[int]] = []
+    for i, child in enumerate(table):
+        if child is not None:
+            # Subtree i starts at i * span whatever the ones before it mapped
+            pointers += [None] * (i * span - len(pointers))
+            pointers += _load_tree(child, depth - 1)
+    return pointers
+
+def _store_tree(root: Optional[int], pointers: List[Optional[int]], depth: int) -> Optional[int]:
+    """
+    Make the table tree at 'root' map 'pointers', allocating tables for subtrees that gained
+    blocks and freeing the ones left empty. Tables whose content is unchanged are not rewritten.
+    Returns the (possibly new) root, None when nothing is mapped.
+    """
+    if all(b is None for b in pointers):
+        if root is not None:
+            _free_tree(root, depth)
+        return None
+    old = _read_indirect(root) if root is not None else None
+    if root is None:
+        root = allocate_block()
+    if depth == 1:
+        table = list(pointers)
+    else:
+        span = _pointers_per_block() ** (depth - 1)
+        children = old or []
+        table = [_store_tree(children[i] if i < len(children) else None, pointers[i * span:(i + 1) * span],
+                             depth - 1)
+                 for i in range(-(-len(pointers) // span))]
+        for child in children[len(table):]:
+            if child is not None:
+                _free_tree(child, depth - 1)
+    while table and table[-1] is None:
+        table.pop()
+    if table != old:
+        _write_indirect(root, table)
+    return root
+
+def _free_tree(root: int, depth: int) -> None:
+    if depth > 1:
+        for child in _read_indirect(root):
+            if child is not None:
+                _free_tree(child, depth - 1)
+    free_block(root)
+
+def _tree_tables(pointers: List[Optional[int]], depth: int) -> int:
+    if all(b is None for b in pointers):
+        return 0
+    if depth == 1:
+        return 1
+    span = _pointers_per_block() ** (depth - 1)
+    return 1 + sum(_tree_tables(pointers[i:i + span], depth - 1) for i in range(0, len(pointers), span))
+
+def _segments(blocks: List[Optional[int]]):
+    """
+    Split a block map past the direct pointers into (root attribute, depth, pointers) per tree.
+    """
+    per_block = _pointers_per_block()
+    pos = DIRECT_POINTERS
+    for attr, depth in _INDIRECT_ROOTS:
+        span = per_block ** depth
+        yield attr, depth, blocks[pos:pos + span]
+        pos += span
+
+def _load_block_map(inode: Inode) -> None:
+    """
+    Present the full logical block map: direct pointers followed by every indirect tree.
+    """
+    roots = [getattr(inode, attr) for attr, _ in _INDIRECT_ROOTS]
+    if not inode.file_type or all(root is None for root in roots):
+        return
+    per_block = _pointers_per_block()
+    blocks = list(inode.direct_blocks)
+    reach = DIRECT_POINTERS
+    for (_, depth), root in zip(_INDIRECT_ROOTS, roots):
+        if root is not None:
+            # Each tree starts where the reach of the ones before it ends
+            blocks += [None] * (reach - len(blocks))
+            blocks += _load_tree(root, depth)
+        reach += per_block ** depth
+    while blocks and blocks[-1] is None:
+        blocks.pop()
+    inode.direct_blocks = blocks
+
+def _store_block_map(inode: Inode) -> Inode:
+    """
+    Spill block-map entries past the direct pointers into the inode's indirect trees,
+    allocating or releasing pointer tables as the map grows or shrinks.
+    Returns a copy of the inode whose direct_blocks fit the on-disk record.
+    """
+    blocks = list(inode.direct_blocks or [])
+    while blocks and blocks[-1] is None:
+        blocks.pop()
+    if len(blocks) > max_file_blocks():
+        raise ValueError("File exceeds maximum size (direct + triple indirect blocks)")
+    for attr, depth, pointers in _segments(blocks):
+        setattr(inode, attr, _store_tree(getattr(inode, attr), pointers, depth))
+    return replace(inode, direct_blocks=blocks[:DIRECT_POINTERS])
+
+def indirect_table_count(inode: Inode) -> int:
+    """
+    Pointer-table blocks the inode's block map occupies once stored.
+    """
+    blocks = list(inode.direct_blocks or [])
+    return sum(_tree_tables(pointers, depth) for _, depth, pointers in _segments(blocks))
+
+def release_block_map(inode: Inode) -> None:
+    """
+    Free every pointer table of the inode as last stored and detach its indirect trees.
+    The caller frees the data blocks.
+    """
+    for attr, depth in _INDIRECT_ROOTS:
+        root = getattr(inode, attr)
+        if root is not None:
+            _free_tree(root, depth)
+            setattr(inode, attr, None)
+
+@timed("inode", "read")
 def get_inode(inode_number: int) -> Inode:
     """
     Read an inode from the inode table and deserialize it.
+    Pinned inodes are served from memory without touching the inode table.
     """
     _require_mounted()
+    pinned = _PINNED.get(inode_number)
+    if pinned is not None:
+        return pinned.inode
     start, blocks, block_size, inode_count = _inode_table_bounds()
     if inode_number < 0 or inode_number >= inode_count:
         raise IndexError("Invalid inode number")
+    if inode_number in _DEFERRED:
+        deferred = _DEFERRED[inode_number]
+        return deferred if deferred is not None else bytes_to_inode(bytes(INODE_SIZE), inode_number)
 
     block_num, offset = _inode_slot_location(inode_number)
     if block_num < start or block_num >= start + blocks:
@@ -52,8 +249,57 @@ def get_inode(inode_number: int) -> Inode:
         remaining = INODE_SIZE - len(first_part)
         inode_bytes = first_part + next_buf[:remaining]
 
-    return bytes_to_inode(inode_bytes)
+    inode = bytes_to_inode(inode_bytes, inode_number)
+    _load_block_map(inode)
+    return inode
 
+@timed("inode", "read_many")
+def get_inodes(inode_numbers: List[int]) -> Dict[int, Inode]:
+    """
+    Bulk get_inode: every inode-table block holding a requested slot is read once, in block
+    order, with consecutive blocks coalesced into a single read.
+    """
+    _require_mounted()
+    start, blocks, block_size, inode_count = _inode_table_bounds()
+    result: Dict[int, Inode] = {}
+    wanted: Dict[int, int] = {}
+    needed = set()
+    for inum in inode_numbers:
+        if inum in result or inum in wanted:
+            continue
+        if inum < 0 or inum >= inode_count:
+            raise IndexError("Invalid inode number")
+        if inum in _PINNED or inum in _DEFERRED:
+            result[inum] = get_inode(inum)
+            continue
+        block_num, offset = _inode_slot_location(inum)
+        wanted[inum] = (block_num - start) * block_size + offset
+        needed.add(block_num)
+        if offset + INODE_SIZE > block_size:
+            needed.add(block_num + 1)
+
+    cache: Dict[int, bytes] = {}
+    order = sorted(needed)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and order[j + 1] == order[j] + 1:
+            j += 1
+        raw = read_blocks(order[i], j - i + 1)
+        for k in range(j - i + 1):
+            cache[order[i] + k] = raw[k * block_size:(k + 1) * block_size]
+        i = j + 1
+
+    for inum, pos in sorted(wanted.items(), key=lambda item: item[1]):
+        first = start + pos // block_size
+        offset = pos % block_size
+        buf = cache[first] if offset + INODE_SIZE <= block_size else cache[first] + cache[first + 1]
+        inode = bytes_to_inode(buf[offset:offset + INODE_SIZE], inum)
+        _load_block_map(inode)
+        result[inum] = inode
+    return result
+
+@timed("inode", "write")
 def update_inode(inode: Inode) -> None:
     """
     Serialize and write the inode back to the inode table.
@@ -63,63 +309,191 @@ def update_inode(inode: Inode) -> None:
     if inode.inode_number < 0 or inode.inode_number >= inode_count:
         raise IndexError("Invalid inode number")
 
-    inode_bytes = inode_to_bytes(inode)
+    pinned = _PINNED.get(inode.inode_number)
+    if pinned is not None:
+        if pinned.inode is not inode:
+            # Keep the shared in-core copy authoritative for every open fd
+            pinned.inode.__dict__.update(inode.__dict__)
+            inode = pinned.inode
+        pinned.dirty = False
+        pinned.freed = False
+
+    if deferring():
+        # Batch in progress: remember the object, serialize it once at flush time
+        with _DEFER_LOCK:
+            _DEFERRED[inode.inode_number] = inode
+        return
+    _DEFERRED.pop(inode.inode_number, None)
+
+    inode_bytes = inode_to_bytes(_store_block_map(inode))
     if len(inode_bytes) != INODE_SIZE:
         raise ValueError("Serialized inode size mismatch")
+    _write_slot(inode.inode_number, inode_bytes)
 
-    block_num, offset = _inode_slot_location(inode.inode_number)
+def _write_slot(inode_number: int, inode_bytes: bytes) -> None:
+    start, blocks, block_size, _ = _inode_table_bounds()
+    block_num, offset = _inode_slot_location(inode_number)
     if block_num < start or block_num >= start + blocks:
         raise IndexError("Inode location out of inode table bounds")
 
     # If write crosses the block boundary, perform two writes
     if offset + INODE_SIZE <= block_size:
-        write_block(block_num, inode_bytes, offset=offset)
+        write_metadata(block_num, inode_bytes, offset=offset)
     else:
         first_len = block_size - offset
-        write_block(block_num, inode_bytes[:first_len], offset=offset)
-        write_block(block_num + 1, inode_bytes[first_len:], offset=0)
+        write_metadata(block_num, inode_bytes[:first_len], offset=offset)
+        write_metadata(block_num + 1, inode_bytes[first_len:], offset=0)
+
+@timed("inode", "flush_deferred")
+def flush_deferred_inodes() -> None:
+    """
+    Write out inodes postponed by a batch, patching each inode-table block once.
+    """
+    with _DEFER_LOCK:
+        pending = sorted(_DEFERRED.items())
+        _DEFERRED.clear()
+    if not pending or not STATE.get("mounted"):
+        return
+    _, _, block_size, _ = _inode_table_bounds()
+    by_block: Dict[int, List] = {}
+    for inum, inode in pending:
+        raw = bytes(INODE_SIZE) if inode is None else inode_to_bytes(_store_block_map(inode))
+        block_num, offset = _inode_slot_location(inum)
+        if offset + INODE_SIZE > block_size:
+            _write_slot(inum, raw)
+        else:
+            by_block.setdefault(block_num, []).append((offset, raw))
+    for block_num, slots in by_block.items():
+        buf = bytearray(read_block(block_num))
+        for offset, raw in slots:
+            buf[offset:offset + INODE_SIZE] = raw
+        write_metadata(block_num, bytes(buf), offset=0)
 
+@timed("inode", "allocate")
 def allocate_inode() -> Inode:
     """
     Find a free inode slot and return an initialized Inode.
     Free slots are indicated by inode_number field == index and default values.
-    Strategy: first-fit scan for an inode with file_type 'file' and size==0 and no blocks,
-    but we rely on a simple marker: file_type empty (not set). We create a fresh Inode.
+    Strategy: first-fit scan relying on a simple marker: file_type empty (not set). We create a fresh Inode.
     """
+    global _FREE_HINT
     _require_mounted()
     _, _, _, inode_count = _inode_table_bounds()
 
-    # Scan for a slot whose direct_blocks are all None and file_size==0 and file_type unset
-    # We will read each inode; if it's an uninitialized block (all zeros), bytes_to_inode should map to defaults.
-    for i in range(inode_count):
-        inode = get_inode(i)
-        # Heuristic: consider free if both file_size==0 and file_type=='file' and no blocks,
-        # but this can collide. More robust: we treat 'flags' field later.
-        # For now: if file_size==0 and all blocks None and indirect None and filename not set (architecture has no filename).
-        if inode.file_size == 0 and all(b is None for b in inode.direct_blocks) and inode.indirect_block is None:
-            # Assign as 'file' by default; directory will overwrite file_type if needed.
-            inode.file_type = "file"
-            inode.inode_number = i
-            update_inode(inode)
-            return inode
+    # Scan for a slot whose file_type is unset; an uninitialized (all zeros) slot decodes that way.
+    # Scan and claim happen under one lock so concurrent creators never get the same slot.
+    # The scan starts at _FREE_HINT (wrapping), so back-to-back creates don't rescan used slots.
+    with _ALLOC_LOCK:
+        hint = _free_hint()
+        for n in range(inode_count):
+            i = (hint + n) % inode_count
+            inode = get_inode(i)
+            if _is_free(inode):
+                # Assign as 'file' by default; directory will overwrite file_type if needed.
+                inode.file_type = "file"
+                inode.inode_number = i
+                update_inode(inode)
+                _FREE_HINT = i + 1
+                usage.adjust("inodes", -1)
+                return inode
 
     raise RuntimeError("No free inodes available")
 
+@timed("inode", "free")
 def free_inode(inode_number: int) -> None:
     """
     Mark inode as free by zeroing its serialized bytes.
     """
+    global _FREE_HINT
     _require_mounted()
+    pinned = _PINNED.get(inode_number)
+    if pinned is not None:
+        # Still open somewhere: never write the stale in-core copy back over the free slot
+        pinned.dirty = False
+        pinned.freed = True
+    _FREE_HINT = min(_free_hint(), inode_number)
+    with _ALLOC_LOCK:
+        usage.adjust("inodes", 1)
+    if deferring():
+        with _DEFER_LOCK:
+            _DEFERRED[inode_number] = None
+        return
+    _DEFERRED.pop(inode_number, None)
     # Write an all-zero inode record at the slot to mark it free
-    zero = b"\x00" * INODE_SIZE
-    block_num, offset = _inode_slot_location(inode_number)
-    start, blocks, block_size, _ = _inode_table_bounds()
-    if block_num < start or block_num >= start + blocks:
-        raise IndexError("Inode location out of inode table bounds")
+    _write_slot(inode_number, b"\x00" * INODE_SIZE)
 
-    if offset + INODE_SIZE <= block_size:
-        write_block(block_num, zero, offset=offset)
-    else:
-        first_len = block_size - offset
-        write_block(block_num, zero[:first_len], offset=offset)
-        write_block(block_num + 1, zero[first_len:], offset=0)
\ No newline at end of file
+def _is_free(inode: Inode) -> bool:
+    return (not inode.file_type and inode.file_size == 0
+            and all(getattr(inode, attr) is None for attr, _ in _INDIRECT_ROOTS))
+
+def free_inode_count() -> int:
+    """
+    Number of free inode slots, from the incrementally kept counter (no table scan once known).
+    """
+    _require_mounted()
+    _, _, _, inode_count = _inode_table_bounds()
+    with _ALLOC_LOCK:
+        return usage.free_count(
+            "inodes", lambda: sum(1 for inode in get_inodes(list(range(inode_count))).values() if _is_free(inode)))
+
+def pin_inode(inode_number: int) -> Inode:
+    """
+    Load an inode into the in-core table (once) and take a reference on it.
+    Every caller pinning the same inode number shares one live object.
+    """
+    _require_mounted()
+    with _PIN_LOCK:
+        pinned = _PINNED.get(inode_number)
+        if pinned is None:
+            pinned = _PinnedInode(inode=get_inode(inode_number))
+            _PINNED[inode_number] = pinned
+        pinned.pins += 1
+        return pinned.inode
+
+def mark_inode_dirty(inode_number: int) -> None:
+    """
+    Record that a pinned inode's metadata changed; written back by sync_inode or the last unpin.
+    Unpinned inodes are written through immediately.
+    """
+    pinned = _PINNED.get(inode_number)
+    if pinned is None:
+        update_inode(get_inode(inode_number))
+    elif not pinned.freed:
+        pinned.dirty = True
+
+def sync_inode(inode_number: int) -> None:
+    """
+    Write a pinned inode back to the inode table if it has unsaved changes.
+    """
+    pinned = _PINNED.get(inode_number)
+    if pinned is not None and pinned.dirty:
+        update_inode(pinned.inode)
+
+def unpin_inode(inode_number: int) -> None:
+    """
+    Drop a reference taken by pin_inode; the last reference writes back and evicts the inode.
+    """
+    with _PIN_LOCK:
+        pinned = _PINNED.get(inode_number)
+        if pinned is None:
+            return
+        pinned.pins -= 1
+        if pinned.pins > 0:
+            return
+        if pinned.dirty:
+            update_inode(pinned.inode)
+        del _PINNED[inode_number]
+
+def _flush_pinned() -> None:
+    global _FREE_HINT
+    with _PIN_LOCK:
+        for pinned in _PINNED.values():
+            if pinned.dirty:
+                update_inode(pinned.inode)
+        _PINNED.clear()
+    flush_deferred_inodes()
+    if _FREE_HINT is not None:
+        usage.record_summary("inode_hint", _FREE_HINT)
+    _FREE_HINT = None
+
+register_unmount_hook(_flush_pinned)
@@ -1,14 +1,26 @@
 # src/inode_directory/resolver.py
 # High-level functions matching architecture contracts, delegating to inode table and directory store.
 
-from typing import Optional, List
+from typing import Dict, Iterable, Optional, List
 from src.design.architecture import Inode
 from .inode_table import allocate_inode as _alloc_inode, free_inode as _free_inode
-from .inode_table import get_inode as _get_inode, update_inode as _update_inode
+from .inode_table import get_inode as _get_inode, update_inode as _update_inode, get_inodes as _get_inodes
+from .inode_table import pin_inode, unpin_inode, mark_inode_dirty, sync_inode, max_file_blocks
+from .inode_table import free_inode_count, indirect_table_count, release_block_map
 from .directory import DirectoryStore
+from src.persistence.mount import register_unmount_hook
 
 _dir = DirectoryStore()
 
+def flush_directory() -> None:
+    _dir.flush_pending()
+
+def _release_directory() -> None:
+    _dir.flush_pending()
+    _dir.discard()
+
+register_unmount_hook(_release_directory)
+
 def allocate_inode() -> Inode:
     inode = _alloc_inode()
     return inode
@@ -19,21 +31,36 @@ def free_inode(inode_number: int) -> None:
 def get_inode(inode_number: int) -> Inode:
     return _get_inode(inode_number)
 
+def get_inodes(inode_numbers: Iterable[int]) -> Dict[int, Inode]:
+    return _get_inodes(list(inode_numbers))
+
 def update_inode(inode: Inode) -> None:
     _update_inode(inode)
 
 def add_entry(filename: str, inode_number: int) -> None:
-    _dir.load()
-    _dir.add_entry(filename, inode_number)
+    with _dir.lock:
+        _dir.load()
+        _dir.add_entry(filename, inode_number)
 
 def remove_entry(filename: str) -> None:
-    _dir.load()
-    _dir.remove_entry(filename)
+    with _dir.lock:
+        _dir.load()
+        _dir.remove_entry(filename)
 
 def resolve(filename: str) -> Optional[int]:
-    _dir.load()
-    return _dir.resolve(filename)
+    with _dir.lock:
+        _dir.load()
+        return _dir.resolve(filename)
+
+def resolve_many(filenames: Iterable[str]) -> Dict[str, Optional[int]]:
+    """
+    Resolve several names against one load of the directory.
+    """
+    with _dir.lock:
+        _dir.load()
+        return {name: _dir.resolve(name) for name in filenames}
 
 def list_files() -> List[str]:
-    _dir.load()
-    return [name for name, _ in _dir.list_entries()]
\ No newline at end of file
+    with _dir.lock:
+        _dir.load()
+        return [name for name, _ in _dir.list_entries()]
\ No newline at end of file
@@ -8,7 +8,18 @@ DEFAULT_TOTAL_BLOCKS = 2048
 DEFAULT_BLOCK_SIZE = 512
 DEFAULT_INODE_COUNT = 256
 
-def _compute_layout(total_blocks, block_size_bytes, inode_count):
+# Metadata journal size when none is given: 1/32 of the image, at least 16 and at most 4096 blocks
+MIN_JOURNAL_BLOCKS = 16
+MAX_JOURNAL_BLOCKS = 4096
+
+def default_journal_blocks(total_blocks):
+    return min(max(total_blocks // 32, MIN_JOURNAL_BLOCKS), MAX_JOURNAL_BLOCKS)
+
+def _compute_layout(total_blocks, block_size_bytes, inode_count, journal_blocks=None):
+    if journal_blocks is None:
+        journal_blocks = default_journal_blocks(total_blocks)
+    if journal_blocks and journal_blocks < 2:
+        raise ValueError("The journal needs at least 2 blocks (header and one record).")
     inode_table_bytes = inode_count * INODE_SIZE
     inode_table_blocks = math.ceil(inode_table_bytes / block_size_bytes)
 
@@ -17,7 +28,8 @@ def _compute_layout(total_blocks, block_size_bytes, inode_count):
 
     inode_start_block = 1
     bitmap_start_block = inode_start_block + inode_table_blocks
-    data_start_block = bitmap_start_block + bitmap_blocks
+    journal_start_block = bitmap_start_block + bitmap_blocks
+    data_start_block = journal_start_block + journal_blocks
 
     if data_start_block >= total_blocks:
         raise ValueError("Layout exceeds total blocks. Increase total_blocks or reduce inode_count.")
@@ -36,36 +48,38 @@ def _compute_layout(total_blocks, block_size_bytes, inode_count):
         data_start_block=data_start_block,
         root_inode_number=0,
         checksum=0,
+        journal_start_block=journal_start_block if journal_blocks else 0,
+        journal_blocks=journal_blocks,
     )
 
 def initialize_disk(disk_path=DEFAULT_DISK_PATH, total_blocks=DEFAULT_TOTAL_BLOCKS,
-                    block_size_bytes=DEFAULT_BLOCK_SIZE, inode_count=DEFAULT_INODE_COUNT):
-    sb = _compute_layout(total_blocks, block_size_bytes, inode_count)
+                    block_size_bytes=DEFAULT_BLOCK_SIZE, inode_count=DEFAULT_INODE_COUNT, journal_blocks=None):
+    """
+    Format 'disk_path'. journal_blocks sizes the metadata journal (None: default_journal_blocks,
+    0: no journal, metadata is written in place as on images from before the journal).
+    """
+    sb = _compute_layout(total_blocks, block_size_bytes, inode_count, journal_blocks)
+    # Superblock, inode table, bitmap and journal are contiguous from block 0 and start out allocated;
+    # the root inode is the only inode in use. Recorded clean (counters and summary) so the first
+    # df needs no scan.
+    sb.free_blocks = total_blocks - sb.data_start_block
+    sb.free_inodes = inode_count - 1
+    sb.block_hint = sb.data_start_block
+    sb.inode_hint = 1
+    sb.clean = 7
 
     if os.path.dirname(disk_path):
         os.makedirs(os.path.dirname(disk_path), exist_ok=True)
 
-    with open(disk_path, "wb") as f:
-        f.truncate(total_blocks * block_size_bytes)
-
-    # Write superblock
+    # to_bytes pads to 512; only the packed fields have to fit in a (possibly smaller) block
     sb_bytes = to_bytes(sb)
-    if len(sb_bytes) > sb.block_size_bytes:
+    if len(sb_bytes.rstrip(b"\x00")) > sb.block_size_bytes:
         raise ValueError("Superblock bytes exceed block size")
-    sb_block = sb_bytes.ljust(sb.block_size_bytes, b"\x00")
-    with open(disk_path, "r+b") as f:
-        f.seek(0)
-        f.write(sb_block)
+    sb_block = sb_bytes[:sb.block_size_bytes].ljust(sb.block_size_bytes, b"\x00")
 
-    # Zero inode table + bitmap
-    zero_block = b"\x00" * sb.block_size_bytes
-    with open(disk_path, "r+b") as f:
-        for i in range(sb.inode_table_blocks):
-            f.seek((sb.inode_start_block + i) * sb.block_size_bytes)
-            f.write(zero_block)
-        for i in range(sb.bitmap_blocks):
-            f.seek((sb.bitmap_start_block + i) * sb.block_size_bytes)
-            f.write(zero_block)
+    # Only the bitmap bytes covering the reserved region are non-zero
+    full, rest = divmod(sb.data_start_block, 8)
+    bitmap_head = b"\xff" * full + (bytes([(1 << rest) - 1]) if rest else b"")
 
     # Initialize root inode (reserve first data block for root directory)
     root_first_block = sb.data_start_block
@@ -82,10 +96,19 @@ def initialize_disk(disk_path=DEFAULT_DISK_PATH, total_blocks=DEFAULT_TOTAL_BLOC
         mode=0o755,
         ctime=0, mtime=0, atime=0
     )
-    inode_offset = sb.inode_start_block * sb.block_size_bytes
-    with open(disk_path, "r+b") as f:
-        f.seek(inode_offset)
+
+    # One open: truncating to zero and extending leaves the whole image a hole, so formatting
+    # costs the same for any size. Everything else reads back as zeros, which the inode table
+    # (free slot), bitmap (free block) and pointer block (nothing allocated) treat as empty;
+    # they are filled in lazily by the first allocation that touches them. An all-zero journal
+    # header means an empty journal.
+    with open(disk_path, "wb") as f:
+        f.truncate(total_blocks * block_size_bytes)
+        f.write(sb_block)
+        f.seek(sb.inode_start_block * sb.block_size_bytes)
         f.write(inode_to_bytes(root_inode))
+        f.seek(sb.bitmap_start_block * sb.block_size_bytes)
+        f.write(bitmap_head)
 
     print(f"[INIT] Disk created at {disk_path}")
     print(f"[INIT] Blocks: {sb.total_blocks}, Block size: {sb.block_size_bytes} bytes")
@@ -0,0 +1,448 @@
+# src/persistence/journal.py
+# Write-ahead metadata journal with group commit.
+#
+# Every metadata write (disk_io.write_metadata) is staged as a whole-block image in the running
+# transaction and in disk_io's overlay, which serves reads until the block is home again. API
+# operations run inside journal handles (@journaled / transaction()); concurrent operations join
+# the same transaction, and the last one to finish commits it: one sequential write of a record
+# (descriptor naming the blocks, the block images, a CRC32 over both) into the journal region.
+# A transaction that grows past half the journal, or stays open longer than COMMIT_INTERVAL while
+# operations keep overlapping, is locked: new operations wait until it has committed. A metadata
+# write outside any handle (direct layer calls, mount and unmount work) is its own transaction.
+#
+# A background thread checkpoints committed transactions every CHECKPOINT_INTERVAL: each block is
+# written home once however many transactions changed it, then the journal header is advanced
+# past them. mount() replays the records after the header's tail whose sequence numbers and
+# checksums are intact; a torn last record is ignored. Records never wrap: when the next one does
+# not fit, everything is checkpointed and the journal restarts at its first record slot. A
+# transaction larger than the whole journal is written home in place instead, with no crash
+# atomicity ("oversized" in the stats).
+#
+# Data blocks are not journaled; they are written in place before the operation's transaction
+# commits (ordered mode). Blocks freed by a transaction are only reused once it has committed
+# (bitmap.py), so a replay never hands back a block whose content was already overwritten.
+#
+# On-disk: journal block 0 is the header (magic, next sequence number, tail record slot); records
+# follow from block 1. Durability is that of the positional writes themselves (no fsync).
+
+import functools
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.common import metrics
+from src.common.metrics import timed
+from src.persistence import disk_io
+
+_HEADER_MAGIC = 0x4A4E4C48  # "HLNJ"
+_RECORD_MAGIC = 0x4A4E4C52  # "RLNJ"
+_HEADER = struct.Struct("<I I I")    # magic, sequence number of the tail record, tail slot
+_RECORD = struct.Struct("<I I I I")  # magic, sequence number, block count, crc32
+
+# Longest a transaction stays open while operations keep overlapping (seconds)
+COMMIT_INTERVAL = 0.05
+# How often the background thread writes committed transactions home (seconds)
+CHECKPOINT_INTERVAL = 0.1
+
+# A block image is charged to the layer that staged it, once per transaction, as disk/write_logged;
+# the record write itself then only counts its descriptor blocks
+_LOGGED = metrics.stats_for("disk", "write_logged")
+
+class _Handle(threading.local):
+    depth = 0
+
+_HANDLE = _Handle()
+
+def _record_blocks(count: int, block_size: int) -> Tuple[int, int]:
+    """
+    Descriptor blocks and total blocks of a record carrying 'count' block images.
+    """
+    descriptor = -(-(_RECORD.size + 4 * count) // block_size)
+    return descriptor, descriptor + count
+
+def _checksum(seq: int, refs: bytes, images: bytes) -> int:
+    return zlib.crc32(images, zlib.crc32(refs, zlib.crc32(struct.pack("<I", seq))))
+
+class _Journal:
+    def __init__(self, device, sb, seq: int, header_valid: bool):
+        self.device = device
+        self.start = sb.journal_start_block
+        self.blocks = sb.journal_blocks
+        self.block_size = sb.block_size_bytes
+
+        # Running transaction, guarded by 'cond'
+        self.cond = threading.Condition()
+        self.running: Dict[int, bytes] = {}
+        self.seq = seq                 # sequence number the running transaction will commit as
+        self.committed = seq - 1       # newest sequence number durable in the journal
+        self.active = 0                # handles open in the running transaction
+        self.joined = 0                # operations that joined it
+        self.locked = False            # full or old: new operations wait for the commit
+        self.opened = 0.0
+
+        # Journal region, written by one committer at a time (in sequence order)
+        self.head = 1
+        self.header_valid = header_valid
+
+        # Committed, not yet home: (sequence number, slot after the record, images), oldest first
+        self.queue: List[Tuple[int, int, Dict[int, bytes]]] = []
+        self.queue_cond = threading.Condition()
+        self.checkpoint_lock = threading.Lock()
+        self.stopping = False
+        self.failure: Optional[BaseException] = None  # what stopped the checkpoint thread
+        self.stats = {"transactions": 0, "operations": 0, "blocks_logged": 0,
+                      "blocks_checkpointed": 0, "checkpoints": 0, "oversized": 0, "checkpoint_errors": 0}
+        self.thread = threading.Thread(target=self._run, name="journal-checkpoint", daemon=True)
+
+    # Handles
+
+    def enter(self, wait: bool) -> None:
+        with self.cond:
+            while wait and self.locked:
+                self.cond.wait()
+            self.active += 1
+            if wait:
+                self.joined += 1
+
+    def leave(self) -> None:
+        with self.cond:
+            self.active -= 1
+            if self.active:
+                return
+            if not self.running:
+                # Read-only operations: nothing to commit
+                self.joined = 0
+                self.locked = False
+                self.cond.notify_all()
+                return
+            tx, seq, ops = self.running, self.seq, self.joined
+            self.running = {}
+            self.seq += 1
+            self.joined = 0
+            self.locked = False
+            self.cond.notify_all()
+        self._commit(seq, tx, ops)
+
+    def stage(self, block: int, data: bytes, offset: int = 0) -> int:
+        bare = not _HANDLE.depth
+        if bare:
+            self.enter(wait=False)
+        try:
+            started = time.perf_counter_ns()
+            with self.cond:
+                if offset or len(data) != self.block_size:
+                    base = disk_io.read_block(block)
+                    data = base[:offset] + data + base[offset + len(data):]
+                elif not isinstance(data, bytes):
+                    data = bytes(data)
+                if not self.running:
+                    self.opened = time.monotonic()
+                new = block not in self.running
+                self.running[block] = disk_io._OVERLAY[block] = data
+                if 2 * len(self.running) >= self.blocks:
+                    self.locked = True
+                seq = self.seq
+            if new:
+                metrics.record_io(_LOGGED, started, block, blocks_written=1, bytes_written=self.block_size)
+            return seq
+        finally:
+            if bare:
+                self.leave()
+
+    # Commit
+
+    @timed("journal", "commit")
+    def _commit(self, seq: int, tx: Dict[int, bytes], ops: int) -> None:
+        with self.cond:
+            while self.committed < seq - 1:
+                self.cond.wait()
+        try:
+            self._write_record(seq, tx)
+        finally:
+            with self.cond:
+                self.committed = seq
+                self.stats["transactions"] += 1
+                self.stats["operations"] += ops
+                self.stats["blocks_logged"] += len(tx)
+                self.cond.notify_all()
+
+    def _write_record(self, seq: int, tx: Dict[int, bytes]) -> None:
+        numbers = sorted(tx)
+        descriptor, size = _record_blocks(len(numbers), self.block_size)
+        if size > self.blocks - 1:
+            # Larger than the whole journal: written in place, without crash atomicity
+            self.checkpoint()
+            for b in numbers:
+                disk_io.write_home(b, tx[b])
+            self._retire(tx)
+            self.checkpoint(restart_seq=seq + 1)
+            self.head = 1
+            self.stats["oversized"] += 1
+            return
+        restart = not self.header_valid or self.head + size > self.blocks
+        if restart:
+            # Everything before goes home first; the header then moves to the first record slot
+            # in the same write as the record
+            self.checkpoint()
+            self.head = 1
+        refs = struct.pack(f"<{len(numbers)}I", *numbers)
+        images = b"".join(tx[b] for b in numbers)
+        head = _RECORD.pack(_RECORD_MAGIC, seq, len(numbers), _checksum(seq, refs, images)) + refs
+        record = head.ljust(descriptor * self.block_size, b"\x00") + images
+        if restart:
+            disk_io.write_run(self.start, self._header(seq, 1) + record, charged=len(numbers))
+            self.header_valid = True
+        else:
+            disk_io.write_run(self.start + self.head, record, charged=len(numbers))
+        self.head += size
+        with self.queue_cond:
+            self.queue.append((seq, self.head, tx))
+            if 2 * self.head >= self.blocks:
+                self.queue_cond.notify()
+
+    # Checkpoint
+
+    @timed("journal", "checkpoint")
+    def checkpoint(self, restart_seq: Optional[int] = None) -> None:
+        """
+        Write every committed transaction home, then move the header's tail past them (to the
+        first record slot, numbered 'restart_seq', when the journal is about to restart).
+        """
+        with self.checkpoint_lock:
+            with self.queue_cond:
+                done = list(self.queue)
+            merged: Dict[int, bytes] = {}
+            for _, _, tx in done:
+                merged.update(tx)
+            for b in sorted(merged):
+                disk_io.write_home(b, merged[b])
+            if restart_seq is not None:
+                self._write_header(restart_seq, 1)
+            elif done:
+                last_seq, tail, _ = done[-1]
+                self._write_header(last_seq + 1, tail)
+            with self.queue_cond:
+                del self.queue[:len(done)]
+            self._retire(merged)
+            if done:
+                self.stats["checkpoints"] += 1
+                self.stats["blocks_checkpointed"] += len(merged)
+
+    def _header(self, seq: int, tail: int) -> bytes:
+        return _HEADER.pack(_HEADER_MAGIC, seq, tail).ljust(self.block_size, b"\x00")
+
+    def _write_header(self, seq: int, tail: int) -> None:
+        disk_io.write_home(self.start, self._header(seq, tail))
+        self.header_valid = True
+
+    def _retire(self, written: Dict[int, bytes]) -> None:
+        # Drop overlay entries that are home now, unless a newer transaction changed them again
+        overlay = disk_io._OVERLAY
+        with self.cond:
+            for b, image in written.items():
+                if overlay.get(b) is image:
+                    del overlay[b]
+
+    def _run(self) -> None:
+        last = time.monotonic()
+        while not self.stopping:
+            with self.queue_cond:
+                self.queue_cond.wait(COMMIT_INTERVAL)
+            now = time.monotonic()
+            with self.cond:
+                if self.running and self.active and now - self.opened > COMMIT_INTERVAL:
+                    self.locked = True
+            due = now - last >= CHECKPOINT_INTERVAL or 2 * self.head >= self.blocks
+            if self.queue and due and not self.stopping:
+                last = now
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    if self.stopping or self._detached():
+                        # The image went away underneath (crash or forced detach); replay takes over
+                        return
+                    if not isinstance(e, OSError):
+                        # Not an I/O hiccup: stop and let sync() / unmount report it
+                        self.failure = e
+                        return
+                    # Transient I/O failure: the transactions stay queued and the next round retries them
+                    self.stats["checkpoint_errors"] += 1
+
+    def _detached(self) -> bool:
+        return self.device.closed or disk_io._DEVICE is not self.device
+
+    def raise_failure(self) -> None:
+        if self.failure is not None:
+            raise RuntimeError("Journal checkpoint thread failed") from self.failure
+
+    def stop(self) -> None:
+        self.stopping = True
+        with self.queue_cond:
+            self.queue_cond.notify()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join()
+
+_ACTIVE: Optional[_Journal] = None
+
+def _read_record(device, sb, slot: int, seq: int) -> Optional[Tuple[int, List[Tuple[int, bytes]]]]:
+    """
+    The intact record numbered 'seq' at journal slot 'slot', as (next slot, [(block, image)]).
+    """
+    bs = sb.block_size_bytes
+    if not 1 <= slot < sb.journal_blocks:
+        return None
+    magic, rseq, count, crc = _RECORD.unpack_from(device.read_block(sb.journal_start_block + slot))
+    if magic != _RECORD_MAGIC or rseq != seq:
+        return None
+    descriptor, size = _record_blocks(count, bs)
+    if slot + size > sb.journal_blocks:
+        return None
+    raw = device.read_blocks(sb.journal_start_block + slot, size)
+    refs = raw[_RECORD.size:_RECORD.size + 4 * count]
+    images = raw[descriptor * bs:]
+    if _checksum(seq, refs, images) != crc:
+        return None
+    numbers = struct.unpack(f"<{count}I", refs)
+    journal = range(sb.journal_start_block, sb.journal_start_block + sb.journal_blocks)
+    if any(b >= sb.total_blocks or b in journal for b in numbers):
+        return None
+    return slot + size, [(b, images[i * bs:(i + 1) * bs]) for i, b in enumerate(numbers)]
+
+def _recover(device, sb) -> Tuple[int, int, bool]:
+    """
+    Replay committed records onto their home blocks. Returns (next sequence number, records
+    replayed, whether the journal had a header).
+    """
+    magic, seq, slot = _HEADER.unpack_from(device.read_block(sb.journal_start_block))
+    if magic != _HEADER_MAGIC:
+        return 1, 0, False
+    replayed = 0
+    while True:
+        record = _read_record(device, sb, slot, seq)
+        if record is None:
+            break
+        slot, images = record
+        for b, image in images:
+            device.write_block(b, image)
+        seq += 1
+        replayed += 1
+    return seq, replayed, True
+
+def _abandon() -> None:
+    # Drop a journal whose image went away without unmount(): what it committed is replayed
+    global _ACTIVE
+    journal, _ACTIVE = _ACTIVE, None
+    disk_io.set_journal(None)
+    disk_io._OVERLAY.clear()
+    if journal is not None:
+        journal.stop()
+
+@timed("journal", "recover")
+def attach(device, sb) -> int:
+    """
+    Replay what a crash left committed in the image's journal, then journal its metadata writes
+    until detach(). Called by mount() before the device is shared. Returns the records replayed.
+    """
+    global _ACTIVE
+    _abandon()
+    if not sb.journal_blocks:
+        return 0
+    seq, replayed, header_valid = _recover(device, sb)
+    if replayed:
+        # The records are home: start over behind them before anything new is logged
+        device.write_block(sb.journal_start_block,
+                           _HEADER.pack(_HEADER_MAGIC, seq, 1).ljust(sb.block_size_bytes, b"\x00"))
+    journal = _ACTIVE = _Journal(device, sb, seq, header_valid)
+    disk_io.set_journal(journal.stage)
+    journal.thread.start()
+    return replayed
+
+def detach() -> None:
+    """
+    Commit and checkpoint everything, leaving an empty journal, and stop journaling.
+    Raises RuntimeError afterwards if the checkpoint thread had died of an unexpected error.
+    """
+    journal = _ACTIVE
+    if journal is None:
+        return
+    with journal.cond:
+        journal.locked = True
+        while journal.active:
+            journal.cond.wait()
+    journal.enter(wait=False)
+    journal.leave()
+    journal.stop()
+    if journal.head != 1 or journal.queue:
+        journal.checkpoint(restart_seq=journal.seq)
+    _abandon()
+    journal.raise_failure()
+
+def sync() -> None:
+    """
+    Commit the running transaction (once the operations in it have finished) and write
+    everything committed home. Raises RuntimeError if the checkpoint thread died of an
+    unexpected error.
+    """
+    journal = _ACTIVE
+    if journal is None or _HANDLE.depth:
+        return
+    journal.raise_failure()
+    journal.enter(wait=True)
+    journal.leave()
+    journal.checkpoint()
+
+@contextmanager
+def transaction() -> Iterator[None]:
+    """
+    Run the enclosed metadata changes as one operation: they commit atomically, together with
+    those of any operation overlapping it, unless the transaction outgrows the journal.
+    Nested scopes join the outermost one.
+    """
+    journal = _ACTIVE
+    if journal is None or _HANDLE.depth:
+        _HANDLE.depth += 1
+        try:
+            yield
+        finally:
+            _HANDLE.depth -= 1
+        return
+    journal.enter(wait=True)
+    _HANDLE.depth = 1
+    try:
+        yield
+    finally:
+        _HANDLE.depth = 0
+        journal.leave()
+
+def journaled(fn):
+    """
+    Decorator: run the function as one journal operation (see transaction()).
+    Apply it to entry points that are called without holding any lock.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with transaction():
+            return fn(*args, **kwargs)
+    return wrapper
+
+def enabled() -> bool:
+    return _ACTIVE is not None
+
+def committed_seq() -> int:
+    """
+    Newest transaction durable in the journal (0 when nothing is journaled).
+    """
+    journal = _ACTIVE
+    return journal.committed if journal is not None else 0
+
+def journal_stats() -> Dict[str, int]:
+    """
+    Counters of the mounted image's journal; operations / transactions is the group-commit factor.
+    """
+    journal = _ACTIVE
+    if journal is None:
+        return {}
+    with journal.cond:
+        return {**journal.stats, "journal_blocks": journal.blocks, "pending_checkpoint": len(journal.queue)}
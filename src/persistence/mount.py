@@ -1,5 +1,8 @@
 from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
 from src.design.superblock_serialisation import from_bytes as superblock_from_bytes
+from src.persistence.disk_io import DiskIO, attach_device
+from src.common.metrics import timed
 
 @dataclass
 class FSContext:
@@ -14,11 +17,31 @@ class FSContext:
 
 _fs: FSContext | None = None
 
+# Shared mount state consumed by the engine layers (bitmap, inode table, directory, fileio).
+STATE: Dict[str, Any] = {"mounted": False, "superblock": None, "disk_path": None}
+
+# Callbacks that drop per-mount caches; run whenever the mounted image goes away.
+_UNMOUNT_HOOKS: List[Callable[[], None]] = []
+
+def register_unmount_hook(hook: Callable[[], None]) -> None:
+    if hook not in _UNMOUNT_HOOKS:
+        _UNMOUNT_HOOKS.append(hook)
+
+def _run_unmount_hooks() -> None:
+    # Last registered first: upper layers flush before the layers beneath them drop their caches
+    for hook in reversed(list(_UNMOUNT_HOOKS)):
+        hook()
+
+@timed("persistence", "mount")
 def mount(disk_path: str):
     global _fs
     if _fs is not None:
-        print("[INFO] Filesystem already mounted.")
-        return
+        if _fs.disk_path == disk_path:
+            print("[INFO] Filesystem already mounted.")
+            return
+        # Switching images: drop everything cached for the previous one first
+        from src.persistence.unmount import unmount
+        unmount()
 
     # Read superblock (block 0) assuming 512 for bootstrap, then trust superblock values
     with open(disk_path, "rb") as f:
@@ -35,9 +58,20 @@ def mount(disk_path: str):
         data_start_block=sb.data_start_block,
         root_inode_number=sb.root_inode_number,
     )
+
+    device = DiskIO(disk_path, sb.total_blocks, sb.block_size_bytes)
+    device.open()
+    from src.persistence import journal
+    if journal.attach(device, sb):
+        # Replayed metadata may include the superblock itself (counters, clean flags)
+        sb = superblock_from_bytes(device.read_block(0)[:512].ljust(512, b"\x00"))
+    attach_device(device)
+    STATE.update(mounted=True, superblock=sb, disk_path=disk_path, device=device)
+    from src.persistence.usage import load_counters
+    load_counters(sb)
     print(f"[INFO] Mounted disk: {sb.total_blocks} blocks, {sb.block_size_bytes} B/block")
 
 def get_fs() -> FSContext:
     if _fs is None:
         raise RuntimeError("Filesystem not mounted")
-    return _fs
\ No newline at end of file
+    return _fs
@@ -1,8 +1,27 @@
 import src.persistence.mount as mount_mod
+from src.persistence.disk_io import attach_device
+from src.persistence.usage import write_clean_superblock, reset_counters
+from src.persistence import journal
+from src.common.metrics import timed
 
+@timed("persistence", "unmount")
 def unmount():
     if mount_mod._fs is None:
         print("[INFO] Filesystem not mounted.")
         return
-    mount_mod._fs = None
-    print("[INFO] Filesystem unmounted.")
\ No newline at end of file
+    mount_mod._run_unmount_hooks()
+    # Everything is flushed: the free counters can be trusted by the next mount
+    write_clean_superblock()
+    reset_counters()
+    # Commit and write home whatever the journal still holds, leaving it empty; a checkpoint
+    # thread that died is reported only once the image is released
+    try:
+        journal.detach()
+    finally:
+        device = mount_mod.STATE.get("device")
+        attach_device(None)
+        if device is not None:
+            device.close()
+        mount_mod.STATE.update(mounted=False, superblock=None, disk_path=None, device=None)
+        mount_mod._fs = None
+    print("[INFO] Filesystem unmounted.")
@@ -0,0 +1,103 @@
+# src/persistence/usage.py
+# Free block / free inode counters for df, maintained incrementally by the allocators.
+#
+# The counters live in memory and are written into the superblock at unmount together with
+# 'clean' flags (one bit per counter). Mount trusts a counter only when its flag is set. The
+# flags are cleared on disk just before the first counter changes (not at mount, so read-only
+# sessions never write the superblock); after a crash the next mount finds them unset and the
+# owning layer recounts once (the bitmap from its bits, the inode table from its slots).
+#
+# A summary is written the same way, under its own clean bit. It holds the block and inode
+# next-fit hints and the directory block number, so a cleanly unmounted image mounts and
+# answers df without any scan. Each layer records its value in its unmount hook and reads it
+# back through summary() on first use after mount.
+
+import threading
+from dataclasses import replace
+from typing import Callable, Dict, Optional
+from src.common.metrics import timed
+from src.design.superblock_serialisation import to_bytes
+from src.persistence.mount import STATE
+from src.persistence.disk_io import write_metadata
+
+_FREE: Dict[str, Optional[int]] = {"blocks": None, "inodes": None}
+_SUMMARY: Dict[str, int] = {"block_hint": 0, "inode_hint": 0, "dir_block": 0}
+_CLEAN_BITS = {"blocks": 1, "inodes": 2, "summary": 4}
+_LOCK = threading.Lock()
+_STATE = {"clear_pending": False, "dirty": False}
+
+def load_counters(sb) -> None:
+    """
+    Adopt the counters the superblock marks clean. The image is marked in use lazily.
+    """
+    with _LOCK:
+        _FREE["blocks"] = sb.free_blocks if sb.clean & _CLEAN_BITS["blocks"] else None
+        _FREE["inodes"] = sb.free_inodes if sb.clean & _CLEAN_BITS["inodes"] else None
+        trusted = bool(sb.clean & _CLEAN_BITS["summary"])
+        _SUMMARY.update({key: getattr(sb, key) if trusted else 0 for key in _SUMMARY})
+        _STATE.update(clear_pending=bool(sb.clean), dirty=False)
+
+def reset_counters() -> None:
+    with _LOCK:
+        _FREE.update(blocks=None, inodes=None)
+        _SUMMARY.update(block_hint=0, inode_hint=0, dir_block=0)
+        _STATE.update(clear_pending=False, dirty=False)
+
+def adjust(kind: str, delta: int) -> None:
+    """
+    Apply an allocation (-n) or release (+n). Ignored while the counter is unknown.
+    """
+    with _LOCK:
+        if _STATE["clear_pending"]:
+            # First change since mount: the on-disk counters stop being trustworthy now
+            _STATE["clear_pending"] = False
+            _write_superblock(replace(STATE["superblock"], clean=0))
+        _STATE["dirty"] = True
+        if _FREE[kind] is not None:
+            _FREE[kind] += delta
+
+def summary(key: str) -> int:
+    """
+    Summary value adopted from a clean superblock or recorded since, 0 when unknown.
+    """
+    return _SUMMARY[key]
+
+def record_summary(key: str, value: int) -> None:
+    """
+    Note a summary value to be written at the next clean unmount.
+    """
+    _SUMMARY[key] = value
+
+def free_count(kind: str, recount: Callable[[], int]) -> int:
+    """
+    Current free count; 'recount' derives it from scratch the first time it is unknown.
+    """
+    with _LOCK:
+        value = _FREE[kind]
+    if value is None:
+        value = recount()
+        with _LOCK:
+            if _FREE[kind] is None:
+                _FREE[kind] = value
+                _STATE["dirty"] = True
+            value = _FREE[kind]
+    return value
+
+def write_clean_superblock() -> None:
+    """
+    Persist the known counters and flag them clean (unknown ones stay unflagged).
+    """
+    sb = STATE.get("superblock")
+    if sb is None or not _STATE["dirty"]:
+        return
+    with _LOCK:
+        known = {kind: value for kind, value in _FREE.items() if value is not None}
+    clean = sum(_CLEAN_BITS[kind] for kind in known) | _CLEAN_BITS["summary"]
+    _write_superblock(replace(sb, free_blocks=known.get("blocks", 0),
+                              free_inodes=known.get("inodes", 0), clean=clean, **_SUMMARY))
+
+@timed("persistence", "write_superblock")
+def _write_superblock(sb) -> None:
+    bs = sb.block_size_bytes
+    raw = to_bytes(sb)[:bs].ljust(bs, b"\x00")
+    write_metadata(0, raw, offset=0)
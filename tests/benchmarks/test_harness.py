@@ -0,0 +1,41 @@
+# tests/benchmarks/test_harness.py
+from benchmarks.harness import Case, percentile, latency_stats, summarize, compare
+
+def test_percentile_is_nearest_rank_in_microseconds():
+    samples = [i * 1000 for i in range(1, 101)]  # 1..100 us
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 99) == 99.0
+    assert percentile(samples, 100) == 100.0
+    assert percentile(samples, 0) == 1.0
+    assert percentile([7000], 99.9) == 7.0
+    assert percentile([], 50) == 0.0
+
+    stats = latency_stats([3000, 1000, 2000])
+    assert stats["n"] == 3
+    assert stats["p50_us"] == 2.0 and stats["max_us"] == 3.0
+    assert stats["ops_per_s"] == 3 / 6e-6
+
+def test_compare_matches_cases_and_flags_regressions():
+    small, large = Case(1, 512, 0.0), Case(4, 4096, 0.5)
+
+    def report(**ops_per_s):
+        results = []
+        for op, rate in ops_per_s.items():
+            for case in (small, large):
+                row = summarize(op, case, [1000])
+                row["ops_per_s"] = rate
+                results.append(row)
+        return {"results": results}
+
+    baseline = report(read=1000.0, write=1000.0, unlink=0.0)
+    current = report(read=850.0, write=700.0, unlink=50.0, mkdir=10.0)
+    rows = compare(current, baseline, threshold=0.2)
+
+    # Ops missing from the baseline, or with no baseline throughput, are not compared
+    assert [(r["op"], r["case"]["disk_mb"]) for r in rows] == [("read", 1), ("read", 4), ("write", 1), ("write", 4)]
+    assert [r["regressed"] for r in rows] == [False, False, True, True]
+    assert rows[0]["ratio"] == 0.85 and rows[2]["baseline_ops_per_s"] == 1000.0
+
+    # Cases are matched on every field, not just the op
+    baseline["results"][0]["case"]["fill"] = 0.9
+    assert [(r["op"], r["case"]["disk_mb"]) for r in compare(current, baseline, 0.2)][0] == ("read", 4)
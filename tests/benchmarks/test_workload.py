@@ -0,0 +1,32 @@
+# tests/benchmarks/test_workload.py
+import pytest
+from benchmarks.harness import mount_fresh
+from benchmarks.trace import TraceRecorder, load_trace, replay
+from benchmarks.workload import PROFILES, Context, run_profile, _unmount
+
+def fresh_image(path):
+    mount_fresh(str(path), total_blocks=4096, block_size=512, inode_count=64)
+
+@pytest.mark.parametrize("profile", sorted(PROFILES))
+def test_profile_runs_and_its_trace_replays(tmp_path, profile):
+    trace = tmp_path / "trace.jsonl"
+    fresh_image(tmp_path / "run.img")
+    try:
+        with TraceRecorder(str(trace)) as recorder:
+            ctx = Context(seed=1, max_files=16)
+            result = run_profile(profile, ctx, max_ops=40, max_seconds=30.0)
+    finally:
+        _unmount()
+    assert result["ops"] == 40 and result["errors"] == 0
+    assert sum(stats["n"] for stats in result["latency"].values()) == 40
+    assert result["fragmentation"]["files"] == len(set(ctx.files))
+    # The trace also holds the untimed setup calls (file creation, preallocation)
+    assert recorder.calls >= 40
+
+    fresh_image(tmp_path / "replay.img")
+    try:
+        replayed = replay(load_trace(str(trace)), seed=1)
+    finally:
+        _unmount()
+    assert replayed["ops"] == recorder.calls
+    assert replayed["errors"] == 0 and replayed["diverged"] == 0
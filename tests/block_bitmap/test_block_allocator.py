@@ -3,9 +3,26 @@
 
 import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from src.persistence.disk_initializer import initialize_disk
 from src.persistence.mount import mount, STATE
-from src.block_bitmap.block_allocator import allocate_block, free_block, is_allocated
+from src.block_bitmap.block_allocator import allocate_block, allocate_blocks, free_block, is_allocated
+import src.block_bitmap.bitmap as bitmap
+import src.inode_directory.inode_table as inode_table
+import src.inode_directory.resolver as resolver
+import src.persistence.mount as mount_mod
+
+def _simulate_crash():
+    """
+    Drop the mounted image without unmounting: the device is closed with nothing flushed and the
+    per-mount caches are forgotten, so the next mount() only sees what already reached the disk.
+    """
+    STATE["device"].close()
+    mount_mod._fs = None
+    STATE.update(mounted=False, superblock=None, device=None)
+    bitmap._BITMAP = None
+    inode_table._FREE_HINT = None
+    resolver._dir.discard()
 
 def test_allocate_and_free_block():
     with tempfile.TemporaryDirectory() as tmp:
@@ -23,4 +40,58 @@ def test_allocate_and_free_block():
         # Free one block
         free_block(b1)
         assert not is_allocated(b1)
-        assert is_allocated(b2)
\ No newline at end of file
+        assert is_allocated(b2)
+
+
+def test_concurrent_allocations_are_unique():
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_path = os.path.join(tmp, "disk.img")
+        initialize_disk(disk_path=disk_path, total_blocks=256, block_size_bytes=512, inode_count=32)
+        mount(disk_path)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            blocks = list(pool.map(lambda _: allocate_block(), range(64)))
+        assert len(set(blocks)) == len(blocks)
+        assert all(is_allocated(b) for b in blocks)
+
+def test_allocate_blocks_prefers_contiguous_runs():
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_path = os.path.join(tmp, "disk.img")
+        initialize_disk(disk_path=disk_path, total_blocks=256, block_size_bytes=512, inode_count=32)
+        mount(disk_path)
+
+        singles = [allocate_block() for _ in range(6)]
+        free_block(singles[1])
+        free_block(singles[3])
+        run = allocate_blocks(4)
+        assert run == list(range(run[0], run[0] + 4))
+        assert singles[1] not in run
+        # Goal hint extends right after an existing block when that run is free
+        assert allocate_blocks(2, goal=run[-1] + 1) == [run[-1] + 1, run[-1] + 2]
+
+def test_free_counters_persist_and_recount_after_crash():
+    from src.persistence.unmount import unmount
+    from src.block_bitmap.bitmap import free_block_count
+
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_path = os.path.join(tmp, "disk.img")
+        sb = initialize_disk(disk_path=disk_path, total_blocks=256, block_size_bytes=512, inode_count=32)
+        mount(disk_path)
+        start = free_block_count()
+        assert start == 256 - sb.data_start_block
+        blocks = allocate_blocks(5)
+        free_block(blocks[0])
+        assert free_block_count() == start - 4
+        unmount()
+
+        # Clean unmount: served from the superblock without loading the bitmap
+        mount(disk_path)
+        assert free_block_count() == start - 4
+        assert bitmap._BITMAP is None
+
+        # Mount cleared the clean flag on disk, so a crash now forces a recount from the bits
+        allocate_block()
+        _simulate_crash()
+        mount(disk_path)
+        assert free_block_count() == start - 5
+        unmount()
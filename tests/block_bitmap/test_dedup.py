@@ -0,0 +1,94 @@
+# tests/block_bitmap/test_dedup.py
+from src.persistence.disk_initializer import initialize_disk
+from src.persistence.mount import mount
+from src.block_bitmap.bitmap import mark_reserved_regions
+from src.file_api.create import create_file
+from src.fileio import open_file, close_file, write_file
+from src.inode_directory.resolver import resolve
+import src.inode_directory.inode_table as inode_table
+
+def setup_disk(tmp_path):
+    disk_path = tmp_path / "disk.img"
+    initialize_disk(str(disk_path), total_blocks=128, block_size_bytes=256, inode_count=16)
+    mount(str(disk_path))
+    mark_reserved_regions()
+    return disk_path
+
+def test_dedup_shares_identical_blocks(tmp_path):
+    from src.persistence.unmount import unmount
+    from src.file_api import write_file as write_whole, read_file as read_whole
+    from src.block_bitmap import dedup_report, block_refcount
+
+    disk_path = setup_disk(tmp_path)
+    page = bytes(256)
+    template = b"t" * 256
+    create_file("a")
+    write_whole("a", page * 3 + template + b"tail", dedup=True)
+    blocks_a = inode_table.get_inode(resolve("a")).direct_blocks
+    # Zero pages inside one write collapse onto the first one
+    assert blocks_a[0] == blocks_a[1] == blocks_a[2]
+    assert block_refcount(blocks_a[0]) == 3
+    report = dedup_report()
+    assert report["blocks_deduped"] == 2 and report["bytes_saved"] == 512
+
+    # The index survives a remount; an fd opened with dedup reuses blocks across files
+    unmount()
+    mount(str(disk_path))
+    create_file("b")
+    fd = open_file("b", "w", dedup=True)
+    write_file(fd, template + page)
+    close_file(fd)
+    blocks_b = [b for b in inode_table.get_inode(resolve("b")).direct_blocks if b is not None]
+    assert blocks_b == [blocks_a[3], blocks_a[0]]
+    assert dedup_report()["blocks_deduped"] == 2
+
+    # Overwriting a shared block copies it first, leaving the other file intact
+    fd = open_file("b", "rw")
+    write_file(fd, b"X")
+    close_file(fd)
+    assert read_whole("a") == page * 3 + template + b"tail"
+    assert read_whole("b") == b"X" + template[1:] + page
+
+def test_frees_on_an_image_without_dedup_leave_the_index_unbuilt(tmp_path, monkeypatch):
+    from src.persistence.unmount import unmount
+    from src.block_bitmap import dedup
+    from src.file_api import write_file as write_whole, delete_file
+
+    disk_path = setup_disk(tmp_path)
+    create_file("plain")
+    write_whole("plain", b"p" * 1000)
+    delete_file("plain")
+    assert dedup._TABLE is None
+
+    # Once an index exists, a free loads it with one read of the whole table
+    create_file("d")
+    write_whole("d", b"d" * 512, dedup=True)
+    unmount()
+    mount(str(disk_path))
+    reads = []
+    monkeypatch.setattr(dedup, "read_blocks", lambda b, n: reads.append(n) or inode_table.read_blocks(b, n))
+    delete_file("d")
+    assert reads == [dedup._table_blocks()]
+    assert dedup.dedup_report()["indexed_blocks"] == 0
+
+def test_dedup_never_shares_a_block_the_same_write_overwrites_later(tmp_path):
+    from src.file_api import write_file as write_whole, read_file as read_whole
+
+    setup_disk(tmp_path)
+    z, x, y = b"Z" * 256, b"X" * 256, b"Y" * 256
+    # The new first block matches the old second one, which the same rewrite then replaces
+    create_file("whole")
+    write_whole("whole", z + x, dedup=True)
+    write_whole("whole", x + y, dedup=True)
+    assert read_whole("whole") == x + y
+
+    # Same through an fd, with content no other file holds
+    p, q, r = b"P" * 256, b"Q" * 256, b"R" * 256
+    create_file("ranged")
+    fd = open_file("ranged", "w", dedup=True)
+    write_file(fd, p + q)
+    close_file(fd)
+    fd = open_file("ranged", "rw", dedup=True)
+    write_file(fd, q + r)
+    close_file(fd)
+    assert read_whole("ranged") == q + r
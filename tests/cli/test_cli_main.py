@@ -0,0 +1,87 @@
+# tests/cli/test_cli_main.py
+import io
+from src.persistence.disk_initializer import initialize_disk
+from src.cli.cli_main import run_script
+
+SCRIPT = [
+    "# set up a file",
+    "",
+    "touch a",
+    "echo hello there > a",
+    "   ",
+    "cat a",
+    "bogus",
+    "exit",
+    "touch never",
+]
+
+def make_disk(tmp_path):
+    disk_path = tmp_path / "disk.img"
+    initialize_disk(str(disk_path), total_blocks=1024, block_size_bytes=512, inode_count=32)
+    return str(disk_path)
+
+def test_run_script_buffers_output_and_stops_at_exit(tmp_path, capsys):
+    disk_path = make_disk(tmp_path)
+    capsys.readouterr()
+    out = io.StringIO()
+    stats = run_script(SCRIPT, disk_path=disk_path, out=out)
+
+    # Comments and blank lines are skipped, 'exit' ends the script; unknown commands still count
+    assert stats["commands"] == 4
+    assert capsys.readouterr().out == ""
+    lines = out.getvalue().splitlines()
+    assert "hello there" in lines
+    assert "[ERROR] Unknown command: bogus" in lines
+    assert lines[-1].startswith("[SCRIPT] 4 commands in ") and lines[-1].endswith(" ops/s)")
+
+    out = io.StringIO()
+    run_script(["ls"], disk_path=disk_path, out=out)
+    assert "a" in out.getvalue().splitlines()
+
+def test_run_script_commit_at_end_writes_metadata_back_once(tmp_path, monkeypatch):
+    import src.block_bitmap.bitmap as bitmap
+
+    commands = [f"echo file {i} > f{i}" for i in range(6)]
+    saves = {}
+    for commit_at_end in (False, True):
+        (tmp_path / str(commit_at_end)).mkdir()
+        disk_path = make_disk(tmp_path / str(commit_at_end))
+        calls = []
+        real = bitmap._write_bitmap
+        monkeypatch.setattr(bitmap, "_write_bitmap", lambda snap: calls.append(1) or real(snap))
+        run_script(commands, disk_path=disk_path, commit_at_end=commit_at_end, out=io.StringIO())
+        monkeypatch.undo()
+        saves[commit_at_end] = len(calls)
+
+        out = io.StringIO()
+        run_script(["cat f5", "ls"], disk_path=disk_path, out=out)
+        lines = out.getvalue().splitlines()
+        assert "file 5" in lines and "f0" in lines
+    assert saves[True] == 1 and saves[False] >= 6
+
+def test_importing_cli_defers_engine_modules():
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    probe = ("import sys, src.cli; "
+             "print(sorted(m for m in ('src.file_api', 'src.persistence.journal') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", probe], cwd=Path(__file__).resolve().parents[2],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+def test_time_startup_reports_each_phase(tmp_path, capsys):
+    import re
+    from src.cli.__main__ import main
+
+    disk_path = make_disk(tmp_path)
+    script = tmp_path / "script.txt"
+    script.write_text("touch a\nls\n", encoding="utf-8")
+    capsys.readouterr()
+    assert main(["-f", str(script), "--disk", disk_path, "--time-startup"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert "a" in lines
+    report = [line for line in lines if line.startswith("[STARTUP]")]
+    assert len(report) == 1
+    assert re.fullmatch(r"\[STARTUP\] imports [\d.]+ ms, mount [\d.]+ ms, first command [\d.]+ ms, "
+                        r"total [\d.]+ ms", report[0])
@@ -0,0 +1,138 @@
+# tests/cli/test_command_executor.py
+import json
+import os
+from src.persistence.disk_initializer import initialize_disk
+from src.persistence.mount import mount
+from src.cli.command_parser import parse_command
+from src.cli.command_executor import execute_command
+
+def setup_disk(tmp_path):
+    disk_path = tmp_path / "disk.img"
+    initialize_disk(str(disk_path), total_blocks=1024, block_size_bytes=512, inode_count=32)
+    mount(str(disk_path))
+    return disk_path
+
+def run(line: str) -> None:
+    execute_command(*parse_command(line))
+
+def test_echo_and_cat_span_several_blocks(tmp_path, capsys):
+    setup_disk(tmp_path)
+    text = "word " * 300
+    run(f"echo {text} > /notes")
+    capsys.readouterr()
+    run("cat notes")
+    assert capsys.readouterr().out == text.strip() + "\n"
+    run("cat missing")
+    assert "[ERROR] cat failed" in capsys.readouterr().out
+
+def test_put_and_get_round_trip_host_files(tmp_path, capsys):
+    setup_disk(tmp_path)
+    payload = os.urandom(5000)
+    (tmp_path / "in.bin").write_bytes(payload)
+    run(f"put {tmp_path / 'in.bin'} /blob")
+    run(f"get blob {tmp_path / 'out.bin'}")
+    out = capsys.readouterr().out
+    assert "[PUT] 5000 bytes" in out and "[GET] 5000 bytes" in out
+    assert (tmp_path / "out.bin").read_bytes() == payload
+    run("put only-one-arg")
+    assert "[ERROR] Usage: put" in capsys.readouterr().out
+
+def test_df_du_and_stat_report_allocation(tmp_path, capsys):
+    setup_disk(tmp_path)
+    run("echo hello > a")
+    run(f"put {__file__} b")
+    capsys.readouterr()
+
+    run("df")
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ["total", "used", "free"]
+    blocks = lines[2].split()
+    assert blocks[0] == "blocks" and int(blocks[1]) == 1024
+    assert int(blocks[2]) + int(blocks[3]) == 1024
+    assert lines[3].split()[:2] == ["inodes", "32"]
+
+    run("du a")
+    assert capsys.readouterr().out.split() == ["512", "a"]
+    run("du")
+    usage = [line.split() for line in capsys.readouterr().out.splitlines()]
+    assert usage[-1][1] == "total" and int(usage[-1][0]) == sum(int(n) for n, _ in usage[:-1])
+
+    run("stat a")
+    out = capsys.readouterr().out
+    assert "File: a" in out and "Size: 5  Blocks: 1  Indirect: no" in out
+    run("stat nope")
+    assert "[ERROR] stat failed: file not found" in capsys.readouterr().out
+
+    # Errors from the engine are reported, not raised out of the shell
+    from src.persistence.unmount import unmount
+    unmount()
+    capsys.readouterr()
+    run("stat a")
+    assert capsys.readouterr().out.startswith("[ERROR] stat failed: Disk not mounted")
+
+def test_fsck_frag_and_defrag(tmp_path, capsys):
+    from src.fileio import open_file, write_file, close_file
+    from src.block_bitmap.bitmap import mark_block_nums
+    from src.persistence.mount import STATE
+
+    setup_disk(tmp_path)
+    run("touch x")
+    run("touch y")
+    fds = [open_file(name, "a") for name in ("x", "y")]
+    for _ in range(4):
+        for fd in fds:
+            write_file(fd, b"z" * 512)
+    for fd in fds:
+        close_file(fd)
+    capsys.readouterr()
+
+    run("fsck")
+    assert capsys.readouterr().out.splitlines()[-1] == "[FSCK] clean"
+    leaked = STATE["superblock"].total_blocks - 1
+    mark_block_nums([leaked])
+    run("fsck")
+    out = capsys.readouterr().out
+    assert "leaked blocks:" in out and str(leaked) in out and "run 'fsck -y' to repair" in out
+    run("fsck -y")
+    assert capsys.readouterr().out.splitlines()[-1] == "[FSCK] repaired"
+
+    run("frag")
+    out = capsys.readouterr().out
+    assert "       4  x" in out and "[FRAG] 2 files, 2 fragmented" in out
+    run("defrag 4")
+    assert "[DEFRAG] 1 files, 4 blocks moved, 1 files left" in capsys.readouterr().out
+    run("defrag")
+    assert "[DEFRAG] 1 files, 4 blocks moved" in capsys.readouterr().out
+    run("frag x y")
+    assert "[FRAG] 2 files, 0 fragmented" in capsys.readouterr().out
+
+def test_journal_stats_and_trace_commands(tmp_path, capsys):
+    setup_disk(tmp_path)
+    run("stats reset")
+    run("trace start")
+    run("echo traced > t")
+    trace_path = tmp_path / "trace.json"
+    run(f"trace stop {trace_path}")
+    out = capsys.readouterr().out
+    assert "[INFO] Tracing started" in out and f"trace events written to {trace_path}" in out
+    names = {e["name"] for e in json.loads(trace_path.read_text())["traceEvents"]}
+    assert "file_api.write" in names
+    run("trace stop again.json")
+    assert "[ERROR] Tracing is not running" in capsys.readouterr().out
+
+    run("journal")
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].startswith("[JOURNAL] 32 blocks") and "commits" in out[0]
+    assert out[1].startswith("[JOURNAL]") and "checkpoints" in out[1]
+
+    run("stats")
+    rows = capsys.readouterr().out.splitlines()
+    assert rows[0].split()[:2] == ["layer/op", "calls"]
+    calls = {r.split()[0]: int(r.split()[1]) for r in rows[1:]}
+    # echo tries the write first and creates the file when it is missing
+    assert calls["file_api/write"] == 2 and calls["file_api/create"] == 1
+    run(f"stats dump {tmp_path / 'm.prom'}")
+    assert "(prometheus)" in capsys.readouterr().out
+    assert "fs_op_calls_total" in (tmp_path / "m.prom").read_text()
+    run("stats dump")
+    assert "[ERROR] Usage: stats dump" in capsys.readouterr().out
@@ -0,0 +1,67 @@
+# tests/common/test_metrics.py
+from src.persistence.disk_initializer import initialize_disk
+from src.persistence.mount import mount
+from src.block_bitmap.bitmap import mark_reserved_regions
+from src.file_api.create import create_file
+from src.fileio import open_file, close_file, read_file, write_file, seek_file
+
+def setup_disk(tmp_path):
+    disk_path = tmp_path / "disk.img"
+    initialize_disk(str(disk_path), total_blocks=128, block_size_bytes=256, inode_count=16)
+    mount(str(disk_path))
+    mark_reserved_regions()
+    return disk_path
+
+def test_metrics_charge_disk_io_to_the_calling_layer(tmp_path):
+    from src.common import metrics
+
+    setup_disk(tmp_path)
+    create_file("m")
+    metrics.reset()
+    fd = open_file("m", "w")
+    write_file(fd, b"x" * 256 * 3)
+    close_file(fd)
+
+    rows = {(r["layer"], r["op"]): r for r in metrics.snapshot()}
+    assert rows[("fileio", "write")]["calls"] == 1
+    # The three data blocks belong to the write, the bitmap update to bitmap/save
+    assert rows[("fileio", "write")]["blocks_written"] == 3
+    assert rows[("bitmap", "save")]["blocks_written"] >= 1
+    disk = sum(r["blocks_written"] for (layer, _), r in rows.items() if layer == "disk")
+    owned = sum(r["blocks_written"] for (layer, _), r in rows.items() if layer != "disk")
+    assert disk == owned
+
+    text = metrics.to_prometheus()
+    assert 'fs_op_calls_total{layer="fileio",op="write"} 1' in text
+    assert 'fs_op_latency_seconds_count{layer="fileio",op="write"} 1' in text
+    path = tmp_path / "metrics.json"
+    assert metrics.dump(str(path)) == "json"
+    assert '"layer": "fileio"' in path.read_text()
+
+def test_logical_bytes_set_against_block_writes(tmp_path):
+    from src.common import metrics
+    from src.file_api import write_file as write_whole
+    from benchmarks.amplification import amplification
+
+    setup_disk(tmp_path)
+    create_file("a")
+    metrics.reset()
+    write_whole("a", b"q" * 300)
+    fd = open_file("a", "rw")
+    write_file(fd, b"r")
+    seek_file(fd, 0)
+    read_file(fd, 10)
+    close_file(fd)
+
+    rows = {(r["layer"], r["op"]): r for r in metrics.snapshot()}
+    assert rows[("file_api", "write")]["logical_bytes_written"] == 300
+    assert rows[("fileio", "write")]["logical_bytes_written"] == 1
+    assert rows[("fileio", "read")]["logical_bytes_read"] == 10
+
+    report = amplification(metrics.snapshot(), 256)["write"]
+    assert report["logical_bytes_written"] == 301
+    disk = sum(r["blocks_written"] for r in metrics.snapshot() if r["layer"] == "disk")
+    assert report["physical_blocks_written"] == disk
+    assert report["breakdown"]["data"]["blocks"] >= 3
+    assert report["breakdown"]["inode"]["blocks"] >= 1
+    assert report["amplification"] > 1.0
@@ -0,0 +1,40 @@
+# tests/common/test_tracing.py
+from src.persistence.disk_initializer import initialize_disk
+from src.persistence.mount import mount
+from src.block_bitmap.bitmap import mark_reserved_regions
+from src.file_api.create import create_file
+
+def setup_disk(tmp_path):
+    disk_path = tmp_path / "disk.img"
+    initialize_disk(str(disk_path), total_blocks=128, block_size_bytes=256, inode_count=16)
+    mount(str(disk_path))
+    mark_reserved_regions()
+    return disk_path
+
+def test_tracing_records_nested_spans_with_block_numbers(tmp_path):
+    import json
+    from src.common import tracing
+    from src.file_api import write_file as write_whole
+
+    setup_disk(tmp_path)
+    create_file("t")
+    path = tmp_path / "trace.json"
+    with tracing.tracing(str(path)) as tracer:
+        write_whole("t", b"y" * 256 * 2)
+    assert tracing.active() is None
+
+    events = [e for e in json.loads(path.read_text())["traceEvents"] if e["ph"] == "X"]
+    outer = next(e for e in events if e["name"] == "file_api.write")
+    assert outer["args"]["target"] == "t"
+    assert len(outer["args"]["blocks_written"]) == 2
+    # Children sit inside the parent's time window and carry their own blocks
+    saves = [e for e in events if e["name"] == "bitmap.save"]
+    assert saves and all(outer["ts"] <= e["ts"] and e["ts"] + e["dur"] <= outer["ts"] + outer["dur"] + 1
+                         for e in saves)
+    assert all(e["args"]["blocks_written"] for e in saves)
+    disk_blocks = {e["args"]["block"] for e in events if e["cat"] == "disk"}
+    assert set(outer["args"]["blocks_written"]) <= disk_blocks
+
+    # Not installed: nothing is collected
+    write_whole("t", b"z")
+    assert len(tracer.events) == len(events)
@@ -0,0 +1,424 @@
+# tests/file_api/test_files.py
+import hashlib
+import os
+import pytest
+from src.persistence.disk_initializer import initialize_disk
+from src.persistence.mount import mount
+from src.block_bitmap.bitmap import mark_reserved_regions
+from src.file_api.create import create_file
+from src.fileio import open_file, close_file, write_file, seek_file
+from src.inode_directory.resolver import resolve
+import src.inode_directory.inode_table as inode_table
+
+def setup_disk(tmp_path):
+    disk_path = tmp_path / "disk.img"
+    initialize_disk(str(disk_path), total_blocks=128, block_size_bytes=256, inode_count=16)
+    mount(str(disk_path))
+    mark_reserved_regions()
+    return disk_path
+
+def test_clone_shares_blocks_and_copies_on_write(tmp_path):
+    from src.file_api import clone_file, read_file as read_whole, delete_file
+    from src.block_bitmap import block_refcount, is_allocated
+
+    setup_disk(tmp_path)
+    create_file("orig")
+    fd = open_file("orig", "w")
+    write_file(fd, b"A" * 256 + b"B" * 256 + b"C" * 10)
+    close_file(fd)
+
+    clone_file("orig", "copy")
+    src_blocks = inode_table.get_inode(resolve("orig")).direct_blocks[:3]
+    assert inode_table.get_inode(resolve("copy")).direct_blocks[:3] == src_blocks
+    assert all(block_refcount(b) == 2 for b in src_blocks)
+
+    # Partial write into the shared middle block copies it first
+    fd = open_file("copy", "rw")
+    seek_file(fd, 300)
+    write_file(fd, b"xyz")
+    close_file(fd)
+    copy_blocks = inode_table.get_inode(resolve("copy")).direct_blocks[:3]
+    assert copy_blocks[0] == src_blocks[0] and copy_blocks[2] == src_blocks[2]
+    assert copy_blocks[1] != src_blocks[1]
+    assert block_refcount(src_blocks[1]) == 1
+    assert read_whole("orig") == b"A" * 256 + b"B" * 256 + b"C" * 10
+    assert read_whole("copy") == b"A" * 256 + b"B" * 44 + b"xyz" + b"B" * 209 + b"C" * 10
+
+    # Deleting one side only drops references; the survivor keeps its data
+    delete_file("orig")
+    assert is_allocated(src_blocks[0]) and block_refcount(src_blocks[0]) == 1
+    assert not is_allocated(src_blocks[1])
+    assert read_whole("copy")[:256] == b"A" * 256
+
+def test_import_export_streams_through_small_chunks(tmp_path):
+    from src.file_api import import_file, export_file
+
+    setup_disk(tmp_path)
+    payload = os.urandom(40 * 256 + 17)
+    host_in = tmp_path / "in.bin"
+    host_in.write_bytes(payload)
+
+    stats = import_file(str(host_in), "blob", chunk_size=1000, queue_depth=2)
+    assert stats["bytes"] == len(payload) and stats["mb_per_s"] >= 0
+
+    host_out = tmp_path / "out.bin"
+    stats = export_file("blob", str(host_out), chunk_size=777, queue_depth=2)
+    assert stats["bytes"] == len(payload)
+    assert host_out.read_bytes() == payload
+
+    with pytest.raises(FileNotFoundError):
+        import_file(str(tmp_path / "missing.bin"), "other")
+
+def test_import_rejects_oversized_host_files_without_touching_the_target(tmp_path, monkeypatch):
+    from src.file_api import import_file, read_file as read_whole, write_file as write_whole, list_files
+    from src.file_api import transfer
+
+    setup_disk(tmp_path)
+    create_file("keep")
+    write_whole("keep", b"k" * 900)
+    host_in = tmp_path / "huge.bin"
+    host_in.write_bytes(os.urandom(200 * 1024))
+
+    # More than the free space: refused before the existing file is truncated
+    with pytest.raises(RuntimeError, match="Not enough free blocks"):
+        import_file(str(host_in), "keep")
+    assert read_whole("keep") == b"k" * 900
+    with pytest.raises(RuntimeError):
+        import_file(str(host_in), "new")
+    assert sorted(list_files()) == ["keep"]
+
+    monkeypatch.setattr(transfer, "max_file_blocks", lambda: 8)
+    with pytest.raises(ValueError, match="at most 2048 bytes"):
+        import_file(str(host_in), "keep")
+    assert read_whole("keep") == b"k" * 900
+
+    # A target created by a copy that fails part-way is removed again
+    monkeypatch.undo()
+    host_in.write_bytes(b"x" * 3000)
+    monkeypatch.setattr(transfer, "fd_write", lambda fd, chunk: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        import_file(str(host_in), "partial", chunk_size=1000)
+    assert sorted(list_files()) == ["keep"]
+
+def test_iter_file_yields_bounded_runs(tmp_path):
+    from src.file_api import iter_file, write_file as write_whole
+
+    setup_disk(tmp_path)
+    create_file("stream")
+    payload = bytes(range(256)) * 30 + b"tail"
+    write_whole("stream", payload)
+
+    chunks = list(iter_file("stream", chunk_size=1024))
+    assert b"".join(chunks) == payload
+    assert max(len(c) for c in chunks) <= 1024
+    assert [len(c) for c in iter_file("stream", chunk_size=100)][:3] == [100, 100, 56]
+
+    hashed = hashlib.sha256()
+    for chunk in iter_file("stream"):
+        hashed.update(chunk)
+    assert hashed.digest() == hashlib.sha256(payload).digest()
+
+def test_iter_file_releases_the_inode_lock_between_chunks(tmp_path):
+    import threading
+    from src.file_api import iter_file, write_file as write_whole, read_file as read_whole, set_compression
+
+    setup_disk(tmp_path)
+    create_file("c")
+    set_compression("c", "zlib")
+    text = b"line of text\n" * 400
+    write_whole("c", text)
+
+    # Writing the file being iterated, from inside the loop, must not deadlock
+    seen = []
+    def consume():
+        for chunk in iter_file("c", chunk_size=1024):
+            seen.append(chunk)
+            write_whole("c", text)
+    worker = threading.Thread(target=consume, daemon=True)
+    worker.start()
+    worker.join(10)
+    assert not worker.is_alive()
+    assert b"".join(seen) == text
+
+    # A generator parked after next() does not block writers in another thread
+    chunks = iter_file("c", chunk_size=1024)
+    next(chunks)
+    writer = threading.Thread(target=write_whole, args=("c", b"new"), daemon=True)
+    writer.start()
+    writer.join(10)
+    assert not writer.is_alive()
+    chunks.close()
+    assert read_whole("c") == b"new"
+
+def test_whole_file_rewrite_reuses_blocks_in_place(tmp_path, monkeypatch):
+    from src.file_api import write_file as write_whole, read_file as read_whole
+    import src.block_bitmap.bitmap as bitmap
+
+    setup_disk(tmp_path)
+    create_file("conf")
+    write_whole("conf", b"a" * 2000)
+    def block_map():
+        return [b for b in inode_table.get_inode(resolve("conf")).direct_blocks if b is not None]
+    before = block_map()
+
+    saves = []
+    monkeypatch.setattr(bitmap, "_write_bitmap", lambda snap: saves.append(snap))
+    write_whole("conf", b"b" * 2000)
+    assert saves == []
+    assert block_map() == before
+
+    # Growing allocates only the delta with one save; shrinking frees the tail with one save
+    write_whole("conf", b"c" * 2600)
+    assert len(saves) == 1
+    assert block_map()[:len(before)] == before
+    write_whole("conf", b"d" * 300)
+    assert len(saves) == 2
+    assert read_whole("conf") == b"d" * 300
+
+    writes = []
+    monkeypatch.setattr("src.file_api.files.write_block", lambda *a, **k: writes.append(a[0]))
+    write_whole("conf", b"d" * 300, skip_unchanged=True)
+    assert writes == []
+
+def test_create_many_flushes_metadata_once(tmp_path):
+    from collections import Counter
+    from src.persistence.mount import STATE
+    from src.persistence.unmount import unmount
+    from src.file_api import create_many, read_file as read_whole
+
+    disk_path = setup_disk(tmp_path)
+    device = STATE["device"]
+    writes = Counter()
+    real_write, real_write_at = device.write_block, device.write_at
+    device.write_block = lambda b, data: (writes.update([b]), real_write(b, data))
+    device.write_at = lambda b, data, offset=0: (writes.update([b]), real_write_at(b, data, offset))
+
+    items = [(f"f{i}", bytes([65 + i]) * 300) for i in range(8)]
+    inodes = create_many(items)
+    assert len(set(inodes)) == 8
+    # Every block (bitmap, inode table, directory, data) is written exactly once for the batch
+    assert writes and max(writes.values()) == 1
+
+    unmount()
+    mount(str(disk_path))
+    for name, data in items:
+        assert read_whole(name) == data
+
+def test_batch_defers_only_its_own_thread(tmp_path):
+    import threading
+    from src.common.deferral import deferring
+    from src.file_api import batch, fsck, list_files, write_file as write_whole, read_file as read_whole
+
+    setup_disk(tmp_path)
+    opened, checked = threading.Event(), threading.Event()
+    seen = {}
+
+    def batcher():
+        with batch():
+            create_file("in_batch")
+            opened.set()
+            checked.wait(5)
+
+    def other():
+        opened.wait(5)
+        try:
+            seen["deferring"] = deferring()
+            inum = create_file("outside")
+            write_whole("outside", b"o" * 600)
+            seen["deferred"] = sorted(inode_table._DEFERRED) == [resolve("in_batch")] and inum not in inode_table._DEFERRED
+            seen["fsck"] = fsck()["clean"]
+        finally:
+            checked.set()
+
+    threads = [threading.Thread(target=batcher), threading.Thread(target=other)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Only the batch's inode waited; fsck ran in the other thread and wrote it back early
+    assert seen == {"deferring": False, "deferred": True, "fsck": True}
+    assert sorted(list_files()) == ["in_batch", "outside"]
+    assert read_whole("outside") == b"o" * 600
+    assert inode_table._DEFERRED == {}
+
+def test_long_batch_does_not_stall_other_writers(tmp_path):
+    import threading
+    import time
+    from src.persistence import journal
+    from src.file_api import batch, list_files, write_file as write_whole, read_file as read_whole
+
+    setup_disk(tmp_path)
+    assert journal.enabled()
+    opened, finished = threading.Event(), threading.Event()
+    seen = {}
+
+    def batcher():
+        with batch():
+            create_file("in_batch")
+            opened.set()
+            # Stays open for many commit intervals unless the other writer gets through first
+            finished.wait(5)
+        seen["batch_closed"] = True
+
+    def other():
+        opened.wait(5)
+        for i in range(4):
+            create_file(f"w{i}")
+            write_whole(f"w{i}", b"w" * 300)
+            time.sleep(2 * journal.COMMIT_INTERVAL)
+        seen["done_inside_batch"] = "batch_closed" not in seen
+        finished.set()
+
+    threads = [threading.Thread(target=batcher), threading.Thread(target=other)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert seen == {"done_inside_batch": True, "batch_closed": True}
+    assert sorted(list_files()) == ["in_batch", "w0", "w1", "w2", "w3"]
+    assert read_whole("w3") == b"w" * 300
+
+def test_stat_many_reads_each_inode_block_once(tmp_path, monkeypatch):
+    from src.file_api import create_many, stat_many, get_file_metadata
+
+    setup_disk(tmp_path)
+    names = [f"s{i}" for i in range(6)]
+    create_many([(n, b"z" * (100 * (i + 1))) for i, n in enumerate(names)])
+
+    reads = []
+    monkeypatch.setattr(inode_table, "read_blocks", lambda b, n: reads.append((b, n)) or
+                        b"".join(inode_table.read_block(b + k) for k in range(n)))
+    stats = stat_many(names + ["missing"])
+    assert stats["missing"] == {"error": "file not found"}
+    for n in names:
+        assert stats[n] == get_file_metadata(n)
+    # 16 inodes x 128 B over 256 B blocks: one coalesced read covers every slot in use
+    assert len(reads) == 1
+
+def test_fsck_finds_and_repairs_allocation_and_namespace_damage(tmp_path):
+    from src.file_api import fsck, write_file as write_whole, clone_file, read_file as read_whole
+    from src.block_bitmap import bitmap, refcount
+    from src.inode_directory.resolver import add_entry, remove_entry, allocate_inode, get_inode
+
+    setup_disk(tmp_path)
+    create_file("a")
+    write_whole("a", b"a" * 256 * 3)
+    clone_file("a", "b")
+    create_file("c")
+    write_whole("c", b"c" * 256 * 14)  # spills into an indirect block
+    assert fsck()["clean"]
+
+    a_blocks = [b for b in get_inode(resolve("a")).direct_blocks if b is not None]
+    c_inum = resolve("c")
+    free = next(b for b in range(40, 128) if not bitmap.is_allocated(b))
+    bitmap.mark_block_nums([free])                  # leaked
+    bitmap.free_block_nums([a_blocks[0]])           # owned by a and b, but free
+    refcount.set_refcounts({a_blocks[1]: 1})        # shared by a and b, counted once
+    remove_entry("c")                               # orphan
+    ghost = allocate_inode().inode_number
+    add_entry("ghost", ghost)
+    inode_table.free_inode(ghost)                   # dangling entry
+
+    report = fsck()
+    assert not report["clean"]
+    assert report["leaked_blocks"] == [free]
+    assert report["unmarked_blocks"] == [a_blocks[0]]
+    assert sorted(report["double_allocated"][a_blocks[1]]) == [f"inode {resolve('a')}", f"inode {resolve('b')}"]
+    assert report["orphan_inodes"] == [c_inum]
+    assert report["dangling_entries"] == {"ghost": ghost}
+
+    report = fsck(repair=True)
+    assert report["unrepaired"] == []
+    assert fsck()["clean"]
+    assert read_whole(f"#{c_inum}") == b"c" * 256 * 14
+    assert resolve("ghost") is None
+    assert refcount.block_refcount(a_blocks[1]) == 2
+
+def test_defragment_makes_interleaved_files_contiguous_within_budget(tmp_path):
+    from src.file_api import fragmentation, defragment, fsck, read_file as read_whole, clone_file
+    from src.inode_directory.resolver import get_inode
+    from src.block_bitmap import block_refcount
+
+    setup_disk(tmp_path)
+    fds = {}
+    for name in ("x", "y", "z"):
+        create_file(name)
+        fds[name] = open_file(name, "rw")
+    # Appending to three files in turn interleaves their blocks
+    for i in range(6):
+        for name, fd in fds.items():
+            write_file(fd, name.encode() * 256)
+    for fd in fds.values():
+        close_file(fd)
+    clone_file("z", "z2")
+
+    report = fragmentation()
+    assert report["per_file"]["x"] == 6
+    assert report["histogram"][6] == 4
+
+    # Nothing fits in a budget smaller than every file, so nothing is copied past it
+    tight = defragment(budget_blocks=5)
+    assert tight["blocks_moved"] == 0 and tight["remaining"] == 0
+    assert set(tight["skipped"].values()) == {"larger than the budget"}
+
+    first = defragment(budget_blocks=6)
+    assert first["files_moved"] == 1 and first["blocks_moved"] == 6
+    assert first["remaining"] == 3
+
+    rest = defragment()
+    assert rest["files_moved"] == 1
+    assert rest["skipped"] == {"z": "shared with another file", "z2": "shared with another file"}
+    for name in ("x", "y"):
+        blocks = [b for b in get_inode(resolve(name)).direct_blocks if b is not None]
+        assert blocks == list(range(blocks[0], blocks[0] + 6))
+        assert read_whole(name) == name.encode() * 256 * 6
+    assert read_whole("z2") == b"z" * 256 * 6
+    assert fragmentation()["per_file"]["x"] == 1
+    assert fsck()["clean"]
+
+    # Blocks a file repeats itself (dedup) do not count as shared and move as one block
+    zero = bytes(256)
+    create_file("d")
+    create_file("e")
+    fd_d, fd_e = open_file("d", "a", dedup=True), open_file("e", "a")
+    for chunk in (zero, b"1" * 256, zero, b"2" * 256):
+        write_file(fd_d, chunk)
+        write_file(fd_e, b"e" * 256)
+    close_file(fd_d)
+    close_file(fd_e)
+    assert fragmentation(["d"])["per_file"]["d"] == 3
+    assert defragment(["d"]) == {"files_moved": 1, "blocks_moved": 3, "skipped": {}, "remaining": 0}
+    blocks = get_inode(resolve("d")).direct_blocks[:4]
+    assert blocks == [blocks[0], blocks[0] + 1, blocks[0], blocks[0] + 2]
+    assert block_refcount(blocks[0]) == 2
+    assert read_whole("d") == zero + b"1" * 256 + zero + b"2" * 256
+    assert fsck()["clean"]
+
+def test_defragment_moves_compressed_file_onto_freed_blocks(tmp_path):
+    from src.file_api import defragment, delete_file, set_compression, get_file_metadata, read_file as read_whole
+    from src.file_api import write_file as write_whole
+    from src.fileio import compression
+
+    setup_disk(tmp_path)
+    cluster = compression.cluster_bytes()
+    create_file("old")
+    set_compression("old", "zlib")
+    write_whole("old", b"o" * 2 * cluster)
+    old_blocks = [b for b in get_file_metadata("old")["direct_blocks"] if b is not None]
+    # Two compressed clusters of "c" with an unrelated block between them
+    create_file("c")
+    set_compression("c", "zlib")
+    write_whole("c", b"c" * cluster)
+    create_file("pad")
+    write_whole("pad", b"p" * 256)
+    fd = open_file("c", "rw")
+    seek_file(fd, cluster)
+    write_file(fd, b"d" * cluster)
+    close_file(fd)
+
+    # old's clusters are cached, then its blocks freed and taken over by c
+    assert read_whole("old") == b"o" * 2 * cluster
+    delete_file("old")
+    assert defragment(["c"])["blocks_moved"] == 2
+    assert [b for b in get_file_metadata("c")["direct_blocks"] if b is not None] == old_blocks
+    assert read_whole("c") == b"c" * cluster + b"d" * cluster
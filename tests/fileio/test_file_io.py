@@ -1,11 +1,13 @@
 # tests/fileio/test_file_io.py
-import os
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from src.persistence.disk_initializer import initialize_disk
 from src.persistence.mount import mount
 from src.block_bitmap.bitmap import mark_reserved_regions
 from src.file_api.create import create_file
-from src.fileio import open_file, close_file, read_file, write_file, seek_file
+from src.fileio import open_file, close_file, read_file, write_file, seek_file, sync_file, fallocate_file
+from src.inode_directory.resolver import resolve
+import src.inode_directory.inode_table as inode_table
 
 def setup_disk(tmp_path):
     disk_path = tmp_path / "disk.img"
@@ -74,4 +76,217 @@ def test_invalid_fd(tmp_path):
     with pytest.raises(ValueError):
         read_file(999, 10)
     with pytest.raises(ValueError):
-        close_file(999)
\ No newline at end of file
+        close_file(999)
+
+
+def test_concurrent_fds_and_writers(tmp_path):
+    setup_disk(tmp_path)
+    names = [f"t{i}" for i in range(4)]
+    for n in names:
+        create_file(n)
+
+    def worker(name):
+        fd = open_file(name, "a")
+        for i in range(8):
+            write_file(fd, name.encode() + bytes([i]))
+        close_file(fd)
+        return fd
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        fds = list(pool.map(worker, names))
+    assert len(set(fds)) == len(fds)
+
+    def reader(name):
+        fd = open_file(name, "r")
+        data = read_file(fd, 64)
+        close_file(fd)
+        return data
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(reader, names * 2))
+    for name, data in zip(names * 2, results):
+        assert data == b"".join(name.encode() + bytes([i]) for i in range(8))
+
+def test_fds_share_cached_inode_and_write_back_lazily(tmp_path, monkeypatch):
+    setup_disk(tmp_path)
+    create_file("delta")
+    inum = resolve("delta")
+    fd_w = open_file("delta", "a")
+    fd_r = open_file("delta", "r")
+
+    # Steady-state I/O through open fds must not touch the inode table
+    table_io = []
+    monkeypatch.setattr(inode_table, "read_block", lambda b: table_io.append(b))
+    monkeypatch.setattr(inode_table, "write_metadata", lambda *a, **k: table_io.append(a))
+    write_file(fd_w, b"abc" * 100)
+    assert read_file(fd_r, 300) == b"abc" * 100
+    assert seek_file(fd_r, 0, whence=2) == 300
+    assert table_io == []
+    monkeypatch.undo()
+
+    def on_disk_size():
+        inode_table._PINNED.pop(inum)  # peek past the cache
+        try:
+            return inode_table.get_inode(inum).file_size
+        finally:
+            inode_table._PINNED[inum] = pinned
+
+    pinned = inode_table._PINNED[inum]
+    assert on_disk_size() == 0
+    sync_file(fd_w)
+    assert on_disk_size() == 300
+
+    write_file(fd_w, b"!")
+    close_file(fd_w)
+    close_file(fd_r)
+    assert inum not in inode_table._PINNED
+    assert inode_table.get_inode(inum).file_size == 301
+
+def test_fallocate_reserves_contiguous_blocks(tmp_path):
+    setup_disk(tmp_path)
+    create_file("eps")
+    assert fallocate_file("eps", 20 * 256, keep_size=True) == 20
+    inode = inode_table.get_inode(resolve("eps"))
+    reserved = inode.direct_blocks[:20]
+    assert inode.file_size == 0
+    assert reserved == list(range(reserved[0], reserved[0] + 20))
+
+    # Writes fill the reserved blocks instead of allocating new ones
+    fd = open_file("eps", "rw")
+    payload = bytes(range(256)) * 20
+    write_file(fd, payload)
+    assert inode_table.get_inode(resolve("eps")).direct_blocks[:20] == reserved
+    close_file(fd)
+
+    # Block map spills past the direct pointers into the indirect table and survives reload
+    inode = inode_table.get_inode(resolve("eps"))
+    assert inode.indirect_block is not None
+    assert inode.direct_blocks[:20] == reserved
+    fd = open_file("eps", "r")
+    assert read_file(fd, len(payload)) == payload
+    close_file(fd)
+
+    fd = open_file("eps", "a")
+    assert fallocate_file(fd, 30 * 256) == 10
+    assert seek_file(fd, 0, whence=2) == 30 * 256
+    close_file(fd)
+
+def test_block_map_grows_into_double_indirect_tree(tmp_path):
+    from src.persistence.unmount import unmount
+    from src.block_bitmap.bitmap import free_block_count
+    from src.file_api import get_file_metadata, fsck, write_file as write_whole
+
+    disk_path = tmp_path / "big.img"
+    initialize_disk(str(disk_path), total_blocks=2048, block_size_bytes=512, inode_count=64)
+    mount(str(disk_path))
+    per_block = 512 // 4
+    assert inode_table.max_file_blocks() == 12 + per_block + per_block ** 2 + per_block ** 3
+
+    create_file("big")
+    create_file("sparse")
+    free = free_block_count()
+    # 300 blocks: 12 direct, 128 single indirect, 160 under a double-indirect root with two tables
+    assert fallocate_file("big", 300 * 512) == 300
+    inode = inode_table.get_inode(resolve("big"))
+    assert inode.indirect_block is not None and inode.double_indirect_block is not None
+    assert len(inode.direct_blocks) == 300
+    assert get_file_metadata("big")["allocated_blocks"] == 300 + 1 + 1 + 2
+    assert free - free_block_count() == 304
+
+    fd = open_file("big", "rw")
+    seek_file(fd, 299 * 512)
+    write_file(fd, b"end")
+    close_file(fd)
+    # Only a block deep in the double-indirect range: no single-indirect table at all
+    fd = open_file("sparse", "w")
+    seek_file(fd, 400 * 512)
+    write_file(fd, b"deep")
+    close_file(fd)
+
+    unmount()
+    mount(str(disk_path))
+    fd = open_file("big", "r")
+    seek_file(fd, 299 * 512)
+    assert read_file(fd, 3) == b"end"
+    close_file(fd)
+    sparse = inode_table.get_inode(resolve("sparse"))
+    assert sparse.indirect_block is None and sparse.double_indirect_block is not None
+    assert [i for i, b in enumerate(sparse.direct_blocks) if b is not None] == [400]
+    fd = open_file("sparse", "r")
+    seek_file(fd, 400 * 512)
+    assert read_file(fd, 4) == b"deep"
+    close_file(fd)
+    assert fsck()["clean"]
+
+    # Shrinking back under the direct pointers releases every pointer table
+    write_whole("big", b"small")
+    inode = inode_table.get_inode(resolve("big"))
+    assert inode.indirect_block is None and inode.double_indirect_block is None
+    assert get_file_metadata("big")["allocated_blocks"] == 1
+    assert fsck()["clean"]
+
+def test_compressed_file_roundtrip_and_partial_reads(tmp_path, monkeypatch):
+    from src.persistence.unmount import unmount
+    from src.fileio import compression
+    from src.file_api import write_file as write_whole, read_file as read_whole, set_compression, get_file_metadata
+
+    disk_path = setup_disk(tmp_path)
+    log = b"".join(b"2024-01-01 INFO request %05d served\n" % i for i in range(400))
+    create_file("log")
+    set_compression("log", "zlib")
+    write_whole("log", log)
+    meta = get_file_metadata("log")
+    assert meta["compression"] == "zlib"
+    used = [b for b in meta["direct_blocks"] if b is not None]
+    # Each 4-block cluster of text shrinks to a single block
+    assert len(used) == -(-len(log) // (4 * 256))
+
+    unmount()
+    mount(str(disk_path))
+    assert read_whole("log") == log
+
+    # Cold cache: a random read decompresses only the cluster it lands in
+    compression._reset_cache()
+    calls = []
+    compress, decompress = compression._CODECS["zlib"]
+    monkeypatch.setitem(compression._CODECS, "zlib",
+                        (compress, lambda b: calls.append(1) or decompress(b)))
+    fd = open_file("log", "rw")
+    seek_file(fd, 5000)
+    assert read_file(fd, 20) == log[5000:5020]
+    assert len(calls) == 1
+    assert read_file(fd, 20) == log[5020:5040]
+    assert len(calls) == 1
+    # Writes patch one cluster in place; the rest of the file is untouched
+    seek_file(fd, 5000)
+    write_file(fd, b"PATCHED")
+    close_file(fd)
+    expected = log[:5000] + b"PATCHED" + log[5007:]
+    assert read_whole("log") == expected
+
+    set_compression("log", None)
+    assert get_file_metadata("log")["compression"] is None
+    assert read_whole("log") == expected
+
+def test_freeing_blocks_drops_their_decompressed_clusters(tmp_path):
+    from src.fileio import compression
+    from src.file_api import (write_file as write_whole, read_file as read_whole, set_compression,
+                              get_file_metadata, delete_file, truncate_file)
+
+    setup_disk(tmp_path)
+    cluster = compression.cluster_bytes()
+    for name in ("gone", "cut", "kept"):
+        create_file(name)
+        set_compression(name, "zlib")
+        write_whole(name, name.encode() * cluster)
+        assert read_whole(name).startswith(name.encode())
+    blocks = {name: {b for b in get_file_metadata(name)["direct_blocks"] if b is not None}
+              for name in ("gone", "cut", "kept")}
+    cached = lambda name: [k for k in compression._CACHE if blocks[name] & set(k)]
+    assert cached("gone") and cached("cut") and cached("kept")
+
+    # Freed blocks may go to another file next: nothing cached under them may survive
+    delete_file("gone")
+    truncate_file("cut")
+    assert not cached("gone") and not cached("cut")
+    assert cached("kept")
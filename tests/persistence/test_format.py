@@ -0,0 +1,83 @@
+# tests/persistence/test_format.py
+# Formatting and the clean-unmount superblock summary.
+
+import os
+import tempfile
+from src.persistence.disk_initializer import initialize_disk
+from src.persistence.mount import mount, STATE
+import src.block_bitmap.bitmap as bitmap
+import src.inode_directory.inode_table as inode_table
+import src.inode_directory.resolver as resolver
+import src.persistence.mount as mount_mod
+from src.block_bitmap.block_allocator import allocate_block, is_allocated
+
+def _simulate_crash():
+    """
+    Drop the mounted image without unmounting: the device is closed with nothing flushed and the
+    per-mount caches are forgotten, so the next mount() only sees what already reached the disk.
+    """
+    STATE["device"].close()
+    mount_mod._fs = None
+    STATE.update(mounted=False, superblock=None, device=None)
+    bitmap._BITMAP = None
+    inode_table._FREE_HINT = None
+    resolver._dir.discard()
+
+def test_clean_unmount_summary_skips_scans_on_next_mount():
+    from src.persistence import usage
+    from src.persistence.unmount import unmount
+    from src.common import tracing
+    from src.file_api import create_file, write_file, list_files, fs_usage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_path = os.path.join(tmp, "disk.img")
+        sb = initialize_disk(disk_path=disk_path, total_blocks=256, block_size_bytes=512, inode_count=32)
+        mount(disk_path)
+        for name in ("a", "b", "c"):
+            create_file(name)
+            write_file(name, b"x" * 1024)
+        hint = bitmap._FREE_HINT
+        unmount()
+
+        mount(disk_path)
+        assert STATE["superblock"].block_hint == hint
+        assert STATE["superblock"].inode_hint == 4
+        dir_block = STATE["superblock"].dir_block
+        with tracing.tracing() as tracer:
+            assert fs_usage()["used_inodes"] == 4
+            assert sorted(list_files()) == ["a", "b", "c"]
+            assert allocate_block() == hint
+        reads = [e["args"]["block"] for e in tracer.events if e["name"].startswith("disk.read")]
+        # The directory block and the bitmap, but neither the pointer block nor the inode table
+        assert sb.bitmap_start_block - 1 not in reads
+        assert reads[0] == dir_block
+
+        # Crash: the summary was invalidated by the first change, so the next mount rediscovers it
+        _simulate_crash()
+        mount(disk_path)
+        assert usage.summary("dir_block") == 0
+        assert sorted(list_files()) == ["a", "b", "c"]
+        assert allocate_block() == hint + 1
+        unmount()
+
+def test_format_leaves_large_image_sparse_and_usable():
+    from src.persistence.unmount import unmount
+    from src.block_bitmap.bitmap import free_block_count
+
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_path = os.path.join(tmp, "disk.img")
+        # Reformatting must not keep anything of the previous image
+        with open(disk_path, "wb") as f:
+            f.write(b"\xee" * 65536)
+        total = 2 * 1024 * 1024  # 8 GiB of 4 KiB blocks
+        sb = initialize_disk(disk_path=disk_path, total_blocks=total, block_size_bytes=4096, inode_count=64)
+        st = os.stat(disk_path)
+        assert st.st_size == total * 4096
+        if hasattr(st, "st_blocks"):
+            assert st.st_blocks * 512 <= 64 * 1024
+
+        mount(disk_path)
+        assert free_block_count() == total - sb.data_start_block
+        assert allocate_block() == sb.data_start_block
+        assert not is_allocated(sb.data_start_block + 1)
+        unmount()
@@ -0,0 +1,153 @@
+# tests/persistence/test_journal.py
+# Metadata journal: group commit, crash replay and the checkpoint thread.
+
+import os
+import tempfile
+from src.persistence.disk_initializer import initialize_disk
+from src.persistence.mount import mount, STATE
+import src.block_bitmap.bitmap as bitmap
+import src.inode_directory.inode_table as inode_table
+import src.inode_directory.resolver as resolver
+import src.persistence.mount as mount_mod
+
+def _simulate_crash():
+    """
+    Drop the mounted image without unmounting: the device is closed with nothing flushed and the
+    per-mount caches are forgotten, so the next mount() only sees what already reached the disk.
+    """
+    STATE["device"].close()
+    mount_mod._fs = None
+    STATE.update(mounted=False, superblock=None, device=None)
+    bitmap._BITMAP = None
+    inode_table._FREE_HINT = None
+    resolver._dir.discard()
+
+def test_journal_groups_operations_and_replays_them_after_a_crash(monkeypatch):
+    import threading
+    from src.persistence import journal
+    from src.persistence.disk_io import DiskIO
+    from src.persistence.unmount import unmount
+    from src.file_api import create_file, write_file, read_file, list_files, fsck
+
+    # Nothing is checkpointed home unless the test asks for it
+    monkeypatch.setattr(journal, "CHECKPOINT_INTERVAL", 3600)
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_path = os.path.join(tmp, "disk.img")
+        sb = initialize_disk(disk_path=disk_path, total_blocks=4096, block_size_bytes=512, inode_count=32)
+        assert sb.journal_blocks == 128 and sb.data_start_block == sb.journal_start_block + 128
+        mount(disk_path)
+        create_file("a")
+        write_file("a", b"a" * 700)
+        journal.sync()
+        before = journal.journal_stats()
+
+        # An operation overlapping another joins its transaction: one commit for both
+        with journal.transaction():
+            create_file("b")
+            other = threading.Thread(target=lambda: (create_file("c"), write_file("c", b"c" * 900)))
+            other.start()
+            other.join()
+            assert journal.journal_stats()["transactions"] == before["transactions"]
+        stats = journal.journal_stats()
+        assert stats["transactions"] == before["transactions"] + 1
+        assert stats["operations"] == before["operations"] + 3
+
+        # Committed, not yet home: the directory block on disk still lacks the new names
+        dir_block = resolver._dir._dir_block_num()
+        with open(disk_path, "rb") as f:
+            f.seek(dir_block * 512)
+            assert b'"b"' not in f.read(512)
+
+        # A last transaction whose record is torn on its way to disk
+        head = journal._ACTIVE.head
+        create_file("d")
+        with open(disk_path, "r+b") as f:
+            f.seek((sb.journal_start_block + journal._ACTIVE.head - 1) * 512)
+            f.write(b"\x00" * 512)
+
+        _simulate_crash()
+        mount(disk_path)
+        assert journal._ACTIVE.head == 1 and head > 1
+        assert sorted(list_files()) == ["a", "b", "c"]
+        assert read_file("c") == b"c" * 900
+        assert fsck()["clean"]
+        unmount()
+
+        # A clean unmount leaves nothing to replay
+        device = DiskIO(disk_path, sb.total_blocks, sb.block_size_bytes)
+        device.open()
+        assert journal._recover(device, sb)[1] == 0
+        device.close()
+
+def test_checkpoint_thread_survives_a_failed_checkpoint(monkeypatch):
+    import time
+    from src.persistence import journal, disk_io
+    from src.persistence.unmount import unmount
+    from src.file_api import create_file, list_files
+
+    monkeypatch.setattr(journal, "CHECKPOINT_INTERVAL", 0.01)
+    real_write_home = disk_io.write_home
+    failures = []
+
+    def flaky_write_home(block, data):
+        if not failures:
+            failures.append(block)
+            raise OSError("transient write error")
+        real_write_home(block, data)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_path = os.path.join(tmp, "disk.img")
+        initialize_disk(disk_path=disk_path, total_blocks=1024, block_size_bytes=512, inode_count=32)
+        mount(disk_path)
+        monkeypatch.setattr(disk_io, "write_home", flaky_write_home)
+        create_file("a")
+        deadline = time.monotonic() + 5
+        while journal.journal_stats()["pending_checkpoint"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # The failed round is counted and the next one writes the transaction home
+        stats = journal.journal_stats()
+        assert failures and stats["checkpoint_errors"] == 1
+        assert stats["pending_checkpoint"] == 0 and stats["checkpoints"] >= 1
+        assert journal._ACTIVE.thread.is_alive()
+        monkeypatch.undo()
+        unmount()
+        mount(disk_path)
+        assert list_files() == ["a"]
+        unmount()
+
+def test_checkpoint_thread_reports_unexpected_errors(monkeypatch):
+    import pytest
+    from src.persistence import journal, disk_io
+    from src.persistence.unmount import unmount
+    from src.file_api import create_file, list_files
+
+    monkeypatch.setattr(journal, "CHECKPOINT_INTERVAL", 0.01)
+
+    def broken_write_home(block, data):
+        raise AttributeError("bug in the checkpoint path")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_path = os.path.join(tmp, "disk.img")
+        initialize_disk(disk_path=disk_path, total_blocks=1024, block_size_bytes=512, inode_count=32)
+        mount(disk_path)
+        active = journal._ACTIVE
+        monkeypatch.setattr(disk_io, "write_home", broken_write_home)
+        create_file("a")
+        active.thread.join(5)
+
+        # Not retried as if it were an I/O error: the thread stops and sync() surfaces it
+        assert not active.thread.is_alive()
+        assert journal.journal_stats()["checkpoint_errors"] == 0
+        with pytest.raises(RuntimeError) as failed:
+            journal.sync()
+        assert isinstance(failed.value.__cause__, AttributeError)
+        monkeypatch.undo()
+
+        # unmount() reports it too, but still releases the image; the journal replays on mount
+        with pytest.raises(RuntimeError):
+            unmount()
+        assert not STATE.get("mounted")
+        mount(disk_path)
+        assert list_files() == ["a"]
+        unmount()